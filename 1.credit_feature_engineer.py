@@ -3,6 +3,9 @@
 import pandas as pd
 import numpy as np
 
+from feature_store import customer_fingerprints
+from profiling import lap_timer
+
 class CreditFeatureEngineer:
     """
     A class to perform complex feature engineering on raw credit bureau data.
@@ -12,7 +15,7 @@ class CreditFeatureEngineer:
 
     def _fill_nulls(self, col):
         """A helper function to intelligently fill null values based on column type."""
-        if pd.api.types.is_categorical_dtype(col):
+        if isinstance(col.dtype, pd.CategoricalDtype):
             if 'NA' not in col.cat.categories:
                 col = col.cat.add_categories(['NA'])
             return col.fillna('NA')
@@ -23,116 +26,593 @@ class CreditFeatureEngineer:
         else:
             return col.fillna('Unknown')
 
-    def create_features(self, df: pd.DataFrame) -> pd.DataFrame:
+    # Compact dtypes used by create_features(low_memory=True). Inputs are converted on entry,
+    # derived columns as soon as they are final. Columns that the analyzer prints as numbers
+    # (latest DPD statuses, activity flags and their totals, risk scores, temp, and every
+    # utilisation column, which is rendered to two decimals of a percent) keep their dtypes
+    # so the rendered reports read the same.
+    INPUT_SCHEMA = {
+        **{col: 'category' for col in ['creditor_name', 'priority_3_x', 'priority_3_y', 'loan_type_x',
+                                       'loan_type_y', 'secured_unsecured_y', 'lender_type']},
+        **{f'pay_hist_{i}_{period}': 'float32' for period in ['x', 'y'] for i in range(1, 37)},
+    }
+    OUTPUT_SCHEMA = {
+        **{f'max_dpd_l{months}m_{suffix}' if months > 1 else f'max_dpd_cm_{suffix}': 'int16'
+           for months in [36, 24, 18, 12, 6, 3, 2, 1] for suffix in ['x', 'y', 'diff']},
+        'string_length_x': 'int16', 'string_length_y': 'int16',
+        'max_delinquency_detected': 'int16', 'min_delinquency_detected': 'int16',
+        'total_active_cc_accounts_x': 'int16', 'total_active_cc_accounts_y': 'int16',
+        'rn': 'int32', 'new_account_flag': 'int8',
+        'coalesced_priority': 'category', 'coalesced_loan_type': 'category', 'coalesced_open_date': 'category',
+    }
+
+    def _compact_inputs(self, df):
+        """low_memory mode: `df` with its INPUT_SCHEMA columns converted; the other columns are shared, not copied."""
+        dtypes = {col: dtype for col, dtype in self.INPUT_SCHEMA.items() if col in df.columns and df[col].dtype != dtype}
+        return df.astype(dtypes, copy=False)
+
+    def _compact_new_columns(self, new, compacted):
+        """
+        low_memory mode: null-fills every new column added since the last call and casts it to its
+        OUTPUT_SCHEMA dtype, so no column is held at full width (or filled twice) past this point.
+        """
+        for col, values in new.items():
+            if col not in compacted:
+                filled = self._fill_nulls(pd.Series(values))
+                dtype = self.OUTPUT_SCHEMA.get(col)
+                new[col] = self._column_values(filled if dtype is None else filled.astype(dtype))
+                compacted.add(col)
+
+    @staticmethod
+    def _column_values(values):
+        """Positional values of a new column: a NumPy array, or the Categorical of a category column."""
+        if isinstance(values, pd.Series):
+            return values.array if isinstance(values.dtype, pd.CategoricalDtype) else values.to_numpy()
+        return values
+
+    # Month-status codes in pay_status_history, as mapped by the Athena pay_hist split.
+    DPD_STATUS_CODES = {'XXX': -1, 'DBT': 180, 'LSS': 180, 'SUB': 90, 'SMA': 60, 'STD': 0, '   ': 0, '': 0}
+    DPD_WINDOWS = [36, 24, 18, 12, 6, 3, 2, 1]
+    # Marks "no pay history" (account absent in that snapshot); below every real DPD value.
+    _NO_HISTORY = np.iinfo(np.int16).min
+
+    def _parse_pay_status_history(self, history, months_since_reported=0):
+        """Parses one pay_status_history string into its 36 monthly DPD values (most recent first)."""
+        if history.startswith(','):
+            history = '0' + history
+        values = []
+        for token in history[:-1].split(','):
+            code = token.strip()
+            values.append(self.DPD_STATUS_CODES[code] if code in self.DPD_STATUS_CODES else int(token))
+        return ([-1] * int(months_since_reported) + values + [-1] * 36)[:36]
+
+    def _parse_pay_status_histories(self, histories, months_since_reported):
+        """
+        Parses a column of pay_status_history strings into an int16 (rows x 36) matrix.
+        Well-formed rows ('ddd,' repeated) are decoded in bulk as fixed-width bytes; anything
+        else goes through the per-string parser.
+        """
+        n = len(histories)
+        matrix = np.full((n, 36), self._NO_HISTORY, dtype=np.int16)
+        present = np.flatnonzero(pd.notna(histories))
+        if len(present) == 0:
+            return matrix
+
+        values = histories[present]
+        lengths = np.fromiter((len(v) for v in values), dtype=np.int64, count=len(values))
+        ascii_only = np.fromiter((v.isascii() for v in values), dtype=bool, count=len(values))
+        raw = np.array(np.where(ascii_only, values, ''), dtype='S144').view(np.uint8).reshape(len(values), 36, 4)
+        n_months = lengths // 4
+        in_history = np.arange(36)[None, :] < n_months[:, None]
+
+        digits = raw[:, :, :3].astype(np.int16) - ord('0')
+        is_number = ((digits >= 0) & (digits <= 9)).all(axis=2)
+        decoded = np.where(is_number, digits[:, :, 0] * 100 + digits[:, :, 1] * 10 + digits[:, :, 2], -1).astype(np.int16)
+        known = is_number.copy()
+        codes = raw[:, :, :3].copy().view('S3').reshape(len(values), 36)
+        for code, value in self.DPD_STATUS_CODES.items():
+            if len(code) == 3:
+                hit = codes == code.encode()
+                decoded[hit] = value
+                known |= hit
+        fast = ascii_only & (lengths % 4 == 0) & (lengths <= 144) & np.all(~in_history | (known & (raw[:, :, 3] == ord(','))), axis=1)
+        parsed = np.where(in_history, decoded, -1).astype(np.int16)
+
+        # Rows reported before the pull date are shifted right by the gap, padded with -1.
+        shift = np.zeros(len(values), dtype=np.int64) if months_since_reported is None else \
+            np.nan_to_num(np.asarray(months_since_reported, dtype=np.float64)[present]).astype(np.int64)
+        source = np.arange(36)[None, :] - shift[:, None]
+        parsed = np.where(source >= 0, np.take_along_axis(parsed, np.clip(source, 0, 35), axis=1), -1).astype(np.int16)
+
+        for i in np.flatnonzero(~fast):
+            parsed[i] = self._parse_pay_status_history(values[i], shift[i])
+        matrix[present] = parsed
+        return matrix
+
+    def _pay_history_matrix(self, final_result, period):
+        """
+        Monthly DPD history for one period as an int16 (rows x months) matrix, month 1 first.
+        Uses the pay_hist_{i}_{period} columns when they exist, otherwise parses
+        pay_status_history_{period} directly. Returns None if neither is available.
+        """
+        columns = []
+        for i in range(1, 37):
+            if f'pay_hist_{i}_{period}' not in final_result.columns:
+                break
+            columns.append(f'pay_hist_{i}_{period}')
+        if columns:
+            values = final_result[columns].to_numpy(dtype=np.float64)
+            return np.where(np.isnan(values), self._NO_HISTORY, values).astype(np.int16)
+        if f'pay_status_history_{period}' in final_result.columns:
+            months_since_reported = final_result.get(f'diff_rep_pull_{period}')
+            return self._parse_pay_status_histories(
+                final_result[f'pay_status_history_{period}'].to_numpy(dtype=object),
+                None if months_since_reported is None else months_since_reported.to_numpy())
+        return None
+
+    def _max_dpd_windows(self, dpd, period):
+        """max_dpd_l{n}m_{period} for every window, from one running max along the month axis."""
+        running_max = np.maximum.accumulate(dpd, axis=1)
+        running_max = np.where(running_max == self._NO_HISTORY, 0, running_max).astype(np.float64)
+        windows = {}
+        for months in self.DPD_WINDOWS:
+            if months <= dpd.shape[1]:
+                col_name = f"max_dpd_l{months}m_{period}" if months > 1 else f"max_dpd_cm_{period}"
+                windows[col_name] = running_max[:, months - 1]
+        return windows
+
+    def _customer_aggregates(self, final_result, periods=('x', 'y')):
+        """
+        Computes every customer-level total, max and count used by create_features in one grouped
+        pass: customer_no is factorized once, the masked per-row values are aggregated together and
+        each result is broadcast back to the customer's rows by group code. Returns a dict of
+        Series on final_result's index (plus the row-level lim_disbursed/active_balance it needs).
+        The masked totals are NaN for customers with no rows in the mask; _fill_totals fills them.
+        """
+        codes, customers = pd.factorize(final_result['customer_no'])
+        n_customers = len(customers)
+        unassigned = codes < 0
+
+        columns, sum_cols, max_cols, masks = {}, [], [], {}
+        result = {}
+        for period in periods:
+            active = (final_result[f'Activity_Flag_{period}'] == 1).to_numpy()
+            active_cc = active & (final_result[f'priority_3_{period}'] == '01.0 CC').to_numpy()
+            lim = np.nanmax(final_result[[f'high_balance_{period}', f'credit_limit_{period}']].values, axis=1)
+            balance = np.where(active, final_result[f'current_balance_{period}'], 0)
+            result[f'lim_disbursed_{period}'] = lim
+            result[f'active_balance_{period}'] = balance
+
+            for name, mask, values in [
+                (f'total_lim_disbursed_{period}', active, lim), (f'total_active_balance_{period}', active, balance),
+                (f'total_cc_lim_disbursed_{period}', active_cc, lim), (f'total_cc_active_balance_{period}', active_cc, balance),
+            ]:
+                columns[name] = np.where(mask, values, np.nan)
+                masks[name] = mask
+                sum_cols.append(name)
+            columns[f'total_active_accounts_{period}'] = final_result[f'Activity_Flag_{period}'].to_numpy()
+            columns[f'total_active_cc_accounts_{period}'] = active_cc
+            sum_cols += [f'total_active_accounts_{period}', f'total_active_cc_accounts_{period}']
+            columns[f'risk_score_{period}'] = final_result[f'risk_score_{period}'].to_numpy()
+            max_cols.append(f'risk_score_{period}')
+
+        grouped = pd.DataFrame(columns).groupby(codes, sort=True)
+        per_customer = pd.concat([grouped[sum_cols].sum(), grouped[max_cols].max()], axis=1).reindex(np.arange(n_customers))
+
+        for name in sum_cols + max_cols:
+            values = per_customer[name].to_numpy()
+            if name in masks:
+                # A masked total exists only for customers with at least one row in the mask.
+                has_rows = np.bincount(codes[~unassigned], weights=masks[name][~unassigned], minlength=n_customers) > 0
+                values = np.where(has_rows, values, np.nan)
+            broadcast = values[codes]
+            if unassigned.any():
+                broadcast = broadcast.astype(np.float64)
+                broadcast[unassigned] = np.nan
+            result[name] = pd.Series(broadcast, index=final_result.index)
+        return result
+
+    def _period_features(self, final_result, periods):
+        """
+        Every feature that reads a single snapshot's columns, for each of `periods`, as Series on
+        final_result's index: the per-account DPD windows, history length, limit, active balance
+        and utilisation, and the customer-level totals, utilisations, risk score and counts.
+        """
+        features = {}
+        for period in periods:
+            dpd = self._pay_history_matrix(final_result, period)
+            if dpd is not None:
+                features.update(self._max_dpd_windows(dpd, period))
+            features[f'string_length_{period}'] = final_result[f'pay_status_history_{period}'].str.len().fillna(0)
+
+        customer = self._customer_aggregates(final_result, periods)
+        for period in periods:
+            features[f'lim_disbursed_{period}'] = customer[f'lim_disbursed_{period}']
+            features[f'active_balance_{period}'] = customer[f'active_balance_{period}']
+            features[f'utilisation_{period}'] = (final_result[f'current_balance_{period}'] / pd.Series(customer[f'lim_disbursed_{period}'], index=final_result.index)).replace([np.inf, -np.inf], np.nan).fillna(0)
+
+            # Totals over the customer's active (and active CC) accounts, on every row of the
+            # customer; NaN for customers with no such accounts until _fill_totals.
+            for name in self.MASKED_TOTALS + ['risk_score', 'total_active_accounts', 'total_active_cc_accounts']:
+                features[f'{name}_{period}'] = customer[f'{name}_{period}']
+        return {name: pd.Series(values, index=final_result.index) for name, values in features.items()}
+
+    # Customer totals over the active (and active CC) accounts only.
+    MASKED_TOTALS = ['total_lim_disbursed', 'total_active_balance', 'total_cc_lim_disbursed', 'total_cc_active_balance']
+
+    def _fill_totals(self, final_result, features, periods, within_customer=False):
+        """
+        The MASKED_TOTALS of `periods` on every row, from the per-customer totals in `features`.
+        By default they are filled as the original groupby('customer_no').ffill().bfill(): the
+        total sits on the masked rows, is carried forward within the customer, and whatever is
+        still empty takes the next filled row below it, whichever customer that row is. A
+        customer with no active (or no active CC) accounts therefore gets the next customer's
+        totals. With within_customer=True that customer's totals stay NaN (0 after the cleanup).
+        """
+        codes, _ = pd.factorize(final_result['customer_no'])
+        groups = np.where(codes < 0, np.nan, codes)
+        filled = {}
+        for period in periods:
+            active = (final_result[f'Activity_Flag_{period}'] == 1).to_numpy()
+            active_cc = active & (final_result[f'priority_3_{period}'] == '01.0 CC').to_numpy()
+            for name in self.MASKED_TOTALS:
+                values = np.asarray(features[f'{name}_{period}'], dtype=np.float64)
+                if not within_customer:
+                    on_rows = pd.Series(np.where(active_cc if '_cc_' in name else active, values, np.nan))
+                    values = on_rows.groupby(groups).ffill().bfill().to_numpy()
+                filled[f'{name}_{period}'] = values
+        return filled
+
+    def _overall_utilisations(self, final_result, totals, periods):
+        """overall_utilisation and overall_cc_utilisation of `periods` from the filled totals."""
+        features = {}
+        for period in periods:
+            features[f'overall_utilisation_{period}'] = (pd.Series(totals[f'total_active_balance_{period}']) / totals[f'total_lim_disbursed_{period}']).replace([np.inf, -np.inf], np.nan).fillna(0).to_numpy()
+
+            # CC utilisation is broadcast to all of the customer's rows (its max); 0 for customers with no CCs.
+            cc_utilisation = (pd.Series(totals[f'total_cc_active_balance_{period}']) / totals[f'total_cc_lim_disbursed_{period}']).replace([np.inf, -np.inf], np.nan)
+            features[f'overall_cc_utilisation_{period}'] = cc_utilisation.groupby(final_result['customer_no'].to_numpy()).transform('max').fillna(0).to_numpy()
+        return features
+
+    def customer_totals(self, df: pd.DataFrame, fill_totals_within_customer: bool = False) -> pd.DataFrame:
+        """
+        The filled MASKED_TOTALS of both periods, one row per row of `df` in its row order. By
+        default a customer with no active accounts takes the next customer's totals (see
+        _fill_totals), so the values depend on the whole frame: code that splits a batch computes
+        them once on the full batch and passes each slice's rows of it to create_features.
+        """
+        columns = ['customer_no'] + [f'{col}_{period}' for period in ['x', 'y'] for col in
+                                     ['Activity_Flag', 'priority_3', 'high_balance', 'credit_limit', 'current_balance', 'risk_score']]
+        final_result = df[columns].reset_index(drop=True)
+        for period in ['x', 'y']:
+            for col in [f'current_balance_{period}', f'high_balance_{period}', f'credit_limit_{period}']:
+                final_result[col] = pd.to_numeric(final_result[col], errors='coerce')
+        customer = self._customer_aggregates(final_result)
+        return pd.DataFrame(self._fill_totals(final_result, customer, ['x', 'y'], fill_totals_within_customer), index=df.index)
+
+    # Snapshot features kept in a FeatureStore, without the period suffix. Row features are per
+    # account; customer features are the same on every row of a customer.
+    SNAPSHOT_ROW_FEATURES = [f"max_dpd_l{months}m" if months > 1 else "max_dpd_cm" for months in DPD_WINDOWS] + \
+        ['string_length', 'lim_disbursed', 'active_balance', 'utilisation']
+    # The masked totals are stored unfilled: the back-fill reads the neighbouring customers, so
+    # it and the overall utilisations are applied to the assembled frame on every run.
+    SNAPSHOT_CUSTOMER_FEATURES = ['total_lim_disbursed', 'total_active_balance', 'total_cc_lim_disbursed', 'total_cc_active_balance',
+                                  'risk_score', 'total_active_accounts', 'total_active_cc_accounts']
+    # Columns a snapshot's features are computed from; a stored snapshot is reused only while
+    # their fingerprint is unchanged. Rows without an account_number for the period carry no
+    # data for that snapshot and are left out.
+    SNAPSHOT_SOURCE_COLUMNS = ['account_number', 'pay_status_history', 'diff_rep_pull', 'current_balance', 'high_balance',
+                               'credit_limit', 'Activity_Flag', 'priority_3', 'risk_score']
+    # Features that come out integer when these source columns are (and the feature has no nulls).
+    _INTEGER_SOURCES = {'lim_disbursed': ['high_balance', 'credit_limit'], 'active_balance': ['current_balance'],
+                        'risk_score': ['risk_score'], 'total_active_accounts': ['Activity_Flag'], 'total_active_cc_accounts': []}
+
+    def _snapshot_keys(self, final_result, period, codes, customers):
+        """
+        Per customer: the snapshot's creation_date (YYYY-MM-DD), the fingerprint of the customer's
+        source rows and whether the snapshot can be stored (it has a date and unique account keys).
+        Also returns the mask of rows that have data for the snapshot.
+        """
+        present = final_result[f'account_number_{period}'].notna().to_numpy() & (codes >= 0)
+        dates = final_result.loc[present, f'creation_date_{period}'].groupby(codes[present]).first()
+        dates = pd.to_datetime(dates).dt.strftime('%Y-%m-%d').reindex(np.arange(len(customers)))
+
+        source = ['creditor_name'] + [f'{col}_{period}' for col in self.SNAPSHOT_SOURCE_COLUMNS if f'{col}_{period}' in final_result.columns]
+        source += [f'pay_hist_{i}_{period}' for i in range(1, 37) if f'pay_hist_{i}_{period}' in final_result.columns]
+        fingerprints = customer_fingerprints(codes[present], len(customers), final_result.loc[present, source])
+
+        accounts = final_result.loc[present, ['creditor_name', f'account_number_{period}']].assign(code=codes[present])
+        duplicated = np.bincount(codes[present][accounts.duplicated(keep=False).to_numpy()], minlength=len(customers)) > 0
+        keys = pd.DataFrame({'customer_no': customers, 'creation_date': dates.to_numpy(), 'fingerprint': fingerprints})
+        return keys, keys['creation_date'].notna().to_numpy() & ~duplicated, present
+
+    def _snapshot_tables(self, final_result, features, period, keys, codes, present, customer_mask):
+        """The FeatureStore (customers, accounts) tables of one period for the customers in customer_mask."""
+        assigned = np.flatnonzero(codes >= 0)
+        first_row = assigned[np.unique(codes[assigned], return_index=True)[1]]
+        customers = keys[customer_mask].reset_index(drop=True)
+        for name in self.SNAPSHOT_CUSTOMER_FEATURES:
+            customers[name] = features[f'{name}_{period}'].to_numpy()[first_row[customer_mask]]
+
+        rows = present & customer_mask[np.maximum(codes, 0)]
+        accounts = pd.DataFrame({
+            'customer_no': keys['customer_no'].to_numpy()[codes[rows]],
+            'creation_date': keys['creation_date'].to_numpy()[codes[rows]],
+            'creditor_name': final_result['creditor_name'].to_numpy(dtype=object)[rows],
+            'account_number': final_result[f'account_number_{period}'].to_numpy(dtype=object)[rows],
+        })
+        for name in self.SNAPSHOT_ROW_FEATURES:
+            if f'{name}_{period}' in features:
+                accounts[name] = features[f'{name}_{period}'].to_numpy()[rows]
+        return customers, accounts
+
+    def _period_features_with_store(self, final_result, feature_store):
+        """
+        _period_features for both periods, taking the _x snapshot from `feature_store` for every
+        customer whose _x source rows still match the stored fingerprint. Only the rest of the _x
+        half is computed; it is saved back together with the new _y snapshot for the next run.
+        """
+        for period in ['x', 'y']:
+            if f'creation_date_{period}' not in final_result.columns:
+                raise ValueError(f"feature_store needs a creation_date_{period} column to key snapshots")
+        codes, customers = pd.factorize(final_result['customer_no'])
+        keys, storable, present = self._snapshot_keys(final_result, 'x', codes, customers)
+
+        cached_customers, cached_accounts = feature_store.load(keys.loc[storable, ['customer_no', 'creation_date']])
+        cached = keys.merge(cached_customers, on=['customer_no', 'creation_date'], how='left', suffixes=('', '_stored'))
+        hit = storable & (cached['fingerprint_stored'] == cached['fingerprint']).to_numpy()
+
+        # Stored account rows for the hit customers' accounts; a missing one makes the customer a miss.
+        reused_rows = present & hit[np.maximum(codes, 0)]
+        if reused_rows.any():
+            reused = pd.DataFrame({
+                'customer_no': final_result['customer_no'].to_numpy()[reused_rows],
+                'creation_date': keys['creation_date'].to_numpy()[codes[reused_rows]],
+                'creditor_name': final_result['creditor_name'].to_numpy(dtype=object)[reused_rows],
+                'account_number': final_result['account_number_x'].to_numpy(dtype=object)[reused_rows],
+            }).merge(cached_accounts.assign(_stored=True), on=['customer_no', 'creation_date', 'creditor_name', 'account_number'], how='left')
+            hit[np.unique(codes[reused_rows][reused['_stored'].isna().to_numpy()])] = False
+            reused = reused[hit[codes[reused_rows]]]
+            reused_rows = present & hit[np.maximum(codes, 0)]
+
+        recompute = ~reused_rows
+        fresh = self._period_features(final_result[recompute], ['x'])
+        customer_rows = (codes >= 0) & hit[np.maximum(codes, 0)]
+        features = {}
+        for name, values in fresh.items():
+            base = name[:-len('_x')]
+            merged = np.full(len(final_result), np.nan)
+            merged[recompute] = values.to_numpy(dtype=np.float64)
+            if base in self.SNAPSHOT_ROW_FEATURES and reused_rows.any():
+                merged[reused_rows] = reused[base].to_numpy(dtype=np.float64)
+            elif base in self.SNAPSHOT_CUSTOMER_FEATURES and customer_rows.any():
+                merged[customer_rows] = cached[base].to_numpy(dtype=np.float64)[codes[customer_rows]]
+            features[name] = pd.Series(merged.astype(self._snapshot_dtype(final_result, base, 'x', merged)), index=final_result.index)
+
+        miss = storable & ~hit
+        if miss.any():
+            feature_store.save(*self._snapshot_tables(final_result, features, 'x', keys, codes, present, miss))
+
+        features.update(self._period_features(final_result, ['y']))
+        keys_y, storable_y, present_y = self._snapshot_keys(final_result, 'y', codes, customers)
+        if storable_y.any():
+            feature_store.save(*self._snapshot_tables(final_result, features, 'y', keys_y, codes, present_y, storable_y))
+        return features
+
+    def _snapshot_dtype(self, final_result, name, period, values):
+        """The dtype _period_features gives `name` on the full frame, for the assembled values."""
+        if np.isnan(values).any():
+            return np.float64
+        if name == 'string_length':
+            integral = final_result[f'pay_status_history_{period}'].notna().all()
+        elif name in self._INTEGER_SOURCES:
+            integral = all(final_result[f'{col}_{period}'].dtype.kind in 'iub' for col in self._INTEGER_SOURCES[name])
+        else:
+            integral = False
+        return np.int64 if integral else np.float64
+
+    def _open_date_rank(self, final_result):
+        """
+        rank(method='first') of date_opened within coalesced_loan_type, from one stable lexsort.
+        Falls back to the pandas ranking when either key has nulls.
+        """
+        type_codes, _ = pd.factorize(final_result['coalesced_loan_type'])
+        date_codes, _ = pd.factorize(final_result['date_opened'], sort=True)
+        if (type_codes < 0).any() or (date_codes < 0).any():
+            return final_result.groupby('coalesced_loan_type')['date_opened'].rank(method='first').astype(int)
+        order = np.lexsort((date_codes, type_codes))
+        sorted_types = type_codes[order]
+        starts = np.r_[0, np.flatnonzero(np.diff(sorted_types)) + 1]
+        group_start = np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order)) - group_start + 1
+        return rank
+
+    def _report_order(self, final_result):
+        """
+        Row positions that sort final_result by priority_3_y, then date_opened (stable, nulls
+        last), the order the reports list accounts in. Positions rather than a sorted copy, so
+        the index may hold duplicate labels.
+        """
+        keys = final_result[['priority_3_y', 'date_opened']].reset_index(drop=True)
+        return keys.sort_values(by=['priority_3_y', 'date_opened'], ascending=[True, True]).index.to_numpy()
+
+    def account_open_rank(self, df: pd.DataFrame) -> pd.Series:
+        """
+        Computes the 'rn' column: the order in which each account was opened among all accounts
+        of the same loan type in `df`, one value per row of `df` in its row order. The rank spans
+        the whole frame, not one customer, so code that splits a batch computes it once on the
+        full batch and passes each slice's rows of it to create_features.
+        """
+        order = self._report_order(df)
+        ordered = df[['loan_type_x', 'loan_type_y', 'date_opened']].iloc[order].reset_index(drop=True)
+        loan_type = np.where(ordered['loan_type_y'].notnull(), ordered['loan_type_y'], ordered['loan_type_x'])
+        rank = np.empty(len(df), dtype=np.int64)
+        rank[order] = ordered['date_opened'].groupby(loan_type).rank(method='first').astype(int).to_numpy()
+        return pd.Series(rank, index=df.index)
+
+    def create_features(self, df: pd.DataFrame, account_rank: pd.Series = None, low_memory: bool = False,
+                        feature_store=None, profiler=None, customer_totals: pd.DataFrame = None,
+                        fill_totals_within_customer: bool = False) -> pd.DataFrame:
         """
         Processes the raw DataFrame to create DPD, utilization, and other credit-based features.
+        `account_rank` (account_open_rank of the full batch, taken at the rows of `df`, in
+        order) replaces the 'rn' ranking when `df` is only a slice of the batch, and
+        `customer_totals` (customer_totals of the full batch, likewise) the filled totals.
+
+        A customer with no active (or no active CC) accounts gets the next customer's totals,
+        as the original back-fill did. `fill_totals_within_customer=True` gives them 0 instead;
+        it is opt-in because it changes the utilisation features, narratives and customer_info
+        of those customers, so training data built with it differs from existing data.
+
+        With a `feature_store` (feature_store.FeatureStore), the single-snapshot features are
+        keyed by customer_no and creation_date_x/creation_date_y: the _x half is read from the
+        store wherever last month's run saved it and the source rows are unchanged, and the
+        new _y half is saved for next month's run.
+
+        With `low_memory=True`, the INPUT_SCHEMA columns are downcast, the features get the
+        compact OUTPUT_SCHEMA dtypes and nulls are filled as each feature group is finished, so
+        the result takes far less memory than the default mode's; the values match, only the
+        dtypes differ. `df` itself is never modified, in either mode.
+
+        A `profiler` (profiling.Profiler) records the time, rows and memory delta of each
+        numbered section, as 'create_features.<section>'.
         """
-        final_result = df.copy()
+        lap = lap_timer(profiler, 'create_features', len(df))
+        # Columns the steps below replace are swapped out of this frame, never written into, so
+        # it can share the rest of its columns with `df`.
+        final_result = self._compact_inputs(df) if low_memory else df.copy(deep=False)
+        compacted = set(final_result.columns)
 
-        # --- 1. DPD (Days Past Due) Features ---
-        data_cols_x = [f'pay_hist_{i}_x' for i in range(1, 37)]
-        data_cols_y = [f'pay_hist_{i}_y' for i in range(1, 37)]
+        for period in ['x', 'y']:
+            for col in [f'current_balance_{period}', f'high_balance_{period}', f'credit_limit_{period}']:
+                final_result[col] = pd.to_numeric(final_result[col], errors='coerce')
+        lap('inputs')
 
-        for months in [36, 24, 18, 12, 6, 3, 2, 1]:
-            col_name = f"max_dpd_l{months}m_x" if months > 1 else "max_dpd_cm_x"
-            if all(c in final_result.columns for c in data_cols_x[:months]):
-                final_result[col_name] = final_result[data_cols_x[:months]].max(axis=1)
-                final_result[col_name] = final_result[col_name].fillna(0)
+        # Everything computed from one snapshot alone (DPD windows, utilisation, customer-level
+        # totals, maxes and counts) comes from _period_features, or partly from the store.
+        if feature_store is None:
+            features = self._period_features(final_result, ['x', 'y'])
+        else:
+            features = self._period_features_with_store(final_result, feature_store)
+        if customer_totals is not None:
+            totals = {name: customer_totals[name].to_numpy(dtype=np.float64) for name in customer_totals.columns}
+        else:
+            totals = self._fill_totals(final_result, features, ['x', 'y'], fill_totals_within_customer)
+        totals.update(self._overall_utilisations(final_result, totals, ['x', 'y']))
+        features.update({name: pd.Series(values, index=final_result.index) for name, values in totals.items()})
+        lap('period_features')
+
+        # New columns are collected by name, as values in final_result's row order, and joined
+        # to it with one concat at the end; a name the input already has is replaced in place.
+        new = {}
+
+        def put(name, values):
+            if name in final_result.columns:
+                final_result[name] = values
+            else:
+                new[name] = self._column_values(values)
+
+        def column(name):
+            return pd.Series(new[name]) if name in new else final_result[name].reset_index(drop=True)
+
+        # --- 1. DPD (Days Past Due) Features ---
+        for period in ['x', 'y']:
+            for col in [name for name in features if name.startswith('max_dpd_') and name.endswith(f'_{period}')]:
+                put(col, features[col])
 
-        for months in [36, 24, 18, 12, 6, 3, 2, 1]:
-            col_name = f"max_dpd_l{months}m_y" if months > 1 else "max_dpd_cm_y"
-            if all(c in final_result.columns for c in data_cols_y[:months]):
-                final_result[col_name] = final_result[data_cols_y[:months]].max(axis=1)
-                final_result[col_name] = final_result[col_name].fillna(0)
-        
         for months in [36, 24, 18, 12, 6, 3, 2, 1]:
             prefix = f"max_dpd_l{months}m" if months > 1 else "max_dpd_cm"
-            if f'{prefix}_y' in final_result.columns and f'{prefix}_x' in final_result.columns:
-                final_result[f'{prefix}_diff'] = final_result[f'{prefix}_y'] - final_result[f'{prefix}_x']
+            if all(name in new or name in final_result.columns for name in [f'{prefix}_y', f'{prefix}_x']):
+                put(f'{prefix}_diff', column(f'{prefix}_y') - column(f'{prefix}_x'))
+        lap('dpd')
 
         # --- 2. DPD Status & Delinquency Features ---
-        final_result['string_length_x'] = final_result['pay_status_history_x'].str.len().fillna(0)
-        final_result['string_length_y'] = final_result['pay_status_history_y'].str.len().fillna(0)
+        put('string_length_x', features['string_length_x'])
+        put('string_length_y', features['string_length_y'])
 
-        final_result['latest_payment_dpd_status_y_adjusted'] = np.where(final_result['string_length_y'] - final_result['string_length_x'] > 1, final_result['latest_payment_dpd_status2_y'], final_result['latest_payment_dpd_status_y'])
-        final_result['latest_payment_dpd_status2_y_adjusted'] = np.where(final_result['string_length_y'] - final_result['string_length_x'] > 1, final_result['latest_payment_dpd_status3_y'], final_result['latest_payment_dpd_status2_y'])
-        
-        final_result['max_delinquency_latest_2_months_y'] = final_result[['latest_payment_dpd_status_y_adjusted', 'latest_payment_dpd_status2_y_adjusted', 'latest_payment_dpd_status_y']].max(axis=1)
-        final_result['latest_payment_dpd_status_diff'] = np.where(final_result['string_length_y'] - final_result['string_length_x'] > 1, final_result['max_delinquency_latest_2_months_y'] - final_result['latest_payment_dpd_status_x'], final_result['latest_payment_dpd_status_y'] - final_result['latest_payment_dpd_status_x'])
+        put('latest_payment_dpd_status_y_adjusted', np.where(column('string_length_y') - column('string_length_x') > 1, column('latest_payment_dpd_status2_y'), column('latest_payment_dpd_status_y')))
+        put('latest_payment_dpd_status2_y_adjusted', np.where(column('string_length_y') - column('string_length_x') > 1, column('latest_payment_dpd_status3_y'), column('latest_payment_dpd_status2_y')))
+
+        latest = ['latest_payment_dpd_status_y_adjusted', 'latest_payment_dpd_status2_y_adjusted', 'latest_payment_dpd_status_y']
+        put('max_delinquency_latest_2_months_y', pd.DataFrame({col: column(col) for col in latest}).max(axis=1))
+        put('latest_payment_dpd_status_diff', np.where(column('string_length_y') - column('string_length_x') > 1, column('max_delinquency_latest_2_months_y') - column('latest_payment_dpd_status_x'), column('latest_payment_dpd_status_y') - column('latest_payment_dpd_status_x')))
 
         data_cols_x_max_dpd = ['max_dpd_l36m_diff','max_dpd_l24m_diff','max_dpd_l18m_diff','max_dpd_l12m_diff','max_dpd_l6m_diff','max_dpd_l3m_diff','max_dpd_cm_diff']
-        final_result['max_delinquency_detected'] = final_result[data_cols_x_max_dpd].max(axis=1)
-        final_result['min_delinquency_detected'] = final_result[data_cols_x_max_dpd].min(axis=1)
+        max_dpd_diffs = pd.DataFrame({col: column(col) for col in data_cols_x_max_dpd})
+        put('max_delinquency_detected', max_dpd_diffs.max(axis=1))
+        put('min_delinquency_detected', max_dpd_diffs.min(axis=1))
+
+        if low_memory:
+            self._compact_new_columns(new, compacted)
+        lap('dpd_status')
 
         # --- 3. Utilization Features (for both _x and _y periods) ---
         for period in ['x', 'y']:
-            for col in [f'current_balance_{period}', f'high_balance_{period}', f'credit_limit_{period}']:
-                final_result[col] = pd.to_numeric(final_result[col], errors='coerce')
-            
-            final_result[f'lim_disbursed_{period}'] = np.nanmax(final_result[[f'high_balance_{period}', f'credit_limit_{period}']].values, axis=1)
-            final_result[f'active_balance_{period}'] = np.where(final_result[f'Activity_Flag_{period}'] == 1, final_result[f'current_balance_{period}'], 0)
-            final_result[f'utilisation_{period}'] = (final_result[f'current_balance_{period}'] / final_result[f'lim_disbursed_{period}']).replace([np.inf, -np.inf], np.nan).fillna(0)
-
-            active_condition = final_result[f'Activity_Flag_{period}'] == 1
-            final_result.loc[active_condition, f'total_lim_disbursed_{period}'] = final_result.loc[active_condition].groupby('customer_no')[f'lim_disbursed_{period}'].transform('sum')
-            final_result.loc[active_condition, f'total_active_balance_{period}'] = final_result.loc[active_condition].groupby('customer_no')[f'active_balance_{period}'].transform('sum')
-            
-            cc_condition = (final_result[f'Activity_Flag_{period}'] == 1) & (final_result[f'priority_3_{period}'] == '01.0 CC')
-            final_result.loc[cc_condition, f'total_cc_lim_disbursed_{period}'] = final_result.loc[cc_condition].groupby('customer_no')[f'lim_disbursed_{period}'].transform('sum')
-            final_result.loc[cc_condition, f'total_cc_active_balance_{period}'] = final_result.loc[cc_condition].groupby('customer_no')[f'active_balance_{period}'].transform('sum')
-
-            cols_to_fill = [
-                f'total_lim_disbursed_{period}', f'total_active_balance_{period}',
-                f'total_cc_lim_disbursed_{period}', f'total_cc_active_balance_{period}'
-            ]
-            final_result[cols_to_fill] = final_result.groupby('customer_no')[cols_to_fill].ffill().bfill()
-            
-            final_result[f'overall_utilisation_{period}'] = (final_result[f'total_active_balance_{period}'] / final_result[f'total_lim_disbursed_{period}']).replace([np.inf, -np.inf], np.nan).fillna(0)
-            
-            # --- 💡 KEY FIX #2 IS HERE 💡 ---
-            # Calculate CC util in a temporary series
-            temp_cc_util = (final_result[f'total_cc_active_balance_{period}'] / final_result[f'total_cc_lim_disbursed_{period}']).replace([np.inf, -np.inf], np.nan)
-            final_result[f'overall_cc_utilisation_{period}'] = temp_cc_util
-            
-            # Broadcast the single CC util value to all of that customer's rows
-            final_result[f'overall_cc_utilisation_{period}'] = final_result.groupby('customer_no')[f'overall_cc_utilisation_{period}'].transform('max')
-            
-            # Fill remaining NaNs (for customers with no CCs) with 0
-            final_result[f'overall_cc_utilisation_{period}'] = final_result[f'overall_cc_utilisation_{period}'].fillna(0)
-            # --- End of Fix ---
+            for col in [f'lim_disbursed_{period}', f'active_balance_{period}', f'utilisation_{period}',
+                        f'total_lim_disbursed_{period}', f'total_active_balance_{period}',
+                        f'total_cc_lim_disbursed_{period}', f'total_cc_active_balance_{period}',
+                        f'overall_utilisation_{period}', f'overall_cc_utilisation_{period}']:
+                put(col, features[col])
+        lap('utilisation')
 
         # --- 4. Difference & Coalesced Features ---
-        final_result['utilisation_diff'] = final_result['utilisation_y'] - final_result['utilisation_x']
-        final_result['overall_utilisation_diff'] = final_result['overall_utilisation_y'] - final_result['overall_utilisation_x']
-        final_result['overall_cc_utilisation_diff'] = final_result['overall_cc_utilisation_y'] - final_result['overall_cc_utilisation_x']
+        put('utilisation_diff', column('utilisation_y') - column('utilisation_x'))
+        put('overall_utilisation_diff', column('overall_utilisation_y') - column('overall_utilisation_x'))
+        put('overall_cc_utilisation_diff', column('overall_cc_utilisation_y') - column('overall_cc_utilisation_x'))
+
+        put('utilisation_percent_diff', (column('utilisation_diff') / column('utilisation_x')).replace([np.inf, -np.inf], np.nan).fillna(0))
+        put('overall_utilisation_percent_diff', (column('overall_utilisation_diff') / column('overall_utilisation_x')).replace([np.inf, -np.inf], np.nan).fillna(0))
+        put('overall_cc_utilisation_percent_diff', (column('overall_cc_utilisation_diff') / column('overall_cc_utilisation_x')).replace([np.inf, -np.inf], np.nan).fillna(0))
 
-        final_result['utilisation_percent_diff'] = (final_result['utilisation_diff'] / final_result['utilisation_x']).replace([np.inf, -np.inf], np.nan).fillna(0)
-        final_result['overall_utilisation_percent_diff'] = (final_result['overall_utilisation_diff'] / final_result['overall_utilisation_x']).replace([np.inf, -np.inf], np.nan).fillna(0)
-        final_result['overall_cc_utilisation_percent_diff'] = (final_result['overall_cc_utilisation_diff'] / final_result['overall_cc_utilisation_x']).replace([np.inf, -np.inf], np.nan).fillna(0)
+        if low_memory:
+            self._compact_new_columns(new, compacted)
 
-        final_result = final_result.sort_values(by=['priority_3_y', 'date_opened'], ascending=[True, True])
-        final_result['coalesced_priority'] = np.where(final_result['priority_3_y'].notnull(), final_result['priority_3_y'], final_result['priority_3_x'])
-        final_result['coalesced_loan_type'] = np.where(final_result['loan_type_y'].notnull(), final_result['loan_type_y'], final_result['loan_type_x'])
-        final_result['coalesced_open_date'] = pd.to_datetime(final_result['date_opened']).dt.strftime('%d %b, %Y').astype(str)
+        # Rows go into report order by position; the new columns and the feature arrays below
+        # are taken in the same order, so nothing is aligned on the (possibly non-unique) index.
+        order = self._report_order(final_result)
+        final_result = final_result.take(order)
+        for name, values in new.items():
+            new[name] = values[order]
+        put('coalesced_priority', np.where(column('priority_3_y').notnull(), column('priority_3_y'), column('priority_3_x')))
+        put('coalesced_loan_type', np.where(column('loan_type_y').notnull(), column('loan_type_y'), column('loan_type_x')))
+        put('coalesced_open_date', pd.to_datetime(column('date_opened')).dt.strftime('%d %b, %Y').astype(str))
+        lap('differences')
 
         # --- 5. Customer-level Aggregates & Flags ---
-        final_result['risk_score_x'] = final_result.groupby('customer_no')['risk_score_x'].transform('max')
-        final_result['risk_score_y'] = final_result.groupby('customer_no')['risk_score_y'].transform('max')
-        final_result['risk_score_diff'] = final_result['risk_score_y'] - final_result['risk_score_x']
-        
-        final_result['total_active_accounts_y'] = final_result.groupby('customer_no')['Activity_Flag_y'].transform('sum')
-        final_result['total_active_accounts_x'] = final_result.groupby('customer_no')['Activity_Flag_x'].transform('sum')
-
-        final_result['total_active_cc_accounts_x'] = (final_result['priority_3_x'] == '01.0 CC') & (final_result['Activity_Flag_x'] == 1)
-        final_result['total_active_cc_accounts_x'] = final_result.groupby('customer_no')['total_active_cc_accounts_x'].transform('sum')
-        final_result['total_active_cc_accounts_y'] = (final_result['priority_3_y'] == '01.0 CC') & (final_result['Activity_Flag_y'] == 1)
-        final_result['total_active_cc_accounts_y'] = final_result.groupby('customer_no')['total_active_cc_accounts_y'].transform('sum')
-        
-        final_result['rn'] = final_result.groupby('coalesced_loan_type')['date_opened'].rank(method='first').astype(int)
-        final_result['new_account_flag'] = np.where((final_result['account_number_y'].notnull()) & (final_result['account_number_x'].isnull()) & (final_result['diff_sin_open_y'] <= 3), 1, 0)
-        final_result['temp'] = np.where(final_result['latest_payment_dpd_status_y'] == 0, final_result['max_delinquency_latest_2_months_y'], final_result['latest_payment_dpd_status_y'])
-        
+        put('risk_score_x', features['risk_score_x'].to_numpy()[order])
+        put('risk_score_y', features['risk_score_y'].to_numpy()[order])
+        put('risk_score_diff', column('risk_score_y') - column('risk_score_x'))
+
+        put('total_active_accounts_y', features['total_active_accounts_y'].to_numpy()[order])
+        put('total_active_accounts_x', features['total_active_accounts_x'].to_numpy()[order])
+
+        put('total_active_cc_accounts_x', features['total_active_cc_accounts_x'].to_numpy()[order])
+        put('total_active_cc_accounts_y', features['total_active_cc_accounts_y'].to_numpy()[order])
+
+        if account_rank is not None:
+            put('rn', np.asarray(account_rank)[order])
+        else:
+            put('rn', self._open_date_rank(pd.DataFrame({col: column(col) for col in ['coalesced_loan_type', 'date_opened']})))
+        put('new_account_flag', np.where((column('account_number_y').notnull()) & (column('account_number_x').isnull()) & (column('diff_sin_open_y') <= 3), 1, 0))
+        put('temp', np.where(column('latest_payment_dpd_status_y') == 0, column('max_delinquency_latest_2_months_y'), column('latest_payment_dpd_status_y')))
+        lap('customer_aggregates')
+
         # --- 6. Final Cleanup ---
-        final_result = final_result.apply(self._fill_nulls)
-        
-        return final_result
\ No newline at end of file
+        del features  # every value is in final_result or `new` by now; frees them before the concat
+        if low_memory:
+            self._compact_new_columns(new, compacted)
+        else:
+            for name, values in new.items():
+                if pd.isna(values).any():
+                    new[name] = self._column_values(self._fill_nulls(pd.Series(values)))
+        # The input columns' nulls are found in one pass over the frame, not column by column.
+        categorical = [isinstance(dtype, pd.CategoricalDtype) for dtype in final_result.dtypes]
+        for i in np.flatnonzero(final_result.isna().any().to_numpy() | np.array(categorical, dtype=bool)):
+            final_result.isetitem(i, self._fill_nulls(final_result.iloc[:, i]))
+        # One Series per new column: a frame built from `new` would first stack them into a copy.
+        columns = [pd.Series(values, index=final_result.index, name=name) for name, values in new.items()]
+        final_result = pd.concat([final_result, *columns], axis=1, copy=False)
+        lap('cleanup')
+
+        return final_result
@@ -2,9 +2,12 @@
 # io.StringIO(): Creates an empty, temporary text box in your computer's memory.
 # redirect_stdout(): Tells the print() function to write everything into that text box instead of showing it on your screen.
 import pandas as pd
+import numpy as np
 import io
 from contextlib import redirect_stdout
 
+from profiling import lap_timer
+
 class CustomerScoreAnalyzer:
     """
     Prepares data for LLM fine-tuning by separating a customer's credit profile
@@ -71,19 +74,23 @@ class CustomerScoreAnalyzer:
                 for _, row in df_enq.iterrows():
                     print(f"-  Lender : {row.get('subscriber_name', 'N/A')},  Type : {row.get('loan_type', 'N/A')},  Date : {row.get('inquiry_date', 'N/A')}")
 
-    def _generate_update_narrative(self, final_result1, df_enq, writer):
+    def _generate_update_narrative(self, final_result1, df_enq, writer, profiler=None):
         """Generates the 'customer_credit_update' narrative of Good/Bad changes."""
+        lap = lap_timer(profiler, 'training_data', len(final_result1))
         with redirect_stdout(writer):
             user_id = final_result1['customer_no'].iloc[0]
 
             # --- SCORE UPDATES ---
-            if 'risk_score_diff' in final_result1.columns and not final_result1['risk_score_diff'].dropna().empty:
-                if final_result1['risk_score_diff'].max() < 0:
-                    drop = -1 * final_result1['risk_score_diff'].iloc[0]
-                    print(f"Bad:- User's score has reduced between 2 months by {drop} points.")
-                if final_result1['risk_score_diff'].max() > 0:
-                    increase = final_result1['risk_score_diff'].iloc[0]
-                    print(f"Good:- User's score has increased between 2 months by {increase} points.")
+            # Laps are named after profiling.RULES, one per rule, in both this and the batched path.
+            has_score = 'risk_score_diff' in final_result1.columns and not final_result1['risk_score_diff'].dropna().empty
+            if has_score and final_result1['risk_score_diff'].max() < 0:
+                drop = -1 * final_result1['risk_score_diff'].iloc[0]
+                print(f"Bad:- User's score has reduced between 2 months by {drop} points.")
+            lap('rule.score_reduced')
+            if has_score and final_result1['risk_score_diff'].max() > 0:
+                increase = final_result1['risk_score_diff'].iloc[0]
+                print(f"Good:- User's score has increased between 2 months by {increase} points.")
+            lap('rule.score_increased')
 
             # --- "BAD" UPDATES ---
 
@@ -92,56 +99,72 @@ class CustomerScoreAnalyzer:
             if not delinquent_now.empty:
                 msg = ', '.join([f"{row['creditor_name']} {row['loan_type_y']} ({row['temp']} days)" for _, row in delinquent_now.iterrows()])
                 print(f"Bad:- User is delinquent on accounts: {msg}.")
+            lap('rule.delinquent')
 
             freshly_delinquent = final_result1[(final_result1.get('temp', 0) > 0) & (final_result1['Activity_Flag_y'] == 1) & (final_result1.get('max_dpd_l2m_x', 0) <= 0) & (final_result1.get('max_dpd_l3m_x', 0) <= 0) & (final_result1.get('max_dpd_l2m_y', 0) > 0)]
             if not freshly_delinquent.empty:
                 msg = ', '.join([f"{row['creditor_name']} {row['loan_type_y']} ({row['temp']} days)" for _, row in freshly_delinquent.iterrows()])
                 print(f"Bad:- User has become freshly delinquent on accounts: {msg}.")
+            lap('rule.freshly_delinquent')
 
             # Utilization
             if 'utilisation_y' in final_result1.columns and not final_result1['utilisation_y'].dropna().empty and final_result1['utilisation_y'].max() <= 0:
                 print(f"Bad:- User has become dormant and has zero overall credit utilization.")
+            lap('rule.dormant')
 
-            if 'overall_utilisation_percent_diff' in final_result1.columns:
+            overall_util = 'overall_utilisation_percent_diff' in final_result1.columns
+            if overall_util:
                 overall_util_change = final_result1['overall_utilisation_percent_diff'].max() * 100
-                cc_util_change = final_result1.get('overall_cc_utilisation_percent_diff', pd.Series([0])).max() * 100
                 if overall_util_change > 0:
                     print(f"Bad:- User's overall utilisation has increased by {overall_util_change:.2f} percentage points.")
+            lap('rule.overall_util_increased')
+            if overall_util:
+                cc_util_change = final_result1.get('overall_cc_utilisation_percent_diff', pd.Series([0])).max() * 100
                 if cc_util_change > 0:
                     print(f"Bad:- User's cc utilisation has increased by {cc_util_change:.2f} percentage points.")
+            lap('rule.cc_util_increased')
 
             util_increase = final_result1[(final_result1.get('utilisation_percent_diff', 0) > 0.5) & (final_result1['Activity_Flag_y'] == 1)]
             if not util_increase.empty:
                 msg = ', '.join([f"{row['creditor_name']} ({row['utilisation_percent_diff']*100:.0f}%)" for _, row in util_increase.iterrows()])
                 print(f"Bad:- User has increased utilisation on following accounts: {msg}.")
+            lap('rule.account_util_increased')
 
-            if 'overall_cc_utilisation_y' in final_result1.columns:
+            util_y_level = 'overall_cc_utilisation_y' in final_result1.columns
+            if util_y_level:
                 util_all_y = final_result1['overall_utilisation_y'].max() * 100
-                util_cc_y = final_result1['overall_cc_utilisation_y'].max() * 100
                 if util_all_y >= 30:
                     print(f"Bad:- User's overall utilisation is high at {util_all_y:.2f}%.")
+            lap('rule.overall_util_high')
+            if util_y_level:
+                util_cc_y = final_result1['overall_cc_utilisation_y'].max() * 100
                 if util_cc_y >= 30:
                     print(f"Bad:- User's cc utilisation is high at {util_cc_y:.2f}%.")
+            lap('rule.cc_util_high')
 
             high_util_accounts = final_result1[(final_result1.get('utilisation_y', 0) >= 0.3) & (final_result1['Activity_Flag_y'] == 1)]
             if not high_util_accounts.empty:
                 msg = ', '.join([f"{row['creditor_name']} ({row['utilisation_y']*100:.0f}%)" for _, row in high_util_accounts.iterrows()])
                 print(f"Bad:- User has high utilisation (>30%) in following accounts: {msg}.")
+            lap('rule.account_util_high')
 
             # Account Activity
             new_accounts_bad = final_result1[(final_result1.get('new_account_flag') == 1) & (final_result1['rn'] != 1)]
             if not new_accounts_bad.empty:
                 msg = ', '.join([f"{row['creditor_name']} ({row['loan_type_y']})" for _, row in new_accounts_bad.iterrows()])
                 print(f"Bad:- User has opened new following accounts: {msg}.")
+            lap('rule.new_accounts_bad')
 
             reporting_errors = final_result1[(final_result1['account_type_symbol_y'] != final_result1['account_type_symbol_x']) & (final_result1['Activity_Flag_y'] == 1) & (final_result1['Activity_Flag_x'] == 1)]
             if not reporting_errors.empty:
                 msg = ', '.join([f"{row['creditor_name']} (from {row['account_type_symbol_x']} to {row['account_type_symbol_y']})" for _, row in reporting_errors.iterrows()])
                 print(f"Bad:- User's following accounts were reported wrongly: {msg}.")
+            lap('rule.reported_wrongly')
 
             if df_enq is not None and not df_enq.empty:
                 msg = ', '.join([f"{row['subscriber_name']} ({row['loan_type']})" for _, row in df_enq.iterrows()])
                 print(f"Bad:- User has made new inquiries with the following lenders: {msg}.")
+            lap('rule.new_inquiries')
 
 
             # --- "GOOD" UPDATES ---
@@ -151,85 +174,500 @@ class CustomerScoreAnalyzer:
             if not delinquency_reduced.empty:
                 msg = ', '.join([f"{row['creditor_name']} (by {abs(row['latest_payment_dpd_status_diff'])} days)" for _, row in delinquency_reduced.iterrows()])
                 print(f"Good:- User's delinquency has reduced in the following accounts: {msg}.")
+            lap('rule.delinquency_reduced')
 
             not_delinquent_anymore = final_result1[(final_result1.get('latest_payment_dpd_status_diff', 0) < -1) & (final_result1['latest_payment_dpd_status_y'] == 0) & (final_result1.get('max_dpd_l2m_x', 0) > 0) & (final_result1.get('max_dpd_l3m_x', 0) > 0) & (final_result1['Activity_Flag_x'] == 1)]
             if not not_delinquent_anymore.empty:
                 msg = ', '.join([f"{row['creditor_name']} ({row['loan_type_y']})" for _, row in not_delinquent_anymore.iterrows()])
                 print(f"Good:- User is no more delinquent on the following accounts: {msg}.")
+            lap('rule.no_longer_delinquent')
 
             # Utilization
-            if 'overall_utilisation_percent_diff' in final_result1.columns:
+            if overall_util:
                 overall_util_change = final_result1['overall_utilisation_percent_diff'].max() * 100
-                cc_util_change = final_result1.get('overall_cc_utilisation_percent_diff', pd.Series([0])).max() * 100
                 if overall_util_change < 0:
                     print(f"Good:- User's overall utilisation has decreased by {abs(overall_util_change):.2f} percentage points.")
+            lap('rule.overall_util_decreased')
+            if overall_util:
+                cc_util_change = final_result1.get('overall_cc_utilisation_percent_diff', pd.Series([0])).max() * 100
                 if cc_util_change < 0:
                     print(f"Good:- User's cc utilisation has decreased by {abs(cc_util_change):.2f} percentage points.")
-            
-            if 'overall_cc_utilisation_y' in final_result1.columns:
+            lap('rule.cc_util_decreased')
+
+            if util_y_level:
                 util_all_y = final_result1['overall_utilisation_y'].max() * 100
-                util_cc_y = final_result1['overall_cc_utilisation_y'].max() * 100
                 if util_all_y < 30:
                     print(f"Good:- User's overall utilisation is healthy at {util_all_y:.2f}%.")
+            lap('rule.overall_util_healthy')
+            if util_y_level:
+                util_cc_y = final_result1['overall_cc_utilisation_y'].max() * 100
                 if util_cc_y < 30:
                     print(f"Good:- User's cc utilisation is healthy at {util_cc_y:.2f}%.")
+            lap('rule.cc_util_healthy')
 
             util_reduced = final_result1[(final_result1.get('utilisation_percent_diff', 0) < -0.1) & (final_result1['Activity_Flag_x'] == 1)]
             if not util_reduced.empty:
                 msg = ', '.join([f"{row['creditor_name']} ({abs(row['utilisation_percent_diff']*100):.0f}%)" for _, row in util_reduced.iterrows()])
                 print(f"Good:- User has reduced their utilisation in the following accounts: {msg}.")
+            lap('rule.account_util_reduced')
 
             low_util_accounts = final_result1[(final_result1.get('utilisation_y', 0) < 0.3) & (final_result1['Activity_Flag_y'] == 1)]
             if not low_util_accounts.empty:
                 msg = ', '.join([f"{row['creditor_name']} ({row['utilisation_y']*100:.0f}%)" for _, row in low_util_accounts.iterrows()])
                 print(f"Good:- User has utilisation less than 30% in the following accounts: {msg}.")
+            lap('rule.account_util_low')
 
             # Account Activity
             fixed_reporting = final_result1[final_result1['_merge'] == 'left_only']
             if not fixed_reporting.empty:
                 msg = ', '.join([f"{row['creditor_name']} ({row['coalesced_loan_type']})" for _, row in fixed_reporting.iterrows()])
                 print(f"Good:- User's following accounts were removed from their report: {msg}.")
+            lap('rule.accounts_removed')
 
             account_closed = final_result1[(final_result1.get('Activity_Flag_y') == 0) & (final_result1.get('Activity_Flag_x') == 1)]
             if not account_closed.empty:
                 msg = ', '.join([f"{row['creditor_name']} ({row['loan_type_y']})" for _, row in account_closed.iterrows()])
                 print(f"Good:- User has closed the following accounts: {msg}.")
+            lap('rule.accounts_closed')
 
             new_accounts_good = final_result1[(final_result1.get('new_account_flag') == 1) & (final_result1['rn'] == 1)]
             if not new_accounts_good.empty:
                 msg = ', '.join([f"{row['creditor_name']} ({row['loan_type_y']})" for _, row in new_accounts_good.iterrows()])
                 print(f"Good:- User has opened new following accounts: {msg}.")
+            lap('rule.new_accounts_good')
 
             new_after_dormancy = final_result1[(final_result1.get('new_account_flag') == 1) & (final_result1.get('total_active_accounts_y', 0) >= 1) & (final_result1.get('total_active_accounts_x', 0) == 0)]
             if not new_after_dormancy.empty:
                 msg = ', '.join([f"{row['creditor_name']} ({row['loan_type_y']})" for _, row in new_after_dormancy.iterrows()])
                 print(f"Good:- User has opened new following accounts after a period of dormancy: {msg}.")
-
-
-    def generate_training_data(self, final_result1, df_enq=None):
+            lap('rule.new_accounts_after_dormancy')
+
+
+    # --- Batched (columnar) mode ---
+    # Columns the batched path reads directly; if any is missing the per-customer
+    # path is used instead so that its errors/defaults are reproduced exactly.
+    _BATCHED_REQUIRED_COLUMNS = [
+        'customer_no', 'creditor_name', 'loan_type_y', 'coalesced_loan_type', 'temp', 'rn', '_merge',
+        'Activity_Flag_x', 'Activity_Flag_y', 'latest_payment_dpd_status_y',
+        'account_type_symbol_x', 'account_type_symbol_y', 'account_number_y', 'overall_utilisation_y', 'utilisation_y',
+    ]
+
+    def _can_batch(self, final_result1, df_enq):
+        """Checks that the batched path will reproduce the per-customer output byte for byte."""
+        if not set(self._BATCHED_REQUIRED_COLUMNS).issubset(final_result1.columns):
+            return False
+        # iterrows() hands the rules object rows; a purely numeric frame would upcast ints to floats.
+        if final_result1.iloc[:0].to_numpy().dtype != object:
+            return False
+        if df_enq is not None and 'customer_no' in df_enq.columns:
+            if not {'subscriber_name', 'loan_type'}.issubset(df_enq.columns):
+                return False
+            if df_enq.iloc[:0].to_numpy().dtype != object:
+                return False
+        return True
+
+    @staticmethod
+    def _values(df, col, default='N/A'):
+        """Column values as Python objects (what row.get() returns), or the default if absent."""
+        if col in df.columns:
+            return df[col].to_numpy(dtype=object)
+        return np.full(len(df), default, dtype=object)
+
+    @staticmethod
+    def _join_by_customer(codes, fragments, sep=', '):
+        """Grouped string aggregation: {customer code: sep.join(fragments of that customer)}."""
+        if len(fragments) == 0:
+            return {}
+        return pd.Series(fragments, dtype=object).groupby(codes, sort=False).agg(sep.join).to_dict()
+
+    def _rule_messages(self, df, codes, mask, fragment):
+        """Evaluates one row-level rule for all customers; returns {code: joined message}."""
+        mask = np.broadcast_to(np.asarray(mask, dtype=bool), len(df))
+        rows = np.flatnonzero(mask)
+        if len(rows) == 0:
+            return {}
+        selected = df.iloc[rows]
+        return self._join_by_customer(codes[rows], fragment(selected))
+
+    def _generate_info_reports_batched(self, df, codes, starts, enq, enq_codes):
+        """Columnar equivalent of _generate_info_report for every customer at once."""
+        n_customers = len(starts)
+        customer_no = df['customer_no'].to_numpy()
+
+        # --- Key Metric Summary (first row of each customer) ---
+        first = {col: self._values(df, col, default)[starts] for col, default in [
+            ('risk_score_y', 'N/A'), ('risk_score_x', 'N/A'),
+            ('overall_utilisation_y', 0), ('overall_utilisation_x', 0),
+            ('total_active_cc_accounts_y', 0), ('total_active_cc_accounts_x', 0),
+            ('overall_cc_utilisation_y', 0), ('overall_cc_utilisation_x', 0),
+            ('total_active_accounts_y', 'N/A'), ('total_active_accounts_x', 'N/A'),
+        ]}
+
+        # --- Credit Mix (per-customer counts from whole-frame masks) ---
+        active_y = (df['Activity_Flag_y'] == 1).to_numpy()
+        has_mix = 'secured_unsecured_y' in df.columns
+        if has_mix:
+            total_loans = np.bincount(codes, weights=(df['account_number_y'] != 'NA').to_numpy(), minlength=n_customers).astype(np.int64)
+            total_active_loans = df.groupby(codes, sort=True)['Activity_Flag_y'].sum().to_numpy(dtype=object)
+            secured = np.bincount(codes, weights=active_y & (df['secured_unsecured_y'] == '1. Secured').to_numpy(), minlength=n_customers).astype(np.int64)
+            unsecured = np.bincount(codes, weights=active_y & (df['secured_unsecured_y'] == '2. Unsecured').to_numpy(), minlength=n_customers).astype(np.int64)
+        has_lender = 'lender_type' in df.columns
+        if has_lender:
+            lender_counts = {
+                lender: np.bincount(codes, weights=active_y & (df['lender_type'] == lender).to_numpy(), minlength=n_customers).astype(np.int64)
+                for lender in ['Public sector', 'Private sector', 'NBFC', 'Corporate bank', 'Foreign bank']
+            }
+
+        # --- Account Details Breakdown (one text block per row) ---
+        merge = self._values(df, '_merge', None)
+        new_flag = self._values(df, 'new_account_flag', None)
+        flag_x = self._values(df, 'Activity_Flag_x', None)
+        flag_y = self._values(df, 'Activity_Flag_y', None)
+        status = np.select(
+            [merge == 'left_only', new_flag == 1, (flag_x == 1) & (flag_y == 0)],
+            ['Removed from Report', 'New Account', 'Closed this Period'], 'Active')
+        loan_type = self._values(df, 'coalesced_loan_type')
+        util_x = self._values(df, 'utilisation_x', 0)
+        util_y = self._values(df, 'utilisation_y', 0)
+        type_x = self._values(df, 'account_type_symbol_x', None)
+        type_y = self._values(df, 'account_type_symbol_y', None)
+        blocks = []
+        for name, lt, acc, st, dpd_y, dpd_x, ux, uy, tx, ty in zip(
+                self._values(df, 'creditor_name'), loan_type, self._values(df, 'acc_no'), status,
+                self._values(df, 'latest_payment_dpd_status_y'), self._values(df, 'latest_payment_dpd_status_x'),
+                util_x, util_y, type_x, type_y):
+            block = (f"\n-  Account : {name} - {lt} ({acc})\n"
+                     f"  -  Status : {st}\n"
+                     f"  -  DPD : {dpd_y} days (was {dpd_x} days)\n")
+            if 'CC' in str(lt).upper() or uy > 0 or ux > 0:
+                block += f"  -  Utilization : {uy:.2%} (was {ux:.2%})\n"
+            if tx != ty:
+                block += f"  -  Info Change : Account type is now '{ty}' (was '{tx}')\n"
+            blocks.append(block)
+        accounts = self._join_by_customer(codes, blocks, sep='')
+
+        # --- Recent Enquiries ---
+        enquiries = {}
+        if enq is not None and len(enq):
+            lines = [f"-  Lender : {lender},  Type : {lt},  Date : {date}\n" for lender, lt, date in zip(
+                self._values(enq, 'subscriber_name'), self._values(enq, 'loan_type'), self._values(enq, 'inquiry_date'))]
+            enquiries = self._join_by_customer(enq_codes, lines, sep='')
+
+        reports = []
+        for c in range(n_customers):
+            parts = [f"--- Credit Profile Report for Customer: {customer_no[starts[c]]} ---\n",
+                     "\n## Key Metric Summary\n",
+                     f"-  Risk Score : {first['risk_score_y'][c]} (was {first['risk_score_x'][c]})\n",
+                     f"-  Overall Utilization : {first['overall_utilisation_y'][c]:.2%} (was {first['overall_utilisation_x'][c]:.2%})\n"]
+            if first['total_active_cc_accounts_y'][c] > 0 or first['total_active_cc_accounts_x'][c] > 0:
+                parts.append(f"-  Credit Card Utilization : {first['overall_cc_utilisation_y'][c]:.2%} (was {first['overall_cc_utilisation_x'][c]:.2%})\n")
+            parts.append(f"-  Total Active Accounts : {first['total_active_accounts_y'][c]} (was {first['total_active_accounts_x'][c]})\n")
+            parts.append("\n## Current Credit Mix\n")
+            if has_mix:
+                parts.append(f"-  Total Accounts : {total_loans[c]} ({total_active_loans[c]} active)\n"
+                             f"-  Active Secured Products : {secured[c]}\n"
+                             f"-  Active Unsecured Products : {unsecured[c]}\n")
+            if has_lender:
+                parts.append("-  Active Lender Distribution : "
+                             f"Public({lender_counts['Public sector'][c]}), "
+                             f"Private({lender_counts['Private sector'][c]}), "
+                             f"NBFC({lender_counts['NBFC'][c]}), "
+                             f"Corporate({lender_counts['Corporate bank'][c]}), "
+                             f"Foreign({lender_counts['Foreign bank'][c]})\n")
+            parts.append("\n## Account Details Breakdown\n")
+            parts.append(accounts.get(c, ''))
+            if c in enquiries:
+                parts.append("\n## Recent Credit Enquiries\n")
+                parts.append(enquiries[c])
+            reports.append(''.join(parts))
+        return reports
+
+    def _generate_update_narratives_batched(self, df, codes, starts, enq, enq_codes, profiler=None):
+        """Columnar equivalent of _generate_update_narrative: every Good/Bad rule is one mask over all rows."""
+        lap = lap_timer(profiler, 'training_data', len(df))
+        n_customers = len(starts)
+        grouped = df.groupby(codes, sort=True)
+        flag_x = df['Activity_Flag_x'] == 1
+        flag_y = df['Activity_Flag_y'] == 1
+        name = lambda rows: rows['creditor_name'].to_numpy(dtype=object)
+        col = lambda rows, c: rows[c].to_numpy(dtype=object)
+
+        # --- Customer-level reductions ---
+        score = {}
+        if 'risk_score_diff' in df.columns:
+            score_max = grouped['risk_score_diff'].max().to_numpy()
+            score_count = grouped['risk_score_diff'].count().to_numpy()
+            score_first = df['risk_score_diff'].to_numpy()[starts]
+        # Laps are named after profiling.RULES, like the per-customer path's. A Bad rule and its
+        # Good counterpart share one reduction here, so the Good rule's lap follows it at ~0 s.
+        lap('rule.score_reduced')
+        lap('rule.score_increased')
+        overall_util = 'overall_utilisation_percent_diff' in df.columns
+        if overall_util:
+            overall_util_change = grouped['overall_utilisation_percent_diff'].max().to_numpy() * 100
+        lap('rule.overall_util_increased')
+        lap('rule.overall_util_decreased')
+        if overall_util:
+            if 'overall_cc_utilisation_percent_diff' in df.columns:
+                cc_util_change = grouped['overall_cc_utilisation_percent_diff'].max().to_numpy() * 100
+            else:
+                cc_util_change = np.zeros(n_customers, dtype=np.int64)
+        lap('rule.cc_util_increased')
+        lap('rule.cc_util_decreased')
+        util_y_level = 'overall_cc_utilisation_y' in df.columns
+        if util_y_level:
+            util_all_y = grouped['overall_utilisation_y'].max().to_numpy() * 100
+        lap('rule.overall_util_high')
+        lap('rule.overall_util_healthy')
+        if util_y_level:
+            util_cc_y = grouped['overall_cc_utilisation_y'].max().to_numpy() * 100
+        lap('rule.cc_util_high')
+        lap('rule.cc_util_healthy')
+        dormant = np.zeros(n_customers, dtype=bool)
+        if 'utilisation_y' in df.columns:
+            dormant = (grouped['utilisation_y'].count().to_numpy() > 0) & (grouped['utilisation_y'].max().to_numpy() <= 0)
+        lap('rule.dormant')
+
+        # --- Row-level rules ---
+        delinquent_now = self._rule_messages(
+            df, codes, (df['latest_payment_dpd_status_y'] > 0) & flag_y,
+            lambda r: [f"{n} {lt} ({t} days)" for n, lt, t in zip(name(r), col(r, 'loan_type_y'), col(r, 'temp'))])
+        lap('rule.delinquent')
+        freshly_delinquent = self._rule_messages(
+            df, codes, (df.get('temp', 0) > 0) & flag_y & (df.get('max_dpd_l2m_x', 0) <= 0) & (df.get('max_dpd_l3m_x', 0) <= 0) & (df.get('max_dpd_l2m_y', 0) > 0),
+            lambda r: [f"{n} {lt} ({t} days)" for n, lt, t in zip(name(r), col(r, 'loan_type_y'), col(r, 'temp'))])
+        lap('rule.freshly_delinquent')
+        util_increase = self._rule_messages(
+            df, codes, (df.get('utilisation_percent_diff', 0) > 0.5) & flag_y,
+            lambda r: [f"{n} ({u*100:.0f}%)" for n, u in zip(name(r), col(r, 'utilisation_percent_diff'))])
+        lap('rule.account_util_increased')
+        high_util_accounts = self._rule_messages(
+            df, codes, (df.get('utilisation_y', 0) >= 0.3) & flag_y,
+            lambda r: [f"{n} ({u*100:.0f}%)" for n, u in zip(name(r), col(r, 'utilisation_y'))])
+        lap('rule.account_util_high')
+        new_accounts_bad = self._rule_messages(
+            df, codes, (df.get('new_account_flag') == 1) & (df['rn'] != 1),
+            lambda r: [f"{n} ({lt})" for n, lt in zip(name(r), col(r, 'loan_type_y'))])
+        lap('rule.new_accounts_bad')
+        reporting_errors = self._rule_messages(
+            df, codes, (df['account_type_symbol_y'] != df['account_type_symbol_x']) & flag_y & flag_x,
+            lambda r: [f"{n} (from {tx} to {ty})" for n, tx, ty in zip(name(r), col(r, 'account_type_symbol_x'), col(r, 'account_type_symbol_y'))])
+        lap('rule.reported_wrongly')
+        new_inquiries = {}
+        if enq is not None and len(enq):
+            new_inquiries = self._join_by_customer(enq_codes, [
+                f"{s} ({lt})" for s, lt in zip(enq['subscriber_name'].to_numpy(dtype=object), enq['loan_type'].to_numpy(dtype=object))])
+        lap('rule.new_inquiries')
+
+        delinquency_reduced = self._rule_messages(
+            df, codes, (df.get('latest_payment_dpd_status_diff', 0) < -1) & flag_x & (df.get('max_dpd_l2m_x', 0) > 0),
+            lambda r: [f"{n} (by {abs(d)} days)" for n, d in zip(name(r), col(r, 'latest_payment_dpd_status_diff'))])
+        lap('rule.delinquency_reduced')
+        not_delinquent_anymore = self._rule_messages(
+            df, codes, (df.get('latest_payment_dpd_status_diff', 0) < -1) & (df['latest_payment_dpd_status_y'] == 0) & (df.get('max_dpd_l2m_x', 0) > 0) & (df.get('max_dpd_l3m_x', 0) > 0) & flag_x,
+            lambda r: [f"{n} ({lt})" for n, lt in zip(name(r), col(r, 'loan_type_y'))])
+        lap('rule.no_longer_delinquent')
+        util_reduced = self._rule_messages(
+            df, codes, (df.get('utilisation_percent_diff', 0) < -0.1) & flag_x,
+            lambda r: [f"{n} ({abs(u*100):.0f}%)" for n, u in zip(name(r), col(r, 'utilisation_percent_diff'))])
+        lap('rule.account_util_reduced')
+        low_util_accounts = self._rule_messages(
+            df, codes, (df.get('utilisation_y', 0) < 0.3) & flag_y,
+            lambda r: [f"{n} ({u*100:.0f}%)" for n, u in zip(name(r), col(r, 'utilisation_y'))])
+        lap('rule.account_util_low')
+        fixed_reporting = self._rule_messages(
+            df, codes, df['_merge'] == 'left_only',
+            lambda r: [f"{n} ({lt})" for n, lt in zip(name(r), col(r, 'coalesced_loan_type'))])
+        lap('rule.accounts_removed')
+        account_closed = self._rule_messages(
+            df, codes, (df.get('Activity_Flag_y') == 0) & (df.get('Activity_Flag_x') == 1),
+            lambda r: [f"{n} ({lt})" for n, lt in zip(name(r), col(r, 'loan_type_y'))])
+        lap('rule.accounts_closed')
+        new_accounts_good = self._rule_messages(
+            df, codes, (df.get('new_account_flag') == 1) & (df['rn'] == 1),
+            lambda r: [f"{n} ({lt})" for n, lt in zip(name(r), col(r, 'loan_type_y'))])
+        lap('rule.new_accounts_good')
+        new_after_dormancy = self._rule_messages(
+            df, codes, (df.get('new_account_flag') == 1) & (df.get('total_active_accounts_y', 0) >= 1) & (df.get('total_active_accounts_x', 0) == 0),
+            lambda r: [f"{n} ({lt})" for n, lt in zip(name(r), col(r, 'loan_type_y'))])
+        lap('rule.new_accounts_after_dormancy')
+
+        narratives = []
+        for c in range(n_customers):
+            lines = []
+            if 'risk_score_diff' in df.columns and score_count[c] > 0:
+                if score_max[c] < 0:
+                    lines.append(f"Bad:- User's score has reduced between 2 months by {-1 * score_first[c]} points.")
+                if score_max[c] > 0:
+                    lines.append(f"Good:- User's score has increased between 2 months by {score_first[c]} points.")
+
+            if c in delinquent_now:
+                lines.append(f"Bad:- User is delinquent on accounts: {delinquent_now[c]}.")
+            if c in freshly_delinquent:
+                lines.append(f"Bad:- User has become freshly delinquent on accounts: {freshly_delinquent[c]}.")
+            if dormant[c]:
+                lines.append(f"Bad:- User has become dormant and has zero overall credit utilization.")
+            if overall_util:
+                if overall_util_change[c] > 0:
+                    lines.append(f"Bad:- User's overall utilisation has increased by {overall_util_change[c]:.2f} percentage points.")
+                if cc_util_change[c] > 0:
+                    lines.append(f"Bad:- User's cc utilisation has increased by {cc_util_change[c]:.2f} percentage points.")
+            if c in util_increase:
+                lines.append(f"Bad:- User has increased utilisation on following accounts: {util_increase[c]}.")
+            if util_y_level:
+                if util_all_y[c] >= 30:
+                    lines.append(f"Bad:- User's overall utilisation is high at {util_all_y[c]:.2f}%.")
+                if util_cc_y[c] >= 30:
+                    lines.append(f"Bad:- User's cc utilisation is high at {util_cc_y[c]:.2f}%.")
+            if c in high_util_accounts:
+                lines.append(f"Bad:- User has high utilisation (>30%) in following accounts: {high_util_accounts[c]}.")
+            if c in new_accounts_bad:
+                lines.append(f"Bad:- User has opened new following accounts: {new_accounts_bad[c]}.")
+            if c in reporting_errors:
+                lines.append(f"Bad:- User's following accounts were reported wrongly: {reporting_errors[c]}.")
+            if c in new_inquiries:
+                lines.append(f"Bad:- User has made new inquiries with the following lenders: {new_inquiries[c]}.")
+
+            if c in delinquency_reduced:
+                lines.append(f"Good:- User's delinquency has reduced in the following accounts: {delinquency_reduced[c]}.")
+            if c in not_delinquent_anymore:
+                lines.append(f"Good:- User is no more delinquent on the following accounts: {not_delinquent_anymore[c]}.")
+            if overall_util:
+                if overall_util_change[c] < 0:
+                    lines.append(f"Good:- User's overall utilisation has decreased by {abs(overall_util_change[c]):.2f} percentage points.")
+                if cc_util_change[c] < 0:
+                    lines.append(f"Good:- User's cc utilisation has decreased by {abs(cc_util_change[c]):.2f} percentage points.")
+            if util_y_level:
+                if util_all_y[c] < 30:
+                    lines.append(f"Good:- User's overall utilisation is healthy at {util_all_y[c]:.2f}%.")
+                if util_cc_y[c] < 30:
+                    lines.append(f"Good:- User's cc utilisation is healthy at {util_cc_y[c]:.2f}%.")
+            if c in util_reduced:
+                lines.append(f"Good:- User has reduced their utilisation in the following accounts: {util_reduced[c]}.")
+            if c in low_util_accounts:
+                lines.append(f"Good:- User has utilisation less than 30% in the following accounts: {low_util_accounts[c]}.")
+            if c in fixed_reporting:
+                lines.append(f"Good:- User's following accounts were removed from their report: {fixed_reporting[c]}.")
+            if c in account_closed:
+                lines.append(f"Good:- User has closed the following accounts: {account_closed[c]}.")
+            if c in new_accounts_good:
+                lines.append(f"Good:- User has opened new following accounts: {new_accounts_good[c]}.")
+            if c in new_after_dormancy:
+                lines.append(f"Good:- User has opened new following accounts after a period of dormancy: {new_after_dormancy[c]}.")
+            narratives.append(''.join(line + '\n' for line in lines))
+        lap('assemble')
+        return narratives
+
+    def _generate_training_data_batched(self, final_result1, df_enq, profiler=None, info_reports=True):
+        """
+        Builds both text columns for all customers without iterating rows or capturing stdout.
+        Rows are stably sorted by customer so each customer keeps its original row order.
+        With info_reports=False customer_info is left empty.
+        """
+        lap = lap_timer(profiler, 'training_data', len(final_result1))
+        codes, customers = pd.factorize(final_result1['customer_no'], sort=True)
+        order = np.flatnonzero(codes >= 0)
+        order = order[np.argsort(codes[order], kind='stable')]
+        df = final_result1.iloc[order].reset_index(drop=True)
+        codes = codes[order]
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else np.array([], dtype=np.int64)
+
+        enq, enq_codes = None, None
+        if df_enq is not None and 'customer_no' in df_enq.columns:
+            all_enq_codes = pd.Index(customers).get_indexer(df_enq['customer_no'])
+            enq_order = np.flatnonzero(all_enq_codes >= 0)
+            enq_order = enq_order[np.argsort(all_enq_codes[enq_order], kind='stable')]
+            enq = df_enq.iloc[enq_order].reset_index(drop=True)
+            enq_codes = all_enq_codes[enq_order]
+        lap('sort')
+
+        if info_reports:
+            reports = self._generate_info_reports_batched(df, codes, starts, enq, enq_codes)
+            lap('info_report')
+        else:
+            reports = [''] * len(starts)
+        narratives = self._generate_update_narratives_batched(df, codes, starts, enq, enq_codes, profiler)
+        return {customer_id: (reports[c], narratives[c]) for c, customer_id in enumerate(pd.Index(customers))}
+
+    def generate_training_data(self, final_result1, df_enq=None, batched=False, profiler=None, report_renderer=None):
         """
         Processes raw data to generate a fine-tuning ready DataFrame.
+
+        With batched=True every rule is evaluated once over the whole frame instead of per
+        customer; the text is identical to the default path. Frames the batched path cannot
+        reproduce exactly (missing columns, non-object rows) fall back to the default path.
+
+        A `profiler` (profiling.Profiler) records the time, rows and memory delta of the info
+        report and of every narrative rule, as 'training_data.<step>', and counts the rules fired.
+
+        A `report_renderer` (compact_report.CompactReportRenderer) replaces customer_info with its
+        shorter, token-budgeted report; the narratives are unchanged.
         """
         if 'customer_no' not in final_result1.columns:
             raise ValueError("The input DataFrame must contain a 'customer_no' column.")
-            
+
+        # The full customer_info reports are only built when they are the ones returned.
+        info_reports = report_renderer is None
+        if batched and self._can_batch(final_result1, df_enq):
+            training_data = self._generate_training_data_batched(final_result1, df_enq, profiler, info_reports)
+        else:
+            training_data = self._generate_training_data_per_customer(final_result1, df_enq, profiler, info_reports)
+
+        training_df = pd.DataFrame.from_dict(
+            training_data, orient='index', 
+            columns=['customer_info', 'customer_credit_update']
+        ).reset_index().rename(columns={'index': 'customer_no'})
+        if report_renderer is not None:
+            lap = lap_timer(profiler, 'training_data', len(final_result1))
+            training_df['customer_info'] = training_df['customer_no'].map(report_renderer.render_all(final_result1, df_enq))
+            lap('compact_report')
+        if profiler is not None:
+            profiler.count_rules(training_df['customer_credit_update'])
+        
+        return training_df
+
+    def _build_enquiry_index(self, df_enq):
+        """
+        Sorts the enquiry table by customer once and records each customer's row range,
+        so a customer's enquiries are a positional slice (a view) instead of a full-table scan.
+        """
+        codes, customers = pd.factorize(df_enq['customer_no'])
+        order = np.flatnonzero(codes >= 0)
+        order = order[np.argsort(codes[order], kind='stable')]
+        sorted_enq = df_enq.iloc[order]
+        bounds = np.r_[0, np.cumsum(np.bincount(codes[order], minlength=len(customers)))]
+        offsets = {customer_id: (bounds[c], bounds[c + 1]) for c, customer_id in enumerate(customers)}
+        return sorted_enq, offsets
+
+    def _customer_enquiries(self, enquiry_index, customer_id):
+        """Returns the customer's enquiries (in original order) from the index, as a view."""
+        sorted_enq, offsets = enquiry_index
+        start, stop = offsets.get(customer_id, (0, 0))
+        return sorted_enq.iloc[start:stop]
+
+    def _generate_training_data_per_customer(self, final_result1, df_enq, profiler=None, info_reports=True):
+        """
+        Runs both report generators customer by customer, capturing their printed output.
+        With info_reports=False customer_info is left empty.
+        """
+        enquiry_index = None
+        if df_enq is not None and 'customer_no' in df_enq.columns:
+            enquiry_index = self._build_enquiry_index(df_enq)
+
         training_data = {}
         for customer_id, customer_group in final_result1.groupby('customer_no'):
             info_buffer = io.StringIO()
             update_buffer = io.StringIO()
             
             customer_enq_df = None
-            if df_enq is not None and 'customer_no' in df_enq.columns:
-                customer_enq_df = df_enq[df_enq['customer_no'] == customer_id].copy()
+            if enquiry_index is not None:
+                customer_enq_df = self._customer_enquiries(enquiry_index, customer_id)
             
-            self._generate_info_report(customer_group, customer_enq_df, info_buffer)
-            self._generate_update_narrative(customer_group, customer_enq_df, update_buffer) 
+            lap = lap_timer(profiler, 'training_data', len(customer_group))
+            if info_reports:
+                self._generate_info_report(customer_group, customer_enq_df, info_buffer)
+                lap('info_report')
+            self._generate_update_narrative(customer_group, customer_enq_df, update_buffer, profiler)
             
             training_data[customer_id] = (info_buffer.getvalue(), update_buffer.getvalue())
-            
-        training_df = pd.DataFrame.from_dict(
-            training_data, orient='index', 
-            columns=['customer_info', 'customer_credit_update']
-        ).reset_index().rename(columns={'index': 'customer_no'})
-        
-        return training_df
\ No newline at end of file
+        return training_data
\ No newline at end of file
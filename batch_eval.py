@@ -0,0 +1,358 @@
+# batch_eval.py
+# Scores a whole file of model narratives against the reference customer_credit_update texts,
+# instead of the notebook's one-sample-at-a-time evaluate.load('rouge') / 'bertscore' cells:
+#   python batch_eval.py responses.jsonl --references training.jsonl --bertscore --cache-dir bertscore_cache
+# ROUGE-1/2/L is the F-measure of rouge_score's RougeScorer without stemming (evaluate's
+# default) and runs across a process pool. BERTScore follows bert_score.score(lang='en') with
+# no idf or baseline rescaling: roberta-large layer 17, texts encoded as its sent_encode does,
+# greedy cosine matching. It keeps every embedding it computes in a disk cache, so comparing
+# another model against the same references only embeds the new predictions. Both are checked
+# against the reference packages in tests/test_batch_eval.py. Per-rule accuracy counts which
+# Good:-/Bad:- facts of each narrative rule (profiling.RULES) the prediction reproduced.
+import argparse
+import hashlib
+import os
+import re
+import sys
+import warnings
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from batch_inference import read_requests
+from profiling import RULES, rule_of
+
+ROUGE_TYPES = ['rouge1', 'rouge2', 'rougeL']
+_NON_ALPHANUMERIC = re.compile(r'[^a-z0-9]+')
+_SPACES = re.compile(r'\s+')
+
+
+# --- Pairs ---
+
+def load_pairs(predictions, references=None, allow_unmatched=False):
+    """
+    DataFrame of customer_no, prediction and reference. `predictions` is a batch_inference
+    output (customer_no, response) or already has prediction/reference columns; `references`
+    (generate_training_data output, a JSONL file, ...) is joined on customer_no. Each customer
+    must appear at most once on each side, and customers found on only one side raise a
+    ValueError unless `allow_unmatched`, which warns and scores the matched pairs only.
+    """
+    pairs = pd.DataFrame(read_requests(predictions)).rename(columns={'response': 'prediction'})
+    if references is not None:
+        reference_df = pd.DataFrame(read_requests(references)).rename(columns={'customer_credit_update': 'reference'})
+        for df, name in [(pairs, 'predictions'), (reference_df, 'references')]:
+            if 'customer_no' not in df.columns:
+                raise ValueError(f"The {name} need a 'customer_no' column to be joined on.")
+            df['customer_no'] = df['customer_no'].astype(str)
+            duplicated = df['customer_no'][df['customer_no'].duplicated()].unique()
+            if len(duplicated):
+                raise ValueError(f"The {name} hold {len(duplicated)} customer_no more than once, e.g. {list(duplicated[:5])}.")
+        # A left join keeps the predictions' order.
+        pairs = pairs.drop(columns=['reference'], errors='ignore').merge(
+            reference_df[['customer_no', 'reference']], on='customer_no', how='left', indicator=True, validate='one_to_one')
+        unmatched = {'predictions': pairs.loc[pairs['_merge'] == 'left_only', 'customer_no'].tolist(),
+                     'references': reference_df.loc[~reference_df['customer_no'].isin(pairs['customer_no']), 'customer_no'].tolist()}
+        if any(unmatched.values()):
+            message = '; '.join(f"{len(ids)} customer_no only in the {side}, e.g. {ids[:5]}"
+                                for side, ids in unmatched.items() if ids)
+            if not allow_unmatched:
+                raise ValueError(f"Predictions and references do not match: {message}.")
+            warnings.warn(f"Scoring matched pairs only: {message}.", stacklevel=2)
+        pairs = pairs[pairs['_merge'] == 'both'].drop(columns='_merge')
+    else:
+        pairs = pairs.rename(columns={'customer_credit_update': 'reference'})
+    missing = {'prediction', 'reference'} - set(pairs.columns)
+    if missing:
+        raise ValueError(f"Missing columns: {sorted(missing)}.")
+    if 'customer_no' not in pairs.columns:
+        pairs['customer_no'] = np.arange(len(pairs))
+    return pairs[['customer_no', 'prediction', 'reference']].fillna('').reset_index(drop=True)
+
+
+# --- ROUGE ---
+
+def _rouge_tokens(text):
+    return _NON_ALPHANUMERIC.sub(' ', text.lower()).split()
+
+
+def lcs_length(a, b):
+    """Longest common subsequence of two token lists, bit-parallel over `a` (Allison-Dix)."""
+    if not a or not b:
+        return 0
+    masks = {}
+    for i, token in enumerate(a):
+        masks[token] = masks.get(token, 0) | (1 << i)
+    full = (1 << len(a)) - 1
+    v = full
+    for token in b:
+        u = v & masks.get(token, 0)
+        v = ((v + u) | (v - u)) & full
+    return len(a) - bin(v).count('1')
+
+
+def _f_measure(overlap, n_prediction, n_reference):
+    precision = overlap / n_prediction if n_prediction else 0.0
+    recall = overlap / n_reference if n_reference else 0.0
+    return 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+
+def rouge_scores(prediction, reference):
+    """{'rouge1', 'rouge2', 'rougeL'} F-measures of one pair."""
+    pred, ref = _rouge_tokens(prediction), _rouge_tokens(reference)
+    scores = {}
+    for n, name in [(1, 'rouge1'), (2, 'rouge2')]:
+        pred_ngrams = Counter(zip(*[pred[i:] for i in range(n)]))
+        ref_ngrams = Counter(zip(*[ref[i:] for i in range(n)]))
+        overlap = sum((pred_ngrams & ref_ngrams).values())
+        scores[name] = _f_measure(overlap, sum(pred_ngrams.values()), sum(ref_ngrams.values()))
+    scores['rougeL'] = _f_measure(lcs_length(ref, pred), len(pred), len(ref))
+    return scores
+
+
+def _rouge_chunk(pairs):
+    return [rouge_scores(prediction, reference) for prediction, reference in pairs]
+
+
+def batch_rouge(predictions, references, n_workers=None, chunk_size=256):
+    """
+    ROUGE for aligned lists of texts, one row per pair. Chunks of `chunk_size` pairs go to a
+    process pool of `n_workers` (default: one per CPU); with one worker it runs inline.
+    """
+    pairs = list(zip(predictions, references))
+    n_workers = n_workers or os.cpu_count() or 1
+    chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+    if n_workers == 1 or len(chunks) <= 1:
+        results = [_rouge_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            results = list(pool.map(_rouge_chunk, chunks))
+    return pd.DataFrame([scores for chunk in results for scores in chunk], columns=ROUGE_TYPES)
+
+
+# --- BERTScore ---
+# An embedder has `name` (part of the cache key) and embed(texts) -> one (tokens x dim) float
+# array per text whose first and last rows are the special tokens bert_score wraps every text
+# in (<s> ... </s> for RoBERTa). bert_score matches tokens against them but gives them no weight.
+
+class TransformersEmbedder:
+    """
+    Hidden states of layer `num_layers` of a Hugging Face encoder, tokenized as bert_score's
+    sent_encode does: the slow tokenizer, stripped text, a prefix space for RoBERTa/GPT-2 and
+    truncation at the tokenizer's model_max_length.
+    """
+
+    def __init__(self, model_type='roberta-large', num_layers=17, batch_size=32, device=None):
+        import torch
+        from transformers import AutoModel, AutoTokenizer, GPT2Tokenizer, RobertaTokenizer
+        self.name = f'{model_type}/L{num_layers}'
+        self.num_layers = num_layers
+        self.batch_size = batch_size
+        self.device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
+        self.tokenizer = AutoTokenizer.from_pretrained(model_type, use_fast=False)
+        self._prefix_space = isinstance(self.tokenizer, (GPT2Tokenizer, RobertaTokenizer))
+        self.model = AutoModel.from_pretrained(model_type).to(self.device).eval()
+
+    def encode(self, text):
+        """Token ids of one text, special tokens included."""
+        text = text.strip()
+        if not text:
+            # transformers 5 tokenizers no longer have build_inputs_with_special_tokens.
+            if hasattr(self.tokenizer, 'build_inputs_with_special_tokens'):
+                return self.tokenizer.build_inputs_with_special_tokens([])
+            return [self.tokenizer.cls_token_id, self.tokenizer.sep_token_id]
+        extra = {'add_prefix_space': True} if self._prefix_space else {}
+        return self.tokenizer.encode(text, add_special_tokens=True, max_length=self.tokenizer.model_max_length,
+                                     truncation=True, **extra)
+
+    def embed(self, texts):
+        import torch
+        embeddings = []
+        for offset in range(0, len(texts), self.batch_size):
+            ids = [self.encode(text) for text in texts[offset:offset + self.batch_size]]
+            lengths = [len(row) for row in ids]
+            input_ids = torch.full((len(ids), max(lengths)), self.tokenizer.pad_token_id, dtype=torch.long)
+            attention_mask = torch.zeros_like(input_ids)
+            for i, row in enumerate(ids):
+                input_ids[i, :len(row)] = torch.tensor(row, dtype=torch.long)
+                attention_mask[i, :len(row)] = 1
+            with torch.no_grad():
+                hidden = self.model(input_ids.to(self.device), attention_mask=attention_mask.to(self.device),
+                                    output_hidden_states=True).hidden_states[self.num_layers]
+            hidden = hidden.float().cpu().numpy()
+            embeddings.extend(hidden[i, :length] for i, length in enumerate(lengths))
+        return embeddings
+
+
+class BertScorer:
+    """
+    BERTScore precision/recall/F1 per pair with cached embeddings. Every text is embedded once:
+    embeddings are kept in memory and, with `cache_dir`, as float16 .npy files keyed by the
+    embedder name and the text, so references (and unchanged predictions) are not re-embedded
+    by later runs. `stats` counts texts embedded and cache hits.
+    """
+
+    def __init__(self, embedder=None, cache_dir=None):
+        self.embedder = embedder if embedder is not None else TransformersEmbedder()
+        self.cache_dir = cache_dir
+        self.stats = {'embedded': 0, 'memory_hits': 0, 'disk_hits': 0}
+        self._memory = {}
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.npy')
+
+    def _key(self, text):
+        # 'cls-sep': the embeddings keep the special tokens (older cache entries did not).
+        return hashlib.sha256(f'{self.embedder.name}\0cls-sep\0{text}'.encode('utf-8')).hexdigest()
+
+    def embeddings(self, texts):
+        """Unit-normalised token embeddings of each text, embedding only those not cached."""
+        keys = [self._key(text) for text in texts]
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key in self._memory:
+                self.stats['memory_hits'] += 1
+            elif self.cache_dir is not None and os.path.exists(self._path(key)):
+                self._memory[key] = np.load(self._path(key)).astype(np.float32)
+                self.stats['disk_hits'] += 1
+            else:
+                missing[key] = text
+        if missing:
+            # Longest first, so each embedding batch holds texts of similar length.
+            order = sorted(missing, key=lambda key: -len(missing[key]))
+            for key, embedding in zip(order, self.embedder.embed([missing[key] for key in order])):
+                embedding = np.asarray(embedding, dtype=np.float32)
+                embedding /= np.maximum(np.linalg.norm(embedding, axis=1, keepdims=True), 1e-12)
+                self._memory[key] = embedding
+                if self.cache_dir is not None:
+                    os.makedirs(os.path.dirname(self._path(key)), exist_ok=True)
+                    np.save(self._path(key), embedding.astype(np.float16))
+            self.stats['embedded'] += len(missing)
+        return [self._memory[key] for key in keys]
+
+    def score(self, predictions, references):
+        """DataFrame of bertscore_precision, bertscore_recall and bertscore_f1 per pair."""
+        predictions, references = list(predictions), list(references)
+        embedded = self.embeddings(predictions + references)
+        rows = []
+        for candidate, reference in zip(embedded[:len(predictions)], embedded[len(predictions):]):
+            # Only the special tokens: bert_score warns and gives NaN, this reports 0.
+            if len(candidate) <= 2 or len(reference) <= 2:
+                rows.append((0.0, 0.0, 0.0))
+                continue
+            similarity = candidate @ reference.T
+            precision = float(similarity[1:-1].max(axis=1).mean())
+            recall = float(similarity[:, 1:-1].max(axis=0).mean())
+            rows.append((precision, recall, 2 * precision * recall / (precision + recall) if precision + recall else 0.0))
+        return pd.DataFrame(rows, columns=['bertscore_precision', 'bertscore_recall', 'bertscore_f1'])
+
+
+# --- Per-rule accuracy ---
+
+def _facts(text):
+    """{rule: set of whitespace-normalised lines} of a narrative; lines of no rule under None."""
+    facts = {}
+    for line in text.splitlines():
+        line = _SPACES.sub(' ', line).strip()
+        if line:
+            facts.setdefault(rule_of(line), set()).add(line)
+    return facts
+
+
+def rule_accuracy(predictions, references):
+    """
+    Per pair: the reference's rules, how many the prediction also fired (hit) and how many of
+    its lines it reproduced exactly. Per rule: support (references with it), predicted, hit,
+    exact, recall, precision and exact rate. Returns (per-pair frame, per-rule frame).
+    """
+    counts = {rule: {'support': 0, 'predicted': 0, 'hit': 0, 'exact': 0} for rule, _ in RULES}
+    per_pair = []
+    for prediction, reference in zip(predictions, references):
+        predicted, expected = _facts(prediction), _facts(reference)
+        unknown = len(predicted.pop(None, ()))
+        expected.pop(None, None)
+        hits = exact = 0
+        for rule in set(predicted) | set(expected):
+            counts[rule]['support'] += rule in expected
+            counts[rule]['predicted'] += rule in predicted
+            if rule in expected and rule in predicted:
+                counts[rule]['hit'] += 1
+                hits += 1
+                if predicted[rule] == expected[rule]:
+                    counts[rule]['exact'] += 1
+                    exact += 1
+        per_pair.append({'reference_rules': len(expected), 'predicted_rules': len(predicted), 'rules_hit': hits,
+                         'rules_exact': exact, 'unrecognised_lines': unknown})
+    rules = pd.DataFrame.from_dict(counts, orient='index')
+    rules.index.name = 'rule'
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rules['recall'] = rules['hit'] / rules['support']
+        rules['precision'] = rules['hit'] / rules['predicted']
+        rules['exact_rate'] = rules['exact'] / rules['support']
+    return pd.DataFrame(per_pair), rules
+
+
+# --- Everything ---
+
+def evaluate_pairs(pairs, bert_scorer=None, n_workers=None):
+    """
+    Scores load_pairs() output. Returns (per-pair scores, per-rule accuracy, summary dict of
+    mean ROUGE / BERTScore and micro-averaged fact recall and precision).
+    """
+    predictions, references = pairs['prediction'].tolist(), pairs['reference'].tolist()
+    parts = [pairs[['customer_no']], batch_rouge(predictions, references, n_workers)]
+    if bert_scorer is not None:
+        parts.append(bert_scorer.score(predictions, references))
+    per_pair_rules, rules = rule_accuracy(predictions, references)
+    scores = pd.concat(parts + [per_pair_rules], axis=1)
+    summary = {'pairs': len(scores)}
+    summary.update({col: float(scores[col].mean()) for col in scores.columns if col.startswith(('rouge', 'bertscore'))})
+    summary['fact_recall'] = rules['hit'].sum() / rules['support'].sum() if rules['support'].sum() else float('nan')
+    summary['fact_precision'] = rules['hit'].sum() / rules['predicted'].sum() if rules['predicted'].sum() else float('nan')
+    summary['exact_fact_rate'] = rules['exact'].sum() / rules['support'].sum() if rules['support'].sum() else float('nan')
+    return scores, rules, summary
+
+
+def format_report(rules, summary):
+    lines = [f"{summary['pairs']} pairs"]
+    lines += [f"{name:<22} {value:.4f}" for name, value in summary.items() if name != 'pairs']
+    lines += ['', f"{'rule':<30} {'support':>8} {'predicted':>10} {'recall':>7} {'precision':>10} {'exact':>6}"]
+    for rule, row in rules[(rules['support'] > 0) | (rules['predicted'] > 0)].iterrows():
+        lines.append(f"{rule:<30} {row['support']:>8} {row['predicted']:>10} {row['recall']:>7.0%} {row['precision']:>10.0%} "
+                     f"{row['exact_rate']:>6.0%}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ROUGE, BERTScore and per-rule accuracy of model narratives.')
+    parser.add_argument('predictions', help='JSONL of customer_no + response (batch_inference output), or with a reference column')
+    parser.add_argument('--references', help='JSONL of customer_no + customer_credit_update to join on customer_no')
+    parser.add_argument('--allow-unmatched', action='store_true',
+                        help='score only the customers found in both files instead of failing on the others')
+    parser.add_argument('--output', help='CSV file for the per-pair scores')
+    parser.add_argument('--workers', type=int, help='ROUGE processes (default: one per CPU)')
+    parser.add_argument('--bertscore', action='store_true', help='also compute BERTScore (needs torch and transformers)')
+    parser.add_argument('--bertscore-model', default='roberta-large')
+    parser.add_argument('--bertscore-layer', type=int, default=17)
+    parser.add_argument('--cache-dir', help='directory of cached BERTScore embeddings, shared between runs')
+    args = parser.parse_args(argv)
+
+    pairs = load_pairs(args.predictions, args.references, args.allow_unmatched)
+    scorer = None
+    if args.bertscore:
+        scorer = BertScorer(TransformersEmbedder(args.bertscore_model, args.bertscore_layer), cache_dir=args.cache_dir)
+    scores, rules, summary = evaluate_pairs(pairs, scorer, args.workers)
+    if args.output:
+        scores.to_csv(args.output, index=False)
+    print(format_report(rules, summary))
+    if scorer is not None:
+        print(f"bertscore embeddings: {scorer.stats['embedded']} computed, "
+              f"{scorer.stats['memory_hits'] + scorer.stats['disk_hits']} cached")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
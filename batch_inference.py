@@ -0,0 +1,371 @@
+# batch_inference.py
+# Offline inference over many customers at once. Requests (generate_training_data output, or a
+# JSONL file with one customer_info per line) become chat prompts, are sorted by token length
+# within a window so each batch pads as little as possible, run through a backend in batches,
+# and come back in input order as soon as each one is ready:
+#   python batch_inference.py requests.jsonl responses.jsonl --backend vllm --model Dushyant4342/ft-llama3-8b-credit-analyst
+# Backends: TransformersBackend (model.generate on a padded batch), VLLMBackend (llm.generate),
+# TinyBackend, a small numpy stand-in that runs on CPU without model weights, and MockBackend,
+# which only sleeps, for scheduling tests.
+import argparse
+import json
+import re
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from prompts import SYSTEM_PROMPT, render_llama3_chat, to_chat_messages
+from response_cache import ResponseCache, is_cacheable
+
+DEFAULT_MAX_NEW_TOKENS = 250
+
+
+# --- Backends ---
+# A backend has apply_chat_template(messages) -> prompt text, count_tokens(prompts) -> list of
+# lengths and generate(prompts, max_new_tokens, temperature, top_p) -> list of
+# (response text, generated token count), in the order of `prompts`.
+
+class TransformersBackend:
+    """A Hugging Face causal LM and its tokenizer, generating one left-padded batch per call."""
+
+    def __init__(self, model, tokenizer):
+        self.model = model
+        self.tokenizer = tokenizer
+        tokenizer.padding_side = 'left'
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        self.eos_token_id = [tokenizer.eos_token_id, tokenizer.convert_tokens_to_ids('<|eot_id|>')]
+
+    @classmethod
+    def from_pretrained(cls, model_id, **model_kwargs):
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+        model_kwargs.setdefault('torch_dtype', torch.bfloat16)
+        model_kwargs.setdefault('device_map', 'auto')
+        model = AutoModelForCausalLM.from_pretrained(model_id, **model_kwargs)
+        model.eval()
+        return cls(model, AutoTokenizer.from_pretrained(model_id))
+
+    def apply_chat_template(self, messages):
+        return self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+    def count_tokens(self, prompts):
+        # The chat template already starts with <|begin_of_text|>, so no special tokens are added.
+        return [len(ids) for ids in self.tokenizer(list(prompts), add_special_tokens=False)['input_ids']]
+
+    def generate(self, prompts, max_new_tokens, temperature, top_p):
+        import torch
+        inputs = self.tokenizer(list(prompts), return_tensors='pt', padding=True, add_special_tokens=False).to(self.model.device)
+        sampling = {'do_sample': True, 'temperature': temperature, 'top_p': top_p} if temperature > 0 else {'do_sample': False}
+        with torch.no_grad():
+            outputs = self.model.generate(**inputs, max_new_tokens=max_new_tokens, eos_token_id=self.eos_token_id,
+                                          pad_token_id=self.tokenizer.pad_token_id, **sampling)
+        new_tokens = outputs[:, inputs['input_ids'].shape[-1]:]
+        texts = self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+        counts = (new_tokens != self.tokenizer.pad_token_id).sum(dim=1).tolist()
+        return list(zip(texts, counts))
+
+
+class VLLMBackend:
+    """A vllm.LLM; it schedules each batch it is given with continuous batching."""
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.tokenizer = llm.get_tokenizer()
+
+    @classmethod
+    def from_pretrained(cls, model_id, **llm_kwargs):
+        from vllm import LLM
+        llm_kwargs.setdefault('tensor_parallel_size', 1)
+        return cls(LLM(model=model_id, **llm_kwargs))
+
+    def apply_chat_template(self, messages):
+        return self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+    def count_tokens(self, prompts):
+        return [len(ids) for ids in self.tokenizer(list(prompts), add_special_tokens=False)['input_ids']]
+
+    def generate(self, prompts, max_new_tokens, temperature, top_p):
+        from vllm import SamplingParams
+        params = SamplingParams(temperature=temperature, top_p=top_p if temperature > 0 else 1.0, max_tokens=max_new_tokens)
+        outputs = self.llm.generate(list(prompts), params, use_tqdm=False)
+        return [(output.outputs[0].text, len(output.outputs[0].token_ids)) for output in outputs]
+
+
+class TinyBackend:
+    """
+    CPU stand-in with the cost structure of a decoder: a word-level tokenizer and a one-layer
+    numpy attention model that decodes token by token over a left-padded batch. Each step
+    reads the whole output projection once per call, like a real model reads its weights, so
+    batching pays off and padding costs compute; finished rows leave the batch. Responses are
+    min_new_tokens plus a geometric tail (mean eos_every) of token names (tok123 ...), not
+    text. Greedy output is the same whatever batch a prompt lands in; sampling
+    (temperature > 0) ignores top_p.
+    """
+    _TOKEN = re.compile(r"<\|[a-z_]+\|>|\w+|[^\w\s]")
+
+    def __init__(self, vocab_size=16384, dim=128, min_new_tokens=40, eos_every=40, seed=0):
+        rng = np.random.default_rng(seed)
+        self.vocab_size = vocab_size
+        self.embedding = (rng.standard_normal((vocab_size, dim)) / np.sqrt(dim)).astype(np.float32)
+        # Stored (vocab, dim): with the batch as the short side, BLAS reads it once per step.
+        self.output = rng.standard_normal((vocab_size, dim)).astype(np.float32)
+        self.min_new_tokens = min_new_tokens
+        self.eos_every = eos_every
+
+    def apply_chat_template(self, messages):
+        return render_llama3_chat(messages)
+
+    def encode(self, text):
+        return [2 + zlib.crc32(token.encode()) % (self.vocab_size - 2) for token in self._TOKEN.findall(text)]
+
+    def count_tokens(self, prompts):
+        return [len(self.encode(prompt)) for prompt in prompts]
+
+    def generate(self, prompts, max_new_tokens, temperature, top_p):
+        encoded = [self.encode(prompt) for prompt in prompts]
+        n, width = len(encoded), max(len(ids) for ids in encoded)
+        context = np.zeros((n, width + max_new_tokens, self.embedding.shape[1]), dtype=np.float32)
+        valid = np.zeros((n, width + max_new_tokens), dtype=bool)
+        for row, ids in enumerate(encoded):
+            context[row, width - len(ids):width] = self.embedding[ids]
+            valid[row, width - len(ids):width] = True
+        last = np.array([ids[-1] for ids in encoded])
+        rng = np.random.default_rng(0)
+        generated = [[] for _ in range(n)]
+        rows = np.arange(n)  # prompt of each batch row; finished rows are dropped from the batch
+        for step in range(max_new_tokens):
+            length = width + step
+            query = self.embedding[last]
+            scores = np.matmul(context[:, :length], query[:, :, None])[:, :, 0]
+            scores = np.where(valid[:, :length], scores, -np.inf)
+            weights = np.exp(scores - scores.max(axis=1, keepdims=True))
+            weights /= weights.sum(axis=1, keepdims=True)
+            hidden = np.matmul(weights[:, None, :], context[:, :length])[:, 0] + query
+            # Rounded so that summation-order noise between batch shapes cannot flip an argmax.
+            logits = np.round((self.output @ hidden.T).T, 3)
+            if temperature > 0:
+                probs = np.exp((logits - logits.max(axis=1, keepdims=True)) / temperature)
+                cumulative = (probs / probs.sum(axis=1, keepdims=True)).cumsum(axis=1)
+                tokens = np.minimum((cumulative < rng.random((len(rows), 1))).sum(axis=1), self.vocab_size - 1)
+            else:
+                tokens = logits.argmax(axis=1)
+            finished = (tokens % self.eos_every == 0) & (step >= self.min_new_tokens)
+            tokens = np.maximum(tokens, 2)
+            for row, token in zip(rows[~finished], tokens[~finished]):
+                generated[row].append(int(token))
+            if finished.all():
+                break
+            context[:, length] = self.embedding[tokens]
+            valid[:, length] = True
+            if finished.any():
+                keep = ~finished
+                context, valid, tokens, rows = context[keep], valid[keep], tokens[keep], rows[keep]
+            last = tokens
+        return [(' '.join(f'tok{t}' for t in ids), len(ids)) for ids in generated]
+
+
+class MockBackend:
+    """
+    Stand-in for scheduling tests: sleeps `seconds_per_call` + `seconds_per_prompt` per prompt
+    (as a GPU-bound generate call would, without holding the GIL) and answers each prompt with
+    respond(prompt), by default a short text derived from the prompt.
+    """
+
+    def __init__(self, seconds_per_call=0.05, seconds_per_prompt=0.005, respond=None):
+        self.seconds_per_call = seconds_per_call
+        self.seconds_per_prompt = seconds_per_prompt
+        self.respond = respond or (lambda prompt: f"response {zlib.crc32(prompt.encode()):08x}")
+        self.calls = 0
+
+    def apply_chat_template(self, messages):
+        return render_llama3_chat(messages)
+
+    def count_tokens(self, prompts):
+        return [len(prompt.split()) for prompt in prompts]
+
+    def generate(self, prompts, max_new_tokens, temperature, top_p):
+        self.calls += 1
+        time.sleep(self.seconds_per_call + self.seconds_per_prompt * len(prompts))
+        return [(text, len(text.split())) for text in map(self.respond, prompts)]
+
+
+# --- Requests ---
+
+def read_requests(source):
+    """
+    Request dicts from a generate_training_data DataFrame, a JSONL path (one object per line,
+    e.g. ShardedTrainingDataBuilder output) or any iterable of dicts. Each needs customer_info;
+    customer_no, user_command and system_prompt are optional.
+    """
+    if isinstance(source, pd.DataFrame):
+        return source.to_dict('records')
+    if isinstance(source, str):
+        with open(source, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    return list(source)
+
+
+class BatchInference:
+    """
+    Runs requests through `backend` in length-bucketed batches. Every `window` requests (in
+    input order) are sorted by prompt length and cut into batches of at most `batch_size`
+    prompts and `max_batch_tokens` padded prompt tokens; results are yielded in input order.
+    A larger window pads less but holds results back longer. `stats` accumulates over runs.
+    With a response_cache.ResponseCache as `cache`, greedy requests it already answered skip
+    generation (their results have cached=True and stay out of the token counts).
+    """
+
+    def __init__(self, backend, batch_size=16, max_batch_tokens=None, window=512, sort_by_length=True,
+                 max_new_tokens=DEFAULT_MAX_NEW_TOKENS, temperature=0.0, top_p=1.0,
+                 system_prompt=SYSTEM_PROMPT, user_command=None, cache=None):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.window = window
+        self.sort_by_length = sort_by_length
+        self.sampling = {'max_new_tokens': max_new_tokens, 'temperature': temperature, 'top_p': top_p}
+        self.system_prompt = system_prompt
+        self.user_command = user_command
+        self.cache = cache
+        self.stats = {'prompts': 0, 'batches': 0, 'prompt_tokens': 0, 'padded_prompt_tokens': 0,
+                      'generated_tokens': 0, 'cached': 0, 'seconds': 0.0}
+
+    def prompt(self, request):
+        messages = to_chat_messages(request['customer_info'], system_prompt=request.get('system_prompt') or self.system_prompt,
+                                    user_command=request.get('user_command') or self.user_command)
+        return self.backend.apply_chat_template(messages)
+
+    def _cache_keys(self, chunk):
+        """Cache key per request, or None per request when there is no cache or sampling is on."""
+        if self.cache is None:
+            return [None] * len(chunk)
+        if not is_cacheable(self.sampling):
+            self.cache.bypass(len(chunk))
+            return [None] * len(chunk)
+        return [self.cache.key(request['customer_info'], request.get('system_prompt') or self.system_prompt,
+                               request.get('user_command') or self.user_command, self.sampling) for request in chunk]
+
+    def _batches(self, lengths):
+        """Lists of positions into `lengths`, shortest prompts first when sorting."""
+        order = np.argsort(lengths, kind='stable') if self.sort_by_length else np.arange(len(lengths))
+        batches, batch, longest = [], [], 0
+        for i in order:
+            longest_with_i = max(longest, lengths[i])
+            too_many_tokens = self.max_batch_tokens is not None and longest_with_i * (len(batch) + 1) > self.max_batch_tokens
+            if batch and (len(batch) == self.batch_size or too_many_tokens):
+                batches.append(batch)
+                batch, longest_with_i = [], lengths[i]
+            batch.append(int(i))
+            longest = longest_with_i
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def stream(self, requests):
+        """Yields one result dict per request, in input order."""
+        requests = read_requests(requests)
+        start = time.perf_counter() - self.stats['seconds']
+        for offset in range(0, len(requests), self.window):
+            chunk = requests[offset:offset + self.window]
+            keys = self._cache_keys(chunk)
+            ready, pending = {}, []
+            for i, key in enumerate(keys):
+                value = None if key is None else self.cache.get(key)
+                if value is None:
+                    pending.append(i)
+                else:
+                    ready[i] = {'customer_no': chunk[i].get('customer_no', offset + i), **value, 'cached': True}
+            prompts = [self.prompt(chunk[i]) for i in pending]
+            lengths = self.backend.count_tokens(prompts) if prompts else []
+            next_index = 0
+            # The empty first batch releases any leading cache hits before generating.
+            for batch in [[]] + self._batches(lengths):
+                if batch:
+                    outputs = self.backend.generate([prompts[j] for j in batch], **self.sampling)
+                    self.stats['batches'] += 1
+                    self.stats['padded_prompt_tokens'] += max(lengths[j] for j in batch) * len(batch)
+                    for j, (text, n_tokens) in zip(batch, outputs):
+                        i = pending[j]
+                        value = {'response': text, 'prompt_tokens': lengths[j], 'generated_tokens': n_tokens}
+                        if keys[i] is not None:
+                            self.cache.put(keys[i], value)
+                        ready[i] = {'customer_no': chunk[i].get('customer_no', offset + i), **value}
+                        if self.cache is not None:
+                            ready[i]['cached'] = False
+                while next_index in ready:
+                    result = ready.pop(next_index)
+                    self.stats['prompts'] += 1
+                    if result.get('cached'):
+                        self.stats['cached'] += 1
+                    else:
+                        self.stats['prompt_tokens'] += result['prompt_tokens']
+                        self.stats['generated_tokens'] += result['generated_tokens']
+                    self.stats['seconds'] = time.perf_counter() - start
+                    next_index += 1
+                    yield result
+
+    def run(self, requests):
+        return list(self.stream(requests))
+
+    def throughput(self):
+        """Prompts/sec, generated and prompt tokens/sec and the share of padded prompt slots that were real tokens."""
+        seconds = self.stats['seconds'] or float('nan')
+        padded = self.stats['padded_prompt_tokens'] or float('nan')
+        return {'prompts_per_sec': self.stats['prompts'] / seconds,
+                'generated_tokens_per_sec': self.stats['generated_tokens'] / seconds,
+                'prompt_tokens_per_sec': self.stats['prompt_tokens'] / seconds,
+                'padding_efficiency': self.stats['prompt_tokens'] / padded}
+
+
+def one_at_a_time(backend, requests, max_new_tokens=DEFAULT_MAX_NEW_TOKENS, temperature=0.0, top_p=1.0,
+                  system_prompt=SYSTEM_PROMPT, user_command=None):
+    """The notebook loop: one chat prompt and one generate call per request. For comparison."""
+    results = []
+    for request in read_requests(requests):
+        messages = to_chat_messages(request['customer_info'], system_prompt=system_prompt, user_command=user_command)
+        [(text, n_tokens)] = backend.generate([backend.apply_chat_template(messages)], max_new_tokens, temperature, top_p)
+        results.append({'customer_no': request.get('customer_no'), 'response': text, 'generated_tokens': n_tokens})
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Batched offline inference over customer_info requests.')
+    parser.add_argument('requests', help='JSONL file with one customer_info per line')
+    parser.add_argument('output', help='JSONL file for the responses, in input order')
+    parser.add_argument('--backend', choices=['transformers', 'vllm', 'tiny'], default='transformers')
+    parser.add_argument('--model', default='Dushyant4342/ft-llama3-8b-credit-analyst')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--max-batch-tokens', type=int)
+    parser.add_argument('--window', type=int, default=512)
+    parser.add_argument('--max-new-tokens', type=int, default=DEFAULT_MAX_NEW_TOKENS)
+    parser.add_argument('--temperature', type=float, default=0.0)
+    parser.add_argument('--top-p', type=float, default=1.0)
+    parser.add_argument('--user-command')
+    parser.add_argument('--cache-dir', help='directory of cached greedy responses, shared between runs')
+    parser.add_argument('--cache-ttl-days', type=float, default=30)
+    args = parser.parse_args(argv)
+
+    if args.backend == 'tiny':
+        backend = TinyBackend()
+    else:
+        backend = {'transformers': TransformersBackend, 'vllm': VLLMBackend}[args.backend].from_pretrained(args.model)
+    engine = BatchInference(backend, batch_size=args.batch_size, max_batch_tokens=args.max_batch_tokens, window=args.window,
+                            max_new_tokens=args.max_new_tokens, temperature=args.temperature, top_p=args.top_p,
+                            user_command=args.user_command,
+                            cache=ResponseCache(directory=args.cache_dir, ttl_seconds=args.cache_ttl_days * 24 * 3600,
+                                                namespace=args.model) if args.cache_dir else None)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        for result in engine.stream(args.requests):
+            f.write(json.dumps(result, ensure_ascii=False, default=str) + '\n')
+    rates = engine.throughput()
+    print(f"{engine.stats['prompts']} prompts in {engine.stats['seconds']:.1f}s: {rates['prompts_per_sec']:.2f} prompts/sec, "
+          f"{rates['generated_tokens_per_sec']:.1f} generated tokens/sec, padding efficiency {rates['padding_efficiency']:.0%}")
+    if engine.cache is not None:
+        print(f"cache: {engine.cache.summary()}")
+
+
+if __name__ == '__main__':
+    main()
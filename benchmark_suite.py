@@ -0,0 +1,144 @@
+# benchmark_suite.py
+# End-to-end benchmark of the data-preparation pipeline on synthetic bureau data
+# (synthetic_data.py): wall time, rows/sec and peak memory per stage at several sizes, saved as
+# a JSON baseline that later commits are compared against. Run from the repo folder:
+#   python benchmark_suite.py --save baseline.json                 # 1k / 100k / 1M account rows
+#   python benchmark_suite.py --sizes 1000 100000 --compare baseline.json
+# --compare exits with status 1 when a stage got slower (or hungrier) than --tolerance allows.
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+import synthetic_data
+from benchmarks import _peak_memory
+from module_loader import load_module
+
+CustomerScoreAnalyzer = load_module('1.customer_analyzer.py').CustomerScoreAnalyzer
+CreditFeatureEngineer = load_module('1.credit_feature_engineer.py').CreditFeatureEngineer
+
+SIZES = (1_000, 100_000, 1_000_000)
+# The per-customer narrative loop takes ~20 ms a customer; above this many account rows it is
+# skipped (the batched path is what large runs use).
+PER_CUSTOMER_MAX_ROWS = 10_000
+
+
+def _stages(accounts, enquiries):
+    """
+    (name, fn) in pipeline order. Each fn runs one stage from scratch; the narrative stages read
+    the features of the first one, computed once up front.
+    """
+    engineer = CreditFeatureEngineer()
+    analyzer = CustomerScoreAnalyzer()
+    features = engineer.create_features(accounts)
+    stages = [('create_features', lambda: engineer.create_features(accounts)),
+              ('create_features[low_memory]', lambda: engineer.create_features(accounts, low_memory=True)),
+              ('generate_training_data[batched]', lambda: analyzer.generate_training_data(features, enquiries, batched=True))]
+    if len(accounts) <= PER_CUSTOMER_MAX_ROWS:
+        stages.append(('generate_training_data', lambda: analyzer.generate_training_data(features, enquiries)))
+    return stages
+
+
+def _run(fn, memory, repeat=3, budget_s=5.0):
+    """
+    (seconds, peak bytes or None) for one stage. The time is the best of up to `repeat` calls,
+    stopping once the stage has used `budget_s`, so short stages are not at the mercy of one
+    noisy call; the peak comes from one more, traced call.
+    """
+    times = []
+    while len(times) < repeat and sum(times) < budget_s:
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    if not memory:
+        return min(times), None
+    peak, _ = _peak_memory(fn)
+    return min(times), peak
+
+
+def run_suite(sizes=SIZES, seed=0, memory=True, repeat=3):
+    """Benchmarks every stage at every size and returns the baseline document."""
+    results = []
+    for n_rows in sizes:
+        start = time.perf_counter()
+        accounts = synthetic_data.merged_accounts(n_rows, seed)
+        enquiries = synthetic_data.enquiries(accounts, seed)
+        n_customers = int(accounts['customer_no'].nunique())
+        print(f"\n## {n_rows:,} account rows, {n_customers:,} customers, {len(enquiries):,} enquiries "
+              f"(generated in {time.perf_counter() - start:.1f}s)")
+        print(f"{'stage':>32} {'wall (s)':>9} {'rows/sec':>11} {'peak (MB)':>10}")
+        for stage, fn in _stages(accounts, enquiries):
+            seconds, peak = _run(fn, memory, repeat)
+            result = {'rows': n_rows, 'customers': n_customers, 'stage': stage, 'seconds': round(seconds, 4),
+                      'rows_per_sec': round(n_rows / seconds, 1), 'peak_mb': None if peak is None else round(peak / 1024 ** 2, 1)}
+            results.append(result)
+            peak_text = '-' if peak is None else f"{result['peak_mb']:.1f}"
+            print(f"{stage:>32} {seconds:>9.3f} {result['rows_per_sec']:>11,.0f} {peak_text:>10}")
+    return {'created': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'commit': _git_commit(), 'seed': seed, 'repeat': repeat,
+            'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+            'machine': platform.machine(), 'results': results}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, tolerance=0.10, min_seconds=0.5):
+    """
+    Prints current/baseline ratios for the (rows, stage) pairs both runs have and returns the
+    ones where wall time or peak memory grew by more than `tolerance`. Stages that took under
+    `min_seconds` in the baseline are too noisy to flag on time alone.
+    """
+    previous = {(r['rows'], r['stage']): r for r in baseline['results']}
+    regressions = []
+    print(f"\n## Against baseline {baseline.get('commit') or '?'} ({baseline.get('created', '?')})")
+    print(f"{'rows':>10} {'stage':>32} {'time':>7} {'memory':>7}")
+    for result in current['results']:
+        old = previous.get((result['rows'], result['stage']))
+        if old is None:
+            continue
+        time_ratio = result['seconds'] / old['seconds']
+        memory_ratio = result['peak_mb'] / old['peak_mb'] if result['peak_mb'] and old['peak_mb'] else None
+        slower = (time_ratio > 1 + tolerance and old['seconds'] >= min_seconds) or (memory_ratio is not None and memory_ratio > 1 + tolerance)
+        if slower:
+            regressions.append(result)
+        memory_text = '-' if memory_ratio is None else f'{memory_ratio:.2f}x'
+        print(f"{result['rows']:>10,} {result['stage']:>32} {time_ratio:>6.2f}x {memory_text:>7}{'  REGRESSION' if slower else ''}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the data-preparation pipeline on synthetic bureau data.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help='account rows per run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='timed calls per stage (best one counts)')
+    parser.add_argument('--no-memory', action='store_true', help='skip the traced run that measures peak memory')
+    parser.add_argument('--save', metavar='JSON', help='write the results as a baseline file')
+    parser.add_argument('--compare', metavar='JSON', help='baseline file to compare the results against')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='allowed slowdown before a stage is flagged')
+    parser.add_argument('--min-seconds', type=float, default=0.5, help='baseline wall time below which slowdowns are not flagged')
+    args = parser.parse_args(argv)
+
+    current = run_suite(args.sizes, args.seed, memory=not args.no_memory, repeat=args.repeat)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, current, args.tolerance, args.min_seconds):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
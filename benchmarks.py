@@ -0,0 +1,357 @@
+# benchmarks.py
+# Micro-benchmarks for the data-preparation stage. Run from the repo folder:
+#   python benchmarks.py [merged_pull.parquet]
+# The optional file (a merged x/y account pull, as fed to create_features) enables the
+# peak-memory comparison.
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from module_loader import load_module
+
+CustomerScoreAnalyzer = load_module('1.customer_analyzer.py').CustomerScoreAnalyzer
+CreditFeatureEngineer = load_module('1.credit_feature_engineer.py').CreditFeatureEngineer
+import synthetic_data
+from batch_eval import batch_rouge, rule_accuracy
+from batch_inference import BatchInference, MockBackend, TinyBackend, one_at_a_time
+from compact_report import CompactReportRenderer, format_savings, token_savings
+from packed_dataset import PackedSFTDataset, export_packed_dataset, tokenize_conversations
+from realtime import RealtimeAnalyzer
+from response_cache import ResponseCache, normalize_report
+from two_stage_pipeline import TwoStageScheduler, run_sequential
+
+
+def _timed(fn, *args, **kwargs):
+    """Returns (seconds, result) for a single call."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def bench_training_data(n_rows=5_000):
+    """
+    generate_training_data per customer (iterrows + redirect_stdout) against batched=True, on
+    synthetic accounts and enquiries. Both text columns must be identical.
+    """
+    accounts = synthetic_data.merged_accounts(n_rows)
+    enquiries = synthetic_data.enquiries(accounts)
+    features = CreditFeatureEngineer().create_features(accounts)
+    analyzer = CustomerScoreAnalyzer()
+    per_customer_s, expected = _timed(analyzer.generate_training_data, features, enquiries)
+    batched_s, batched = _timed(analyzer.generate_training_data, features, enquiries, batched=True)
+    pd.testing.assert_frame_equal(batched, expected)
+
+    print(f"\n## Training data ({n_rows:,} account rows, {len(expected):,} customers)")
+    print(f"per customer: {per_customer_s:.2f}s  batched: {batched_s:.2f}s  speedup: {per_customer_s / batched_s:.1f}x")
+
+
+def _random_enquiries(n_customers, enquiries_per_customer, seed=0):
+    """A shuffled enquiry table with the columns the analyzer reads."""
+    rng = np.random.default_rng(seed)
+    n_rows = n_customers * enquiries_per_customer
+    return pd.DataFrame({
+        'customer_no': rng.permutation(np.repeat(np.arange(n_customers), enquiries_per_customer)),
+        'subscriber_name': rng.choice(['HDFC BANK', 'SBI', 'BAJAJ FIN LTD', 'IDFC FIRST BANK'], n_rows),
+        'loan_type': rng.choice(['Credit Card', 'Personal Loan', 'Consumer Loan'], n_rows),
+        'inquiry_date': '2025-02-14',
+    })
+
+
+def bench_enquiry_lookup(sizes=(1_000, 2_000, 4_000, 8_000), enquiries_per_customer=5):
+    """
+    Per-customer enquiry lookup: the old full-table scan (customers x enquiries) against the
+    customer_no index built once per generate_training_data call (customers + enquiries).
+    """
+    analyzer = CustomerScoreAnalyzer()
+    print("\n## Enquiry lookup (all customers)")
+    print(f"{'customers':>10} {'enquiries':>10} {'scan (s)':>10} {'index (s)':>10} {'speedup':>8}")
+    for n_customers in sizes:
+        df_enq = _random_enquiries(n_customers, enquiries_per_customer)
+        customers = np.arange(n_customers)
+
+        def scan():
+            return [df_enq[df_enq['customer_no'] == c].copy() for c in customers]
+
+        def indexed():
+            index = analyzer._build_enquiry_index(df_enq)
+            return [analyzer._customer_enquiries(index, c) for c in customers]
+
+        scan_s, _ = _timed(scan)
+        index_s, _ = _timed(indexed)
+        print(f"{n_customers:>10} {len(df_enq):>10} {scan_s:>10.3f} {index_s:>10.3f} {scan_s / index_s:>7.1f}x")
+
+
+def _random_accounts(n_rows, accounts_per_customer=6, seed=0):
+    """Account rows with the columns the customer-level aggregates read."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'customer_no': np.sort(rng.integers(0, max(n_rows // accounts_per_customer, 1), n_rows))})
+    for period in ['x', 'y']:
+        limit = rng.integers(10, 500, n_rows) * 1000.0
+        df[f'Activity_Flag_{period}'] = (rng.random(n_rows) < 0.7).astype(int)
+        df[f'priority_3_{period}'] = rng.choice(['01.0 CC', '02.0 PL', '03.0 HL', '06.0 CD'], n_rows)
+        df[f'high_balance_{period}'] = np.where(df[f'priority_3_{period}'] == '01.0 CC', np.nan, limit)
+        df[f'credit_limit_{period}'] = np.where(df[f'priority_3_{period}'] == '01.0 CC', limit, np.nan)
+        df[f'current_balance_{period}'] = np.floor(limit * rng.random(n_rows))
+        df[f'risk_score_{period}'] = rng.integers(600, 850, n_rows).astype(float)
+    return df
+
+
+def _customer_aggregates_groupby(df):
+    """The per-column groupby/transform sequence create_features used before the single-pass plan."""
+    out = df.copy()
+    for period in ['x', 'y']:
+        out[f'lim_disbursed_{period}'] = np.nanmax(out[[f'high_balance_{period}', f'credit_limit_{period}']].values, axis=1)
+        out[f'active_balance_{period}'] = np.where(out[f'Activity_Flag_{period}'] == 1, out[f'current_balance_{period}'], 0)
+        active = out[f'Activity_Flag_{period}'] == 1
+        out.loc[active, f'total_lim_disbursed_{period}'] = out.loc[active].groupby('customer_no')[f'lim_disbursed_{period}'].transform('sum')
+        out.loc[active, f'total_active_balance_{period}'] = out.loc[active].groupby('customer_no')[f'active_balance_{period}'].transform('sum')
+        cc = active & (out[f'priority_3_{period}'] == '01.0 CC')
+        out.loc[cc, f'total_cc_lim_disbursed_{period}'] = out.loc[cc].groupby('customer_no')[f'lim_disbursed_{period}'].transform('sum')
+        out.loc[cc, f'total_cc_active_balance_{period}'] = out.loc[cc].groupby('customer_no')[f'active_balance_{period}'].transform('sum')
+        cols = [f'total_lim_disbursed_{period}', f'total_active_balance_{period}', f'total_cc_lim_disbursed_{period}', f'total_cc_active_balance_{period}']
+        out[cols] = out.groupby('customer_no')[cols].ffill().bfill()
+        out[f'risk_score_{period}'] = out.groupby('customer_no')[f'risk_score_{period}'].transform('max')
+        out[f'total_active_accounts_{period}'] = out.groupby('customer_no')[f'Activity_Flag_{period}'].transform('sum')
+        out[f'total_active_cc_accounts_{period}'] = cc
+        out[f'total_active_cc_accounts_{period}'] = out.groupby('customer_no')[f'total_active_cc_accounts_{period}'].transform('sum')
+    return out
+
+
+def _customer_aggregates_single_pass(engineer, df):
+    result = engineer._customer_aggregates(df)
+    result.update(engineer._fill_totals(df, result, ['x', 'y']))
+    return result
+
+
+def bench_customer_aggregates(n_rows=1_000_000):
+    """Customer-level totals/maxes/counts: repeated groupby().transform() against the single-pass plan."""
+    df = _random_accounts(n_rows)
+    engineer = CreditFeatureEngineer()
+    before_s, before = _timed(_customer_aggregates_groupby, df)
+    after_s, after = _timed(_customer_aggregates_single_pass, engineer, df)
+    for name, values in after.items():
+        np.testing.assert_array_equal(np.asarray(values), before[name].to_numpy())
+    print(f"\n## Customer aggregates ({n_rows:,} account rows, {df['customer_no'].nunique():,} customers)")
+    print(f"groupby/transform: {before_s:.3f}s  single pass: {after_s:.3f}s  speedup: {before_s / after_s:.1f}x")
+
+
+def _peak_memory(fn, *args, **kwargs):
+    """Returns (peak bytes allocated during the call, result), as seen by tracemalloc."""
+    tracemalloc.start()
+    try:
+        result = fn(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, result
+
+
+def bench_feature_memory(df):
+    """Peak memory and output size of create_features, default mode against low_memory=True."""
+    engineer = CreditFeatureEngineer()
+    default_peak, default_out = _peak_memory(engineer.create_features, df)
+    low_peak, low_out = _peak_memory(engineer.create_features, df, low_memory=True)
+    mb = 1024 ** 2
+    print(f"\n## create_features memory ({len(df):,} account rows)")
+    print(f"{'mode':>12} {'peak (MB)':>10} {'output (MB)':>12}")
+    print(f"{'default':>12} {default_peak / mb:>10.1f} {default_out.memory_usage(deep=True).sum() / mb:>12.1f}")
+    print(f"{'low_memory':>12} {low_peak / mb:>10.1f} {low_out.memory_usage(deep=True).sum() / mb:>12.1f}")
+    print(f"peak reduction: {1 - low_peak / default_peak:.0%}")
+
+
+def write_realtime_fixtures(folder, n_customers=200, seed=0):
+    """Local Parquet stand-ins for the tables the realtime notebook reads from Athena."""
+    os.makedirs(folder, exist_ok=True)
+    m1, m2, enquiries = synthetic_data.report_pulls(n_customers, seed)
+    tables = {'accounts_m1': m1, 'accounts_m2': m2, 'enquiries': enquiries,
+              'product_types': synthetic_data.product_table(), 'lenders': synthetic_data.lender_table()}
+    for name, table in tables.items():
+        table.to_parquet(os.path.join(folder, f'{name}.parquet'), index=False)
+
+
+def _latencies(fn, calls):
+    """Per-call wall times in milliseconds."""
+    times = []
+    for args in calls:
+        start = time.perf_counter()
+        fn(*args)
+        times.append((time.perf_counter() - start) * 1000)
+    return np.array(times)
+
+
+def bench_realtime(folder=None, n_customers=200, target_ms=10.0):
+    """
+    Single-customer latency of RealtimeAnalyzer.analyze_customer on local Parquet fixtures:
+    the staging-table variables alone (what the Athena CTAS chain computes) and the full answer
+    with the merged features and report texts. Each customer's rows are one request, pre-split
+    as the realtime caller receives them.
+    """
+    with tempfile.TemporaryDirectory() as scratch:
+        folder = folder or scratch
+        if not os.path.exists(os.path.join(folder, 'accounts_m1.parquet')):
+            write_realtime_fixtures(folder, n_customers)
+        tables = {name: pd.read_parquet(os.path.join(folder, f'{name}.parquet'))
+                  for name in ['accounts_m1', 'accounts_m2', 'enquiries', 'product_types', 'lenders']}
+    analyzer = RealtimeAnalyzer(tables['product_types'], tables['lenders'])
+    m1, m2, enquiries = (dict(tuple(tables[name].groupby('customer_no'))) for name in ['accounts_m1', 'accounts_m2', 'enquiries'])
+    empty = tables['enquiries'].iloc[:0]
+    calls = [(m1.get(c, tables['accounts_m1'].iloc[:0]), m2[c], enquiries.get(c, empty)) for c in m2]
+    analyzer.analyze_customer(*calls[0])  # warm-up
+
+    print(f"\n## Realtime analyze_customer ({len(calls)} customers, one call each)")
+    print(f"{'stage':>22} {'p50 (ms)':>9} {'p95 (ms)':>9} {'max (ms)':>9}")
+    for label, narrative in [('variables', False), ('variables + report', True)]:
+        times = _latencies(lambda *args: analyzer.analyze_customer(*args, narrative=narrative), calls)
+        p50 = np.percentile(times, 50)
+        print(f"{label:>22} {p50:>9.2f} {np.percentile(times, 95):>9.2f} {times.max():>9.2f}"
+              f"   target p50 < {target_ms:.0f} ms: {'met' if p50 < target_ms else 'missed'}")
+
+
+def bench_batch_inference(n_rows=600, batch_size=16, max_new_tokens=250):
+    """
+    The notebook loop (one generate call per customer) against BatchInference, unsorted and
+    length-bucketed, on the CPU stand-in model. Greedy responses must be identical.
+    """
+    features = CreditFeatureEngineer().create_features(synthetic_data.merged_accounts(n_rows))
+    training_df = CustomerScoreAnalyzer().generate_training_data(features, batched=True)
+    backend = TinyBackend()
+    loop_s, expected = _timed(one_at_a_time, backend, training_df, max_new_tokens=max_new_tokens)
+    generated = sum(result['generated_tokens'] for result in expected)
+
+    print(f"\n## Batch inference ({len(training_df)} prompts, TinyBackend, batch_size={batch_size})")
+    print(f"{'driver':>22} {'prompts/sec':>12} {'tokens/sec':>11} {'padding eff.':>13} {'speedup':>8}")
+    print(f"{'one at a time':>22} {len(expected) / loop_s:>12.1f} {generated / loop_s:>11.0f} {1:>13.0%} {1:>7.1f}x")
+    for label, sort_by_length in [('batched', False), ('batched + bucketed', True)]:
+        engine = BatchInference(backend, batch_size=batch_size, sort_by_length=sort_by_length, max_new_tokens=max_new_tokens)
+        seconds, results = _timed(engine.run, training_df)
+        assert [r['response'] for r in results] == [r['response'] for r in expected]
+        rates = engine.throughput()
+        print(f"{label:>22} {rates['prompts_per_sec']:>12.1f} {rates['generated_tokens_per_sec']:>11.0f} "
+              f"{rates['padding_efficiency']:>13.0%} {loop_s / seconds:>7.1f}x")
+
+
+def bench_two_stage(n_customers=400, batch_size=16):
+    """
+    Fact extraction then rewriting, one stage after the other against the pipelined scheduler,
+    on MockBackends timed like a fine-tuned 8B (extract) and a base 8B with a longer few-shot
+    prompt (rewrite). Pipelined time should approach the slower stage's, not the sum.
+    """
+    requests = [{'customer_no': i, 'customer_info': f'customer {i}'} for i in range(n_customers)]
+    extractor = MockBackend(seconds_per_call=0.02, seconds_per_prompt=0.002)
+    rewriter = MockBackend(seconds_per_call=0.03, seconds_per_prompt=0.002)
+    sequential_s, expected = _timed(run_sequential, extractor, rewriter, requests, batch_size=batch_size)
+    scheduler = TwoStageScheduler(extractor, rewriter, batch_size=batch_size)
+    pipelined_s, results = _timed(scheduler.run_sync, requests)
+    assert results == expected
+
+    print(f"\n## Two-stage narratives ({n_customers} customers, MockBackend, batch_size={batch_size})")
+    print(f"sequential {sequential_s:.2f}s, pipelined {pipelined_s:.2f}s ({sequential_s / pipelined_s:.1f}x)")
+    print(scheduler.summary())
+
+
+def bench_response_cache(n_rows=600, changed_share=0.2, batch_size=16):
+    """
+    A repeat monthly run through a disk-backed ResponseCache: every report's customer-number
+    header differs from the first run and `changed_share` of the reports have new content, so
+    only those should reach the (MockBackend) model.
+    """
+    features = CreditFeatureEngineer().create_features(synthetic_data.merged_accounts(n_rows))
+    first = CustomerScoreAnalyzer().generate_training_data(features, batched=True)
+    second = first.assign(customer_info=first['customer_info'].str.replace('Customer: ', 'Customer: 0', regex=False))
+    changed = np.random.default_rng(0).random(len(second)) < changed_share
+    second.loc[changed, 'customer_info'] += '\n-  Note : new enquiry this month'
+    # Answers depend on the report, not on the customer number, as the fine-tuned model's do.
+    backend = MockBackend(seconds_per_call=0.02, seconds_per_prompt=0.002,
+                          respond=lambda prompt: f"response {zlib.crc32(normalize_report(prompt).encode()):08x}")
+    with tempfile.TemporaryDirectory() as directory:
+        uncached_s, expected = _timed(BatchInference(backend, batch_size=batch_size).run, second)
+        BatchInference(backend, batch_size=batch_size, cache=ResponseCache(directory=directory)).run(first)
+        cache = ResponseCache(directory=directory)  # a new process: only the disk tier survives
+        engine = BatchInference(backend, batch_size=batch_size, cache=cache)
+        cached_s, results = _timed(engine.run, second)
+    assert [r['response'] for r in results] == [r['response'] for r in expected]
+
+    print(f"\n## Response cache ({len(second)} prompts, {changed.mean():.0%} changed since the last run)")
+    print(f"uncached {uncached_s:.2f}s, cached {cached_s:.2f}s ({uncached_s / cached_s:.1f}x); {cache.summary()}")
+
+
+def bench_compact_report(n_rows=20_000, token_budget=600):
+    """
+    Full against compact customer_info on synthetic data, measured with TinyBackend's word-level
+    tokenizer (pass the model's tokenizer for real numbers); a small budget shows the trimming.
+    """
+    accounts = synthetic_data.merged_accounts(n_rows)
+    enquiries = synthetic_data.enquiries(accounts, 0)
+    features = CreditFeatureEngineer().create_features(accounts)
+    analyzer = CustomerScoreAnalyzer()
+    full = analyzer.generate_training_data(features, enquiries, batched=True)
+    tokenizer = TinyBackend()
+    renderer = CompactReportRenderer(tokenizer, token_budget=token_budget)
+    seconds, reports = _timed(renderer.render_all, features, enquiries)
+    compact = full['customer_no'].map(reports)
+
+    print(f"\n## Compact customer_info ({n_rows:,} account rows, budget {token_budget} tokens, rendered in {seconds:.2f}s)")
+    print(format_savings(token_savings(full['customer_info'], compact, tokenizer, token_budget)))
+    print(f"{renderer.stats['over_budget']} reports trimmed to the budget, {renderer.stats['omitted_accounts']} accounts and "
+          f"{renderer.stats['omitted_enquiries']} enquiries left out, {renderer.stats['unfit_reports']} still over")
+
+
+def bench_packed_dataset(n_rows=20_000, seq_len=4096):
+    """
+    Start-up cost of a training run: re-tokenizing every pair (what SFTTrainer does) against
+    opening the packed export, and the share of the batch that is real tokens either way.
+    """
+    features = CreditFeatureEngineer().create_features(synthetic_data.merged_accounts(n_rows))
+    training_df = CustomerScoreAnalyzer().generate_training_data(features, batched=True)
+    tokenizer = TinyBackend()
+    tokenize_s, _ = _timed(tokenize_conversations, training_df.to_dict('records'), tokenizer)
+    with tempfile.TemporaryDirectory() as directory:
+        export_s, meta = _timed(export_packed_dataset, training_df, directory, tokenizer, seq_len)
+        open_s, dataset = _timed(PackedSFTDataset, directory)
+        first_s, _ = _timed(dataset.__getitem__, 0)
+
+    print(f"\n## Packed SFT export ({meta['conversations']:,} conversations, seq_len={seq_len}, TinyBackend tokenizer)")
+    print(f"re-tokenize every run {tokenize_s:.2f}s; export once {export_s:.2f}s; open {open_s * 1000:.1f} ms, first row {first_s * 1000:.1f} ms")
+    print(f"{meta['sequences']:,} packed rows instead of {meta['conversations']:,} padded ones: real tokens "
+          f"{meta['packing_efficiency']:.0%} of the batch (padded: {meta['unpacked_padding_efficiency']:.0%})")
+
+
+def bench_batch_eval(n_rows=20_000):
+    """
+    ROUGE and per-rule accuracy over a synthetic holdout set, with each reference's lines
+    shuffled and one dropped standing in for model output; ROUGE inline and across a process
+    pool (which only helps with more than one CPU).
+    """
+    features = CreditFeatureEngineer().create_features(synthetic_data.merged_accounts(n_rows))
+    references = CustomerScoreAnalyzer().generate_training_data(features, batched=True)['customer_credit_update'].tolist()
+    rng = np.random.default_rng(0)
+    predictions = ['\n'.join(rng.permutation(reference.splitlines())[1:]) for reference in references]
+
+    print(f"\n## Batch evaluation ({len(references):,} pairs, {os.cpu_count()} CPUs)")
+    for n_workers in sorted({1, os.cpu_count() or 1}):
+        seconds, scores = _timed(batch_rouge, predictions, references, n_workers)
+        print(f"ROUGE, {n_workers} worker(s): {len(references) / seconds:,.0f} pairs/sec "
+              f"(rouge1 {scores['rouge1'].mean():.3f}, rougeL {scores['rougeL'].mean():.3f})")
+    seconds, (_, rules) = _timed(rule_accuracy, predictions, references)
+    print(f"per-rule accuracy: {len(references) / seconds:,.0f} pairs/sec, fact recall {rules['hit'].sum() / rules['support'].sum():.1%}")
+
+
+if __name__ == '__main__':
+    bench_training_data()
+    bench_enquiry_lookup()
+    bench_customer_aggregates()
+    bench_realtime()
+    bench_batch_inference()
+    bench_two_stage()
+    bench_response_cache()
+    bench_compact_report()
+    bench_packed_dataset()
+    bench_batch_eval()
+    if len(sys.argv) > 1:
+        bench_feature_memory(pd.read_parquet(sys.argv[1]))
@@ -0,0 +1,316 @@
+# compact_report.py
+# A shorter customer_info for heavy bureau files. The full report prints a multi-line block per
+# account, so customers with dozens of accounts give long prompts (slow prefill) that can run
+# past the 4096-token Max Sequence Length used in training. The compact report:
+#   - puts each changed account (new, closed, removed, delinquent, DPD or utilisation moved,
+#     account type changed) on one line, most material first;
+#   - lists unchanged active accounts only by lender and current utilisation, grouped by loan
+#     type, with repeats collapsed ("IDFC FIRST BANK 100% x2");
+#   - counts long-inactive accounts instead of listing them;
+#   - drops the least material accounts when the report would exceed `token_budget` tokens of
+#     the real tokenizer, then the oldest enquiries and the optional summary lines, saying how
+#     many were left out.
+# The model must see the same format in training and inference:
+#   renderer = CompactReportRenderer(tokenizer=AutoTokenizer.from_pretrained(model_id))
+#   training_df = CustomerScoreAnalyzer().generate_training_data(features, enquiries, report_renderer=renderer)
+import numpy as np
+import pandas as pd
+
+# Max Sequence Length 4096 less room for the chat template, the prompts and a 250-token answer.
+DEFAULT_TOKEN_BUDGET = 3584
+LENDER_TYPES = [('Public', 'Public sector'), ('Private', 'Private sector'), ('NBFC', 'NBFC'), ('Corporate', 'Corporate bank'),
+                ('Foreign', 'Foreign bank')]
+_CHANGED, _UNCHANGED, _INACTIVE = 0, 1, 2
+
+
+def token_counter(tokenizer):
+    """
+    count(texts) -> token lengths. `tokenizer` is a Hugging Face tokenizer or anything with
+    count_tokens(texts), such as the batch_inference backends.
+    """
+    if hasattr(tokenizer, 'count_tokens'):
+        return lambda texts: list(tokenizer.count_tokens(list(texts)))
+    return lambda texts: [len(ids) for ids in tokenizer(list(texts), add_special_tokens=False)['input_ids']]
+
+
+def _number(value):
+    return 'N/A' if pd.isna(value) else f'{value:g}'
+
+
+def _column(df, col, default=np.nan):
+    return df[col].to_numpy() if col in df.columns else np.full(len(df), default, dtype=object)
+
+
+def _float_column(df, col):
+    return pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64) if col in df.columns else np.full(len(df), np.nan)
+
+
+class CompactReportRenderer:
+    """
+    Renders compact customer_info reports. With a tokenizer, reports are cut to `token_budget`
+    tokens (DEFAULT_TOKEN_BUDGET unless given); without one they are compacted but not
+    measured. Accounts whose utilisation moved less than `util_change_threshold` (0.05 = 5
+    percentage points), with no DPD and no status change, count as unchanged. `stats`
+    accumulates over calls: reports, accounts per kind, reports that had to be cut to the
+    budget, accounts and enquiries left out, and reports still over it after the cut.
+    """
+
+    def __init__(self, tokenizer=None, token_budget=None, util_change_threshold=0.05):
+        if token_budget is not None and tokenizer is None:
+            raise ValueError("A token_budget needs a tokenizer to measure the reports with.")
+        self.count_tokens = None if tokenizer is None else token_counter(tokenizer)
+        self.token_budget = DEFAULT_TOKEN_BUDGET if token_budget is None and tokenizer is not None else token_budget
+        self.util_change_threshold = util_change_threshold
+        self.stats = {'reports': 0, 'changed_accounts': 0, 'unchanged_accounts': 0, 'inactive_accounts': 0,
+                      'over_budget': 0, 'omitted_accounts': 0, 'omitted_enquiries': 0, 'unfit_reports': 0}
+
+    # --- Accounts (whole frame at once) ---
+
+    def _accounts(self, df):
+        """Per-row kind, materiality, one-line text (changed) and short entry (unchanged)."""
+        merge = _column(df, '_merge', None)
+        act_x, act_y = _float_column(df, 'Activity_Flag_x'), _float_column(df, 'Activity_Flag_y')
+        dpd_x, dpd_y = _float_column(df, 'latest_payment_dpd_status_x'), _float_column(df, 'latest_payment_dpd_status_y')
+        util_x = np.nan_to_num(_float_column(df, 'utilisation_x'))
+        util_y = np.nan_to_num(_float_column(df, 'utilisation_y'))
+        sym_x, sym_y = _column(df, 'account_type_symbol_x'), _column(df, 'account_type_symbol_y')
+        loan_type = _column(df, 'coalesced_loan_type', 'N/A').astype(str)
+        creditor = _column(df, 'creditor_name', 'N/A').astype(str)
+        acc_no = _column(df, 'acc_no', 'N/A').astype(str)
+
+        # Same precedence as the full report's Status line; 'Active' rows inactive in both months
+        # are long-closed accounts.
+        removed = merge == 'left_only'
+        new = _float_column(df, 'new_account_flag') == 1
+        closed = (act_x == 1) & (act_y == 0)
+        status = np.where(removed, 'Removed from Report', np.where(new, 'New Account', np.where(closed, 'Closed this Period', 'Active')))
+        is_active = status == 'Active'
+        delinquent = dpd_y > 0
+        dpd_changed = (dpd_y != dpd_x) & ~(np.isnan(dpd_x) & np.isnan(dpd_y))
+        util_change = np.abs(util_y - util_x)
+        util_moved = util_change >= self.util_change_threshold
+        info_change = is_active & (pd.Series(sym_x).astype(str).to_numpy() != pd.Series(sym_y).astype(str).to_numpy())
+        show_util = np.char.find(np.char.upper(loan_type.astype(str)), 'CC') >= 0
+        show_util |= (util_x > 0) | (util_y > 0)
+
+        kind = np.where(is_active & (act_y != 1), _INACTIVE,
+                        np.where(is_active & ~delinquent & ~dpd_changed & ~util_moved & ~info_change, _UNCHANGED, _CHANGED))
+        score = (5.0 * ~is_active + 4.0 * delinquent + np.clip(np.nan_to_num(dpd_y), 0, 180) / 60 + 2.0 * dpd_changed
+                 + 5.0 * util_change * util_moved + 2.0 * info_change + 1.0 * (util_y >= 0.3))
+
+        lines = [None] * len(df)
+        for i in np.flatnonzero(kind == _CHANGED):
+            parts = [status[i]]
+            if dpd_changed[i]:
+                parts.append(f'DPD {_number(dpd_y[i])} (was {_number(dpd_x[i])})')
+            elif delinquent[i]:
+                parts.append(f'DPD {_number(dpd_y[i])}')
+            if show_util[i]:
+                parts.append(f'util {util_y[i]:.1%} (was {util_x[i]:.1%})')
+            if info_change[i]:
+                parts.append(f"type now '{sym_y[i]}' (was '{sym_x[i]}')")
+            lines[i] = f"-  {creditor[i]} {loan_type[i]} ({acc_no[i]}) : {', '.join(parts)}"
+        entries = [f'{name} {util:.0%}' for name, util in zip(creditor, util_y)]
+        return {'kind': kind, 'score': score, 'util_y': util_y, 'loan_type': loan_type, 'line': lines, 'entry': entries}
+
+    # --- Summary and enquiries (per customer, columnar) ---
+
+    @staticmethod
+    def _summaries(df, codes, starts, n_customers):
+        """Header, key metrics and credit mix lines of every customer."""
+        def first(col, default='N/A'):
+            return _column(df, col, default)[starts]
+        score_y, score_x = first('risk_score_y'), first('risk_score_x')
+        util_y, util_x = first('overall_utilisation_y', 0), first('overall_utilisation_x', 0)
+        cc_y, cc_x = first('total_active_cc_accounts_y', 0), first('total_active_cc_accounts_x', 0)
+        cc_util_y, cc_util_x = first('overall_cc_utilisation_y', 0), first('overall_cc_utilisation_x', 0)
+        active_y, active_x = first('total_active_accounts_y'), first('total_active_accounts_x')
+        customer_no = df['customer_no'].to_numpy()[starts]
+
+        has_mix, has_lender = 'secured_unsecured_y' in df.columns, 'lender_type' in df.columns
+        if has_mix or has_lender:
+            is_active = _float_column(df, 'Activity_Flag_y') == 1
+
+            def count(mask):
+                return np.bincount(codes, weights=mask, minlength=n_customers).astype(np.int64)
+        if has_mix:
+            total = count((df['account_number_y'] != 'NA').to_numpy())
+            active = np.bincount(codes, weights=np.nan_to_num(_float_column(df, 'Activity_Flag_y')), minlength=n_customers)
+            secured = count(is_active & (df['secured_unsecured_y'] == '1. Secured').to_numpy())
+            unsecured = count(is_active & (df['secured_unsecured_y'] == '2. Unsecured').to_numpy())
+        if has_lender:
+            lenders = [(label, count(is_active & (df['lender_type'] == name).to_numpy())) for label, name in LENDER_TYPES]
+
+        summaries = []
+        for c in range(n_customers):
+            metrics = [f'score {score_y[c]} (was {score_x[c]})', f'overall util {util_y[c]:.2%} (was {util_x[c]:.2%})']
+            if cc_y[c] > 0 or cc_x[c] > 0:
+                metrics.append(f'cc util {cc_util_y[c]:.2%} (was {cc_util_x[c]:.2%})')
+            metrics.append(f'active accounts {active_y[c]} (was {active_x[c]})')
+            lines = [f'--- Credit Profile Report for Customer: {customer_no[c]} ---', '', '## Summary', '-  ' + '; '.join(metrics)]
+            if has_mix:
+                lines.append(f'-  accounts {total[c]} ({active[c]:g} active; {secured[c]} secured, {unsecured[c]} unsecured)')
+            if has_lender:
+                present = [f'{label} {counts[c]}' for label, counts in lenders if counts[c]]
+                lines.append(f"-  active lenders: {', '.join(present) if present else 'none'}")
+            summaries.append(lines)
+        return summaries
+
+    @staticmethod
+    def _enquiries(df_enq, customers):
+        """(text, latest date) enquiry entries of every customer, with same lender and type collapsed."""
+        grouped = [{} for _ in range(len(customers))]
+        if df_enq is not None and 'customer_no' in df_enq.columns:
+            positions = pd.Index(customers).get_indexer(df_enq['customer_no'])
+            for c, lender, loan_type, date in zip(positions, _column(df_enq, 'subscriber_name', 'N/A'),
+                                                  _column(df_enq, 'loan_type', 'N/A'), _column(df_enq, 'inquiry_date', 'N/A')):
+                if c < 0:
+                    continue
+                count, latest = grouped[c].get((lender, loan_type), (0, None))
+                grouped[c][(lender, loan_type)] = (count + 1, str(date) if latest is None else max(latest, str(date)))
+        return [[(f"{lender} {loan_type}{f' x{count}' if count > 1 else ''} ({date})", date)
+                 for (lender, loan_type), (count, date) in enquiries.items()] for enquiries in grouped]
+
+    @staticmethod
+    def _enquiry_lines(enquiries, n_omitted=0):
+        """Enquiry section from the entries of one customer, leaving out its `n_omitted` oldest."""
+        if not enquiries:
+            return []
+        oldest = set(sorted(range(len(enquiries)), key=lambda i: enquiries[i][1])[:n_omitted])
+        shown = [text for i, (text, _) in enumerate(enquiries) if i not in oldest]
+        if n_omitted:
+            shown.append(f'{n_omitted} older not shown')
+        return ['', '## Recent Credit Enquiries', '-  ' + '; '.join(shown)]
+
+    # --- Assembly ---
+
+    @staticmethod
+    def _assemble(head, enquiry_lines, changed, unchanged, n_inactive, n_omitted):
+        """Report text from the changed-account lines and unchanged (loan type, entry) pairs to show."""
+        lines = list(head)
+        if changed:
+            lines += ['', '## Changed Accounts'] + changed
+        if unchanged or n_inactive or n_omitted:
+            lines += ['', '## Other Accounts']
+            by_type = {}
+            for loan_type, entry in unchanged:
+                by_type.setdefault(loan_type, {}).setdefault(entry, 0)
+                by_type[loan_type][entry] += 1
+            for loan_type, entries in by_type.items():
+                lines.append(f"-  Unchanged {loan_type} : " + ', '.join(entry if n == 1 else f'{entry} x{n}' for entry, n in entries.items()))
+            if n_inactive:
+                lines.append(f'-  Inactive in both months : {n_inactive} accounts')
+            if n_omitted:
+                lines.append(f'-  Not shown : {n_omitted} less material accounts')
+        return '\n'.join(lines + enquiry_lines) + '\n'
+
+    def _fit(self, head, enquiries, changed, unchanged, n_inactive):
+        """
+        The report with as many accounts as fit the budget: changed ones before unchanged ones,
+        each in materiality order, chosen from per-line token counts and then trimmed one at a
+        time while the joined text is still over (separate lines' counts do not add up exactly).
+        Over with no accounts left, it drops the oldest enquiries, then the summary's credit mix
+        and lender lines; a report still over (a budget below its header) counts as unfit.
+        """
+        n_accounts = len(changed) + len(unchanged)
+
+        def render(keep, n_old_enquiries=0, n_head=len(head)):
+            n_changed = min(keep, len(changed))
+            return self._assemble(head[:n_head], self._enquiry_lines(enquiries, n_old_enquiries), changed[:n_changed],
+                                  unchanged[:keep - n_changed], n_inactive, n_accounts - keep)
+
+        def over(text):
+            return self.count_tokens([text])[0] > self.token_budget
+
+        costs = self.count_tokens(['\n'.join(head + self._enquiry_lines(enquiries))] + changed + [entry for _, entry in unchanged])
+        # Room for the section headers and the "Not shown" line.
+        used, keep = costs[0] + 40, 0
+        for cost in costs[1:]:
+            if used + cost + 1 > self.token_budget:
+                break
+            used += cost + 1
+            keep += 1
+        text = render(keep)
+        while keep > 0 and over(text):
+            keep -= 1
+            text = render(keep)
+        n_old = 0
+        while n_old < len(enquiries) and over(text):
+            n_old += 1
+            text = render(0, n_old)
+        # The title, the blank line, '## Summary' and the key metrics always stay.
+        n_head = len(head)
+        while n_head > 4 and over(text):
+            n_head -= 1
+            text = render(0, n_old, n_head)
+        self.stats['omitted_accounts'] += n_accounts - keep
+        self.stats['omitted_enquiries'] += n_old
+        self.stats['unfit_reports'] += int(over(text))
+        return text
+
+    def render_all(self, final_result1, df_enq=None):
+        """{customer_no: compact report} for every customer in the frame."""
+        df = final_result1.reset_index(drop=True)
+        codes, customers = pd.factorize(df['customer_no'], sort=True)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.r_[0, np.cumsum(np.bincount(codes, minlength=len(customers)))]
+        accounts = self._accounts(df)
+        summaries = self._summaries(df, codes, order[bounds[:-1]], len(customers))
+        enquiries = self._enquiries(df_enq, customers)
+
+        parts, texts = [], []
+        for c in range(len(customers)):
+            rows = order[bounds[c]:bounds[c + 1]]
+            kinds = accounts['kind'][rows]
+            changed = [accounts['line'][i] for i in sorted(rows[kinds == _CHANGED], key=lambda i: -accounts['score'][i])]
+            unchanged = [(accounts['loan_type'][i], accounts['entry'][i])
+                         for i in sorted(rows[kinds == _UNCHANGED], key=lambda i: -accounts['util_y'][i])]
+            n_inactive = int((kinds == _INACTIVE).sum())
+            parts.append((summaries[c], enquiries[c], changed, unchanged, n_inactive))
+            texts.append(self._assemble(summaries[c], self._enquiry_lines(enquiries[c]), changed, unchanged, n_inactive, 0))
+            self.stats['changed_accounts'] += len(changed)
+            self.stats['unchanged_accounts'] += len(unchanged)
+            self.stats['inactive_accounts'] += n_inactive
+        self.stats['reports'] += len(texts)
+
+        if self.token_budget is not None and texts:
+            for c in np.flatnonzero(np.array(self.count_tokens(texts)) > self.token_budget):
+                self.stats['over_budget'] += 1
+                texts[c] = self._fit(*parts[c])
+        return dict(zip(customers, texts))
+
+    def render(self, final_result1, df_enq=None):
+        """Compact report of one customer's rows (the counterpart of _generate_info_report)."""
+        reports = self.render_all(final_result1, df_enq)
+        if len(reports) != 1:
+            raise ValueError(f"render() takes one customer's rows, got {len(reports)} customers.")
+        return next(iter(reports.values()))
+
+
+def token_savings(full_reports, compact_reports, tokenizer, token_budget=DEFAULT_TOKEN_BUDGET):
+    """
+    Token counts of the same customers' full and compact reports (two aligned sequences of
+    texts): totals, share saved, p95 and max, and how many reports exceed `token_budget`.
+    """
+    count = token_counter(tokenizer)
+    full = np.array(count(list(full_reports)), dtype=np.int64)
+    compact = np.array(count(list(compact_reports)), dtype=np.int64)
+    if len(full) != len(compact):
+        raise ValueError(f"Got {len(full)} full and {len(compact)} compact reports.")
+    savings = {'reports': len(full)}
+    for name, tokens in [('full', full), ('compact', compact)]:
+        savings.update({f'{name}_tokens': int(tokens.sum()), f'{name}_mean': float(tokens.mean()) if len(tokens) else 0.0,
+                        f'{name}_p95': float(np.percentile(tokens, 95)) if len(tokens) else 0.0,
+                        f'{name}_max': int(tokens.max()) if len(tokens) else 0,
+                        f'{name}_over_budget': int((tokens > token_budget).sum())})
+    savings['saved'] = 1 - savings['compact_tokens'] / savings['full_tokens'] if savings['full_tokens'] else 0.0
+    return savings
+
+
+def format_savings(savings):
+    lines = [f"{savings['reports']} reports, {savings['saved']:.0%} fewer tokens",
+             f"{'':>8} {'tokens':>11} {'mean':>8} {'p95':>8} {'max':>7} {'over budget':>12}"]
+    for name in ['full', 'compact']:
+        lines.append(f"{name:>8} {savings[f'{name}_tokens']:>11,} {savings[f'{name}_mean']:>8.0f} {savings[f'{name}_p95']:>8.0f} "
+                     f"{savings[f'{name}_max']:>7} {savings[f'{name}_over_budget']:>12}")
+    return '\n'.join(lines)
@@ -0,0 +1,113 @@
+# feature_store.py
+# File-backed store of per-snapshot features. Every run compares two consecutive bureau
+# snapshots (_x = month m, _y = month m+1), so the _y half of this month's run is the _x half
+# of next month's: CreditFeatureEngineer.create_features(df, feature_store=...) saves each
+# snapshot it computes and reuses the _x one on the following run.
+import os
+
+import numpy as np
+import pandas as pd
+
+CUSTOMER_KEY = ['customer_no', 'creation_date']
+ACCOUNT_KEY = ['customer_no', 'creation_date', 'creditor_name', 'account_number']
+
+_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix(hashes):
+    """splitmix64 finalizer, applied element-wise to a uint64 array."""
+    hashes = (hashes ^ (hashes >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    hashes = (hashes ^ (hashes >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return hashes ^ (hashes >> np.uint64(31))
+
+
+def customer_fingerprints(codes, n_customers, rows):
+    """
+    Order-independent fingerprint of each customer's source rows. `codes` are the rows'
+    customer codes (from pd.factorize) and `rows` the source columns. Numbers are hashed as
+    float64 and everything else as text, so a column that is int in one month and float in the
+    next (because of a null elsewhere) still matches. Returns one uint64 per customer.
+    """
+    numeric = [col for col in rows.columns if pd.api.types.is_numeric_dtype(rows[col])]
+    text = [col for col in rows.columns if col not in numeric]
+    row_hashes = np.zeros(len(rows), dtype=np.uint64)
+    if numeric:
+        # + 0.0 folds -0.0 into 0.0 and np.where gives every NaN the same bit pattern.
+        values = rows[numeric].to_numpy(dtype=np.float64) + 0.0
+        bits = np.where(np.isnan(values), np.nan, values).view(np.uint64)
+        for j in range(bits.shape[1]):
+            row_hashes = _mix(row_hashes * _MULTIPLIER ^ bits[:, j])
+    if text:
+        normalized = pd.DataFrame({col: rows[col].astype(str) for col in text})
+        row_hashes = _mix(row_hashes ^ pd.util.hash_pandas_object(normalized, index=False, categorize=False).to_numpy())
+    # Wrapping uint64 sum per customer, from exact float64 sums of the 32-bit halves.
+    low = np.bincount(codes, weights=row_hashes & np.uint64(0xFFFFFFFF), minlength=n_customers).astype(np.uint64)
+    high = np.bincount(codes, weights=row_hashes >> np.uint64(32), minlength=n_customers).astype(np.uint64)
+    counts = np.bincount(codes, minlength=n_customers).astype(np.uint64)
+    return _mix((low + (high << np.uint64(32))) ^ counts * _MULTIPLIER)
+
+
+class FeatureStore:
+    """
+    Per-snapshot feature tables under `root`, one folder per creation_date:
+      creation_date=YYYY-MM-DD/customers.parquet  customer_no, fingerprint and customer-level features
+      creation_date=YYYY-MM-DD/accounts.parquet   creditor_name + account_number and row-level features
+    A customer's entry is replaced as a whole on every save, and a stored snapshot is only
+    reused while the fingerprint of the customer's source rows still matches.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, creation_date, table):
+        return os.path.join(self.root, f'creation_date={creation_date}', f'{table}.parquet')
+
+    def _read(self, creation_date, table):
+        path = self._path(creation_date, table)
+        return pd.read_parquet(path) if os.path.exists(path) else None
+
+    def _write(self, creation_date, table, frame):
+        """Writes to a temporary file first so an interrupted save never leaves a partial table."""
+        path = self._path(creation_date, table)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        frame.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def snapshots(self):
+        """creation_dates with a stored snapshot, oldest first."""
+        return sorted(name.split('=', 1)[1] for name in os.listdir(self.root) if name.startswith('creation_date='))
+
+    def load(self, keys):
+        """
+        Stored (customers, accounts) tables for the (customer_no, creation_date) pairs in `keys`.
+        Pairs with nothing stored are simply absent from the result.
+        """
+        customers, accounts = [], []
+        for creation_date, group in keys.groupby('creation_date'):
+            wanted = group['customer_no']
+            for table, parts in (('customers', customers), ('accounts', accounts)):
+                stored = self._read(creation_date, table)
+                if stored is not None:
+                    parts.append(stored[stored['customer_no'].isin(wanted)])
+        return (pd.concat(customers, ignore_index=True) if customers else pd.DataFrame(columns=CUSTOMER_KEY + ['fingerprint']),
+                pd.concat(accounts, ignore_index=True) if accounts else pd.DataFrame(columns=ACCOUNT_KEY))
+
+    def save(self, customers, accounts):
+        """Upserts whole customers: every stored row of a customer in `customers` is replaced."""
+        for creation_date, new_customers in customers.groupby('creation_date'):
+            new_accounts = accounts[accounts['creation_date'] == creation_date]
+            for table, new in (('customers', new_customers), ('accounts', new_accounts)):
+                stored = self._read(creation_date, table)
+                if stored is not None:
+                    new = pd.concat([stored[~stored['customer_no'].isin(new_customers['customer_no'])], new], ignore_index=True)
+                self._write(creation_date, table, new)
+
+    def invalidate(self, customer_nos, creation_date=None):
+        """Drops the stored snapshots of `customer_nos`, for one creation_date or for all of them."""
+        for snapshot in [creation_date] if creation_date is not None else self.snapshots():
+            for table in ['customers', 'accounts']:
+                stored = self._read(snapshot, table)
+                if stored is not None:
+                    self._write(snapshot, table, stored[~stored['customer_no'].isin(customer_nos)])
@@ -0,0 +1,21 @@
+# module_loader.py
+# The pipeline stages are numbered files (1.credit_feature_engineer.py, ...), which Python
+# cannot import by name. load_module() imports one of them from this folder and registers it
+# under its un-numbered name, e.g. load_module('1.customer_analyzer.py') -> 'customer_analyzer'.
+import importlib.util
+import os
+import sys
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_module(filename):
+    """Imports a numbered pipeline file from the repo folder (cached after the first call)."""
+    name = os.path.splitext(filename)[0].split('.', 1)[-1]
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(_HERE, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,201 @@
+# packed_dataset.py
+# Pre-tokenized, packed SFT dataset. SFTTrainer re-renders the chat template and re-tokenizes
+# every customer_info/customer_credit_update pair on each run, then pads each one to the 4096
+# Max Sequence Length although most conversations are a few hundred tokens. Exporting once:
+#   export_packed_dataset(training_df, 'sft_packed', tokenizer)     # or a load_training_data() frame / JSONL
+#   dataset = PackedSFTDataset('sft_packed')                       # memory-mapped, opens instantly
+#   dataset[0] -> {'input_ids', 'labels', 'position_ids', 'attention_mask'}
+# Conversations are packed whole (best fit, longest first) into rows of seq_len tokens. Labels
+# cover only the assistant turn (the narrative and its <|eot_id|>); position ids restart at
+# each conversation, which is how flash-attention kernels keep packed conversations from
+# attending to each other (document_mask() gives the equivalent dense mask).
+# Files: tokens.npy and loss_mask.npy (n_sequences x seq_len), documents.npy (one record per
+# conversation), sequence_offsets.npy (each row's slice of documents.npy) and meta.json.
+import bisect
+import json
+import os
+
+import numpy as np
+
+from batch_inference import read_requests
+from prompts import SYSTEM_PROMPT, render_llama3_chat, to_chat_messages
+
+IGNORE_INDEX = -100  # label value the Hugging Face loss skips
+DOCUMENT_DTYPE = np.dtype([('sequence', np.int64), ('start', np.int32), ('length', np.int32),
+                           ('prompt_length', np.int32), ('source', np.int64)])
+
+
+# --- Tokenization ---
+# `tokenizer` is a Hugging Face tokenizer (its own chat template, batched encoding) or any
+# object with encode(text) -> ids, such as batch_inference.TinyBackend, which gets the Llama-3
+# template from prompts.render_llama3_chat.
+
+def _render(tokenizer, messages, add_generation_prompt):
+    if callable(tokenizer):
+        return tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=add_generation_prompt)
+    return render_llama3_chat(messages, add_generation_prompt=add_generation_prompt)
+
+
+def _encode(tokenizer, texts):
+    if callable(tokenizer):
+        return tokenizer(list(texts), add_special_tokens=False)['input_ids']
+    return [tokenizer.encode(text) for text in texts]
+
+
+def tokenize_conversations(requests, tokenizer, system_prompt=SYSTEM_PROMPT):
+    """
+    (ids, prompt_length) per request. The prompt (system and user turns plus the assistant
+    header) and the completion are tokenized separately, so the label boundary falls exactly
+    between them.
+    """
+    prompts, completions = [], []
+    for request in requests:
+        messages = to_chat_messages(request['customer_info'], request['customer_credit_update'], system_prompt=system_prompt)
+        prompt = _render(tokenizer, messages[:-1], add_generation_prompt=True)
+        full = _render(tokenizer, messages, add_generation_prompt=False)
+        if not full.startswith(prompt):
+            raise ValueError("The chat template does not render the prompt as a prefix of the full conversation.")
+        prompts.append(prompt)
+        completions.append(full[len(prompt):])
+    return [(prompt_ids + completion_ids, len(prompt_ids))
+            for prompt_ids, completion_ids in zip(_encode(tokenizer, prompts), _encode(tokenizer, completions))]
+
+
+# --- Packing ---
+
+def pack(lengths, seq_len):
+    """
+    Best-fit decreasing: longest conversation first, each into the fullest row it still fits
+    (a new row if none). Returns (row, start offset) arrays, one entry per length.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    if len(lengths) and lengths.max() > seq_len:
+        raise ValueError(f"A conversation of {lengths.max()} tokens does not fit seq_len={seq_len}.")
+    rows = np.empty(len(lengths), dtype=np.int64)
+    starts = np.empty(len(lengths), dtype=np.int64)
+    filled = []
+    free = []  # sorted (space left, row) of rows that are not full
+    for doc in np.argsort(-lengths, kind='stable'):
+        length = int(lengths[doc])
+        k = bisect.bisect_left(free, (length, -1))
+        if k == len(free):
+            row, space = len(filled), seq_len
+            filled.append(0)
+        else:
+            space, row = free.pop(k)
+        rows[doc], starts[doc] = row, filled[row]
+        filled[row] += length
+        if space > length:
+            bisect.insort(free, (space - length, row))
+    return rows, starts
+
+
+def export_packed_dataset(source, output_dir, tokenizer, seq_len=4096, system_prompt=SYSTEM_PROMPT, chunk_size=1024,
+                          pad_id=None):
+    """
+    Tokenizes every training pair once, packs them into rows of `seq_len` tokens and writes
+    the memory-mapped arrays to `output_dir`. `source` is a generate_training_data DataFrame,
+    a JSONL file or any iterable of dicts with customer_info and customer_credit_update.
+    Conversations longer than seq_len are skipped and listed in meta.json. Returns the meta.
+    """
+    requests = read_requests(source)
+    os.makedirs(output_dir, exist_ok=True)
+    if pad_id is None:
+        pad_id = getattr(tokenizer, 'pad_token_id', None) or 0
+
+    # Pass 1: tokenize in chunks into one flat scratch file, keeping only the lengths in memory.
+    scratch_path = os.path.join(output_dir, '_unpacked.bin')
+    lengths, prompt_lengths, sources, skipped = [], [], [], []
+    with open(scratch_path, 'wb') as scratch:
+        for offset in range(0, len(requests), chunk_size):
+            chunk = requests[offset:offset + chunk_size]
+            for i, (ids, prompt_length) in enumerate(tokenize_conversations(chunk, tokenizer, system_prompt), start=offset):
+                if len(ids) > seq_len:
+                    skipped.append(str(requests[i].get('customer_no', i)))
+                    continue
+                scratch.write(np.asarray(ids, dtype=np.uint32).tobytes())
+                lengths.append(len(ids))
+                prompt_lengths.append(prompt_length)
+                sources.append(i)
+
+    # Pass 2: pack and copy each conversation into its row.
+    rows, starts = pack(lengths, seq_len)
+    n_sequences = int(rows.max()) + 1 if len(rows) else 0
+    documents = np.zeros(len(lengths), dtype=DOCUMENT_DTYPE)
+    documents['sequence'], documents['start'], documents['length'] = rows, starts, lengths
+    documents['prompt_length'], documents['source'] = prompt_lengths, sources
+    tokens = np.lib.format.open_memmap(os.path.join(output_dir, 'tokens.npy'), mode='w+', dtype=np.uint32, shape=(n_sequences, seq_len))
+    loss_mask = np.lib.format.open_memmap(os.path.join(output_dir, 'loss_mask.npy'), mode='w+', dtype=np.uint8, shape=(n_sequences, seq_len))
+    tokens[:] = pad_id
+    loss_mask[:] = 0
+    if len(lengths):
+        unpacked = np.memmap(scratch_path, dtype=np.uint32, mode='r')
+        ends = np.cumsum(lengths)
+        for doc, (row, start, length, prompt_length, _) in enumerate(documents):
+            tokens[row, start:start + length] = unpacked[ends[doc] - length:ends[doc]]
+            loss_mask[row, start + prompt_length:start + length] = 1
+        del unpacked
+    tokens.flush()
+    loss_mask.flush()
+    os.remove(scratch_path)
+
+    documents = documents[np.lexsort((documents['start'], documents['sequence']))]
+    np.save(os.path.join(output_dir, 'documents.npy'), documents)
+    np.save(os.path.join(output_dir, 'sequence_offsets.npy'),
+            np.searchsorted(documents['sequence'], np.arange(n_sequences + 1)).astype(np.int64))
+    n_tokens = int(np.sum(lengths))
+    meta = {'seq_len': seq_len, 'pad_id': int(pad_id), 'system_prompt': system_prompt,
+            'tokenizer': getattr(tokenizer, 'name_or_path', type(tokenizer).__name__),
+            'sequences': n_sequences, 'conversations': len(lengths), 'tokens': n_tokens,
+            'label_tokens': int(np.sum(lengths) - np.sum(prompt_lengths)),
+            'packing_efficiency': n_tokens / (n_sequences * seq_len) if n_sequences else 0.0,
+            'unpacked_padding_efficiency': n_tokens / (len(lengths) * seq_len) if len(lengths) else 0.0,
+            'skipped_too_long': skipped}
+    with open(os.path.join(output_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+# --- Reading ---
+
+class PackedSFTDataset:
+    """
+    Read side of export_packed_dataset: one item per packed row, as numpy int64 arrays. Works
+    as a torch map-style dataset (len and getitem); convert with torch.from_numpy in a collate
+    function. Nothing is read until a row is indexed.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.tokens = np.load(os.path.join(directory, 'tokens.npy'), mmap_mode='r')
+        self.loss_mask = np.load(os.path.join(directory, 'loss_mask.npy'), mmap_mode='r')
+        self.documents = np.load(os.path.join(directory, 'documents.npy'))
+        self.offsets = np.load(os.path.join(directory, 'sequence_offsets.npy'))
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def row_documents(self, i):
+        """The documents.npy records of row i, in order."""
+        return self.documents[self.offsets[i]:self.offsets[i + 1]]
+
+    def __getitem__(self, i):
+        input_ids = np.asarray(self.tokens[i], dtype=np.int64)
+        labels = np.where(self.loss_mask[i] == 1, input_ids, IGNORE_INDEX)
+        position_ids = np.zeros(len(input_ids), dtype=np.int64)
+        attention_mask = np.zeros(len(input_ids), dtype=np.int64)
+        for document in self.row_documents(i):
+            start, length = document['start'], document['length']
+            position_ids[start:start + length] = np.arange(length)
+            attention_mask[start:start + length] = 1
+        return {'input_ids': input_ids, 'labels': labels, 'position_ids': position_ids, 'attention_mask': attention_mask}
+
+    def document_mask(self, i):
+        """(seq_len, seq_len) bool mask: causal within each conversation of row i, nothing across them."""
+        seq_len = self.tokens.shape[1]
+        segment = np.full(seq_len, -1, dtype=np.int64)
+        for k, document in enumerate(self.row_documents(i)):
+            segment[document['start']:document['start'] + document['length']] = k
+        same = (segment[:, None] == segment[None, :]) & (segment[:, None] >= 0)
+        return same & np.tri(seq_len, dtype=bool)
@@ -0,0 +1,79 @@
+# prompts.py
+# Prompt text shared by dataset export, batch inference and caching, so every stage
+# formats a customer's report into the same Llama-3 chat turns the model was trained on.
+
+SYSTEM_PROMPT = """You are an expert credit analyst. Your role is to analyze a customer's credit data and generate a highly concise summary of the most important positive and negative changes. You must adhere to the length and format constraints given by the user."""
+
+
+def to_chat_messages(customer_info, customer_credit_update=None, system_prompt=SYSTEM_PROMPT, user_command=None):
+    """
+    Builds the chat turns for one customer: system prompt, the report as the user turn and,
+    for training examples, the narrative as the assistant turn. With a user_command the user
+    turn follows the README layout: "{command}\\n\\n--- DATA ---\\n{report}".
+    """
+    user_content = customer_info if user_command is None else f"{user_command}\n\n--- DATA ---\n{customer_info}"
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_content},
+    ]
+    if customer_credit_update is not None:
+        messages.append({"role": "assistant", "content": customer_credit_update})
+    return messages
+
+
+# Two-step pipeline (Notes.md): the fine-tuned model extracts the Good:-/Bad:- facts, then the
+# base Llama 3 model rewrites them into second-person prose for the customer.
+FACT_EXTRACTION_SYSTEM_PROMPT = "You are an expert credit analyst that extracts key data points."
+
+REWRITE_SYSTEM_PROMPT = """You are a helpful financial advisor speaking directly to a customer about their credit report. Your task is to rewrite a summary of their credit report changes into a clear, direct message for them.
+
+Always use the second person (e.g., "Your score," "you have," "your utilization") and avoid using the third person ("the user," "their score")."""
+
+_REWRITE_EXAMPLE_POINTS = """
+Good:- Score increased by 15 points.
+Bad:- Utilization is high at 85%.
+Good:- An old loan was closed.
+"""
+_REWRITE_EXAMPLE_SUMMARY = "Your credit profile is improving: your score rose by 15 points and you closed an old loan. The main thing to work on is your overall utilization, which is high at 85%."
+
+
+def fact_extraction_messages(customer_info):
+    """Step 1 chat turns: the customer's report in, Good:-/Bad:- facts out."""
+    return [
+        {"role": "system", "content": FACT_EXTRACTION_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Summarize the key updates from this data:\n\n{customer_info}"},
+    ]
+
+
+def rewrite_messages(facts):
+    """Step 2 chat turns: the few-shot rewrite prompt from the notebook around step 1's facts."""
+    user_content = f"""
+Rewrite the following credit points into a single, cohesive paragraph. Here is an example:
+
+---
+**INPUT POINTS:**
+{_REWRITE_EXAMPLE_POINTS}
+**IDEAL SUMMARY:**
+{_REWRITE_EXAMPLE_SUMMARY}
+---
+
+Now, use the same style to rewrite these points:
+
+**INPUT POINTS:**
+{facts}
+**IDEAL SUMMARY:**
+"""
+    return [
+        {"role": "system", "content": REWRITE_SYSTEM_PROMPT},
+        {"role": "user", "content": user_content},
+    ]
+
+
+def render_llama3_chat(messages, add_generation_prompt=True):
+    """
+    The Llama-3 chat template as text. With add_generation_prompt it ends with the assistant
+    header, ready for generation; without, a conversation ends after its last turn's <|eot_id|>.
+    """
+    turns = ''.join(f"<|start_header_id|>{m['role']}<|end_header_id|>\n\n{m['content']}<|eot_id|>" for m in messages)
+    generation_prompt = "<|start_header_id|>assistant<|end_header_id|>\n\n" if add_generation_prompt else ''
+    return f"<|begin_of_text|>{turns}{generation_prompt}"
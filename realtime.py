@@ -0,0 +1,442 @@
+# realtime.py
+# In-process replacement for the staging-table chain of model_variables_creation_realtime.ipynb.
+# The notebook scores one customer_no by writing ..._m1_data_v1..v6, ..._m1_data_overall and the
+# m2 versions to S3 with Athena CTAS queries and joining them back. RealtimeAnalyzer computes the
+# same per-snapshot variables from the two raw report pulls in memory, builds the merged x/y
+# account frame and runs it through CreditFeatureEngineer and CustomerScoreAnalyzer.
+import numpy as np
+import pandas as pd
+
+from module_loader import load_module
+
+CreditFeatureEngineer = load_module('1.credit_feature_engineer.py').CreditFeatureEngineer
+CustomerScoreAnalyzer = load_module('1.customer_analyzer.py').CustomerScoreAnalyzer
+
+# account_type_symbol groups used by the staging queries. The SQL copies of these lists drift
+# slightly between tables (cc with and without 16, pl with and without 41); one list is used here.
+SECURED = (1, 2, 3, 4, 7, 13, 15, 17, 21, 23, 31, 32, 33, 34, 42, 44, 59, 70, 71)
+UNSECURED = (5, 8, 9, 10, 11, 12, 14, 16, 35, 36, 37, 38, 39, 40, 41, 43, 50, 51, 52, 53, 54, 55, 56, 57,
+             58, 61, 60, 24, 45, 46, 6, 47, 69)
+SEGMENTS = {'cc': (10, 16, 31), 'pl': (5, 37, 41), 'cd': (6,), 'gl': (7,), 'al': (1,), 'tw': (13,), 'hl': (2,),
+            'unsecured': UNSECURED, 'secured': SECURED}
+# The enquiry table (v5) abbreviates the two security segments.
+ENQUIRY_PREFIXES = {'unsecured': 'unsec', 'secured': 'sec'}
+
+DPD_WINDOWS = {'l36m': 36, 'l24m': 24, 'l18m': 18, 'l12m': 12, 'l6m': 6, 'l3m': 3, 'cm': 1}
+OVERDUE_WINDOWS = {'l36m': 36, 'l24m': 24, 'l18m': 18, 'l12m': 12, 'l9m': 9, 'l6m': 6, 'l3m': 3, 'cm': 1}
+DPD_THRESHOLDS = {'x': 1, '30': 30, '90': 90}
+SANCTION_WINDOWS = {'': None, '_l3m': 3, '_l6m': 6, '_l12m': 12}
+ENQUIRY_MONTHS = (1, 2, 3, 6, 12)
+ACCOUNT_MONTHS = (1, 3, 6, 12)
+
+# Columns read from each report pull (fpl_bureau.score_cibil_report rows); absent ones are null.
+TEXT_COLUMNS = ['customer_no', 'account_number', 'creditor_name', 'pay_status_history']
+NUMBER_COLUMNS = ['account_type_symbol', 'account_designator_symbol', 'amount_past_due', 'current_balance',
+                  'high_balance', 'credit_limit', 'risk_score']
+DATE_COLUMNS = ['date_opened', 'date_closed', 'date_reported', 'creation_date']
+
+_GROUPS = [None, *SEGMENTS]  # None: every account
+# Row g, column c: does account_type_symbol c belong to group g. Unknown/null symbols map to column 0.
+_GROUP_TABLE = np.zeros((len(_GROUPS), 1 + max(max(codes) for codes in SEGMENTS.values())), dtype=bool)
+_GROUP_TABLE[0] = True
+for _row, _codes in enumerate(SEGMENTS.values(), start=1):
+    _GROUP_TABLE[_row, list(_codes)] = True
+
+
+def _prefix(segment, text=None):
+    return f'{text or segment}_' if segment else ''
+
+
+def _variable_names():
+    """Output names of every variable family, in the order snapshot_variables computes them."""
+    names = {
+        'max_dpd': [f'max_{_prefix(s)}dpd_{w}' for s in _GROUPS for w in DPD_WINDOWS],
+        'max_active_dpd': [f'max_active_{_prefix(s)}dpd_{w}' for s in _GROUPS for w in DPD_WINDOWS],
+        'overdue': [f'{_prefix(s)}overdue_{w}' for s in _GROUPS for w in OVERDUE_WINDOWS],
+        'nbr_dpd': [f'nbr_{_prefix(s)}{t}_dpd_{w}' for s in _GROUPS for t in DPD_THRESHOLDS for w in DPD_WINDOWS],
+        # The SQL spells the active 90+ counts nbr_active_90_dpd_* overall but nbr_cc_active_90_dpd_* per segment.
+        'nbr_active_dpd': [(f'nbr_{s}_active_90_dpd_{w}' if s and t == '90' else f'nbr_active_{_prefix(s)}{t}_dpd_{w}')
+                           for s in _GROUPS for t in DPD_THRESHOLDS for w in DPD_WINDOWS],
+        'max_sanctioned': [f'{_prefix(s)}max_sanctioned_amount{w}' for s in _GROUPS for w in SANCTION_WINDOWS],
+        'total_sanctioned': [f'{_prefix(s)}total_sanctioned_amount{w}' for s in _GROUPS for w in SANCTION_WINDOWS],
+        'total_balance': [f'{_prefix(s)}total_balance_amount' for s in _GROUPS],
+        'utilisation': [f'{s}_utilisation' if s else 'overall_utilisation' for s in _GROUPS],
+        'avg_utilisation': [f'avg_{_prefix(s)}utilisation' for s in _GROUPS],
+        'vintage': [f'{agg}_{active}{_prefix(s)}bureau_vintage'
+                    for active in ['', 'active_'] for s in _GROUPS for agg in ['max', 'min']],
+        'enquiries': [f'{_prefix(s, ENQUIRY_PREFIXES.get(s))}inq_l{n}m' if s else f'enq_l{n}m'
+                      for s in _GROUPS for n in ENQUIRY_MONTHS],
+        'accounts_ever': [f'nbr_ever_{s}_accounts' if s in ENQUIRY_PREFIXES else f'nbr_ever_{s}' if s else 'nbr_ever_accounts'
+                          for s in _GROUPS],
+        'accounts_active': [f'nbr_active_{s}_accounts' if s in ENQUIRY_PREFIXES else f'nbr_active_{s}' if s else 'nbr_active_accounts'
+                            for s in _GROUPS],
+        'accounts_new': [f'{s}_accts_new_l{n}m' if s in ENQUIRY_PREFIXES else f'{s}_new_l{n}m' if s else f'accts_new_l{n}m'
+                         for s in _GROUPS for n in ACCOUNT_MONTHS],
+        'accounts_closed': [f'{s}_accts_closed_l{n}m' if s in ENQUIRY_PREFIXES else f'{s}_closed_l{n}m' if s else f'accts_closed_l{n}m'
+                            for s in _GROUPS for n in ACCOUNT_MONTHS],
+        'ever_product': [f'ever_{s}' for s in SEGMENTS if s not in ENQUIRY_PREFIXES],
+        'active_product': [f'active_{s}' for s in SEGMENTS if s not in ENQUIRY_PREFIXES],
+    }
+    return names
+
+
+VARIABLE_NAMES = _variable_names()
+# Account-type codes: reported as-is, never differenced.
+CODE_VARIABLES = ['latest_product', 'first_product']
+
+
+# --- Dates ---
+def _days(values):
+    """datetime64[D] array from datetime64 values, Timestamps, dates or 'YYYY-MM-DD...' strings."""
+    values = np.asarray(values)
+    if values.dtype.kind == 'M':
+        return values.astype('datetime64[D]')
+    return np.array([np.datetime64(str(v)[:10]) if v is not None and v == v else np.datetime64('NaT', 'D')
+                     for v in values], dtype='datetime64[D]')
+
+
+def _month_number(days):
+    """Months since 1970-01 as floats, NaN for NaT."""
+    months = days.astype('datetime64[M]').astype(np.int64).astype(np.float64)
+    return np.where(np.isnat(days), np.nan, months)
+
+
+def _calendar_months(start, end):
+    """(year, month) difference, as the notebook's pandas cells compute diff_sin_open/diff_rep_pull."""
+    return _month_number(end) - _month_number(start)
+
+
+def _whole_months(start, end):
+    """Complete months from start to end, like Athena's date_diff('month', start, end)."""
+    months = _calendar_months(start, end)
+    start_day = (start - start.astype('datetime64[M]')).astype(np.int64)
+    end_day = (end - end.astype('datetime64[M]')).astype(np.int64)
+    return np.where(months > 0, months - (end_day < start_day), np.where(months < 0, months + (end_day > start_day), months))
+
+
+# --- Masked reductions: `masks` is (groups x accounts), `values` is (accounts x k) ---
+def _masked_max(values, masks):
+    """Per-group max over the masked rows, ignoring NaN; NaN where a group has no values (SQL NULL)."""
+    if values.shape[0] == 0:
+        return np.full((masks.shape[0], values.shape[1]), np.nan)
+    return np.fmax.reduce(np.where(masks[:, :, None], values[None, :, :], np.nan), axis=1)
+
+
+def _masked_min(values, masks):
+    return -_masked_max(-values, masks)
+
+
+def _masked_sum(values, masks):
+    return masks.astype(np.float64) @ np.nan_to_num(values)
+
+
+def _masked_count(conditions, masks):
+    return masks.astype(np.int64) @ conditions.astype(np.int64)
+
+
+def _group_masks(symbols):
+    """(groups x rows) membership of each account_type_symbol in _GROUPS."""
+    known = (symbols >= 0) & (symbols < _GROUP_TABLE.shape[1])
+    columns = np.where(known, np.nan_to_num(symbols), 0).astype(np.int64)
+    masks = _GROUP_TABLE[:, columns]
+    masks[1:, ~known] = False
+    return masks
+
+
+def _as_2d(values):
+    return values.reshape(-1, 1)
+
+
+class RealtimeAnalyzer:
+    """
+    Scores one customer from two raw bureau pulls (month m1 -> _x, month m2 -> _y) without the
+    Athena staging tables. `product_types` maps account_type_symbol to priority_3, loan_type and
+    secured_unsecured (for_cibil_scrub_prod_type_scrub + cibil_bureau_accounttype_mapping) and
+    `lenders` maps creditor_name to lender_type (lender_mapper); both are turned into dicts once.
+
+    Inputs may be DataFrames or lists of row dicts. Per-customer pulls are a few dozen rows, so
+    everything up to the merged frame runs on NumPy arrays and dicts rather than pandas.
+    """
+
+    def __init__(self, product_types: pd.DataFrame, lenders: pd.DataFrame):
+        self.product_types = {
+            int(symbol): (priority, loan_type, security)
+            for symbol, priority, loan_type, security in zip(
+                product_types['account_type_symbol'], product_types['priority_3'],
+                product_types['loan_type'], product_types['secured_unsecured'])}
+        self.lenders = dict(zip(lenders['creditor_name'], lenders['lender_type']))
+        self.engineer = CreditFeatureEngineer()
+        self.analyzer = CustomerScoreAnalyzer()
+
+    @staticmethod
+    def _columns(rows, names):
+        """Column arrays from a DataFrame or a list of row dicts; missing columns are all-null."""
+        if isinstance(rows, pd.DataFrame):
+            return {name: rows[name].to_numpy() if name in rows.columns else np.full(len(rows), None)
+                    for name in names}
+        return {name: np.array([row.get(name) for row in rows], dtype=object) for name in names}
+
+    def _prepare_snapshot(self, accounts):
+        """
+        One report pull as NumPy arrays, with the columns the staging queries derive per account
+        (v1 and the pandas prep of the merged pull): app_date, diff_rep_pull, diff_sin_open, the
+        36-month pay-history split, latest DPD statuses, active flags, sanctioned amount and
+        utilisation. Rows without an open or reported date are dropped, as in the notebook.
+        """
+        raw = self._columns(accounts, TEXT_COLUMNS + NUMBER_COLUMNS + DATE_COLUMNS)
+        snapshot = {name: raw[name].astype(object) for name in TEXT_COLUMNS}
+        for name in NUMBER_COLUMNS:
+            values = raw[name]
+            snapshot[name] = values.astype(np.float64) if values.dtype.kind in 'biuf' else \
+                pd.to_numeric(values, errors='coerce').astype(np.float64)
+        for name in DATE_COLUMNS:
+            snapshot[name] = _days(raw[name])
+
+        keep = ~np.isnat(snapshot['date_opened']) & ~np.isnat(snapshot['date_reported']) & \
+            (snapshot['date_opened'] >= np.datetime64('1970-01-01'))
+        if not keep.all():
+            snapshot = {name: values[keep] for name, values in snapshot.items()}
+        customers = set(snapshot['customer_no'].tolist())
+        if len(customers) > 1:
+            raise ValueError(f"A report pull must hold one customer_no, got {len(customers)}.")
+
+        n = len(snapshot['customer_no'])
+        creation_date = snapshot['creation_date'].max() if n else np.datetime64('NaT', 'D')
+        # app_date: the later of the last day of month m-3 and the latest date_reported.
+        floor = (creation_date.astype('datetime64[M]') - 2).astype('datetime64[D]') - 1
+        app_date = max(floor, snapshot['date_reported'].max()) if n else floor
+        snapshot['snapshot_date'] = np.full(n, creation_date)
+        snapshot['app_date'] = np.full(n, app_date)
+        snapshot['diff_rep_pull'] = _calendar_months(snapshot['date_reported'], snapshot['app_date'])
+        snapshot['diff_sin_open'] = _calendar_months(snapshot['date_opened'], snapshot['app_date'])
+
+        histories = snapshot['pay_status_history']
+        has_history = pd.notna(histories)
+        as_reported = self.engineer._parse_pay_status_histories(histories, None)
+        # final_array: the reported months shifted right by diff_rep_pull and padded with -1.
+        source = np.arange(36)[None, :] - np.nan_to_num(snapshot['diff_rep_pull']).astype(np.int64)[:, None]
+        dpd = np.where(source >= 0, np.take_along_axis(as_reported, np.clip(source, 0, 35), axis=1), -1).astype(np.int16)
+        dpd[~has_history] = self.engineer._NO_HISTORY
+        snapshot['dpd'] = dpd
+        string_length = np.array([h.count(',') if isinstance(h, str) else np.nan for h in histories], dtype=np.float64)
+        snapshot['string_length'] = string_length
+        latest = np.where(has_history[:, None], as_reported[:, :3], np.nan).astype(np.float64)
+        snapshot['latest_payment_dpd_status'] = latest[:, 0]
+        snapshot['latest_payment_dpd_status2'] = np.where(string_length >= 2, latest[:, 1], np.nan)
+        snapshot['latest_payment_dpd_status3'] = np.where(string_length >= 3, latest[:, 2], np.nan)
+
+        closed = ~np.isnat(snapshot['date_closed'])
+        # active_inactive (staging tables) and Activity_Flag (merged pull) are two different rules.
+        creation_month = snapshot['snapshot_date'].astype('datetime64[M]').astype('datetime64[D]')
+        snapshot['active'] = ~closed & (_whole_months(snapshot['date_reported'], creation_month) < 12)
+        snapshot['activity_flag'] = np.where(closed | (snapshot['diff_rep_pull'] > 12), 0, 1)
+
+        balance = snapshot['current_balance']
+        # GREATEST(high_balance, credit_limit, current_balance), skipping nulls: every CC row has
+        # no high_balance and every loan row no credit_limit, where Athena would return NULL.
+        sanctioned = np.fmax(np.fmax(snapshot['high_balance'], snapshot['credit_limit']), balance)
+        snapshot['sanctioned_amount'] = sanctioned
+        with np.errstate(divide='ignore', invalid='ignore'):
+            snapshot['utilisation'] = np.where(sanctioned != 0, balance / sanctioned, np.nan)
+        return snapshot
+
+    def snapshot_variables(self, snapshot, enquiries=None):
+        """
+        The per-customer variables of the ..._data_v2 to _v6 staging tables for one prepared
+        snapshot, as a dict of Python scalars. Aggregates over no rows are NaN, as the SQL NULLs.
+        """
+        n = len(snapshot['customer_no'])
+        symbols = snapshot['account_type_symbol']
+        groups = _group_masks(symbols)
+        active_groups = groups & snapshot['active']
+        since_open = _whole_months(snapshot['date_opened'], snapshot['snapshot_date'])
+        since_closed = _whole_months(snapshot['date_closed'], snapshot['snapshot_date'])
+        since_reported = _whole_months(snapshot['date_reported'], snapshot['snapshot_date'])
+        families = {}
+
+        # --- v2: max DPD, overdue amounts and DPD account counts ---
+        running_max = np.maximum.accumulate(snapshot['dpd'], axis=1)
+        worst = running_max[:, [months - 1 for months in DPD_WINDOWS.values()]].astype(np.float64)
+        worst[worst == self.engineer._NO_HISTORY] = np.nan
+        families['max_dpd'] = _masked_max(worst, groups)
+        families['max_active_dpd'] = _masked_max(worst, active_groups)
+        past_due = np.fmax(snapshot['amount_past_due'], 0) * (snapshot['account_designator_symbol'] == 1)
+        in_window = since_reported[:, None] <= np.array(list(OVERDUE_WINDOWS.values()))[None, :]
+        families['overdue'] = _masked_sum(np.where(in_window, past_due[:, None], 0.0), groups)
+        over = np.hstack([worst >= threshold for threshold in DPD_THRESHOLDS.values()])
+        families['nbr_dpd'] = _masked_count(over, groups)
+        families['nbr_active_dpd'] = _masked_count(over, active_groups)
+
+        # --- v3: sanctioned amounts, balances and utilisation (active accounts only) ---
+        opened_within = np.column_stack([np.ones(n, dtype=bool) if months is None else since_open <= months
+                                         for months in SANCTION_WINDOWS.values()])
+        sanctioned = np.where(opened_within, np.nan_to_num(snapshot['sanctioned_amount'])[:, None], 0.0)
+        families['max_sanctioned'] = np.fmax(_masked_max(sanctioned, active_groups), 0)
+        families['total_sanctioned'] = _masked_sum(sanctioned, active_groups)
+        balance = _masked_sum(_as_2d(snapshot['current_balance']), active_groups)
+        families['total_balance'] = balance
+        total_sanctioned = families['total_sanctioned'][:, :1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            families['utilisation'] = np.where(total_sanctioned != 0, balance / total_sanctioned, np.nan)
+        utilisation = _as_2d(snapshot['utilisation'])
+        counted = _masked_count(~np.isnan(utilisation), active_groups)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            families['avg_utilisation'] = np.where(counted > 0, _masked_sum(utilisation, active_groups) / counted, np.nan)
+
+        # --- v4: bureau vintage and first/latest product ---
+        families['vintage'] = np.vstack([
+            np.column_stack([_masked_max(_as_2d(since_open), masks), _masked_min(_as_2d(since_open), masks)])
+            for masks in (groups, active_groups)])
+
+        # --- v5: enquiry counts ---
+        families['enquiries'] = self._enquiry_counts(enquiries, snapshot['snapshot_date'][:1])
+
+        # --- v6: account counts ---
+        families['accounts_ever'] = _masked_count(_as_2d(np.ones(n, dtype=bool)), groups)
+        families['accounts_active'] = _masked_count(_as_2d(np.ones(n, dtype=bool)), active_groups)
+        families['accounts_new'] = _masked_count(since_open[:, None] <= np.array(ACCOUNT_MONTHS)[None, :], groups)
+        families['accounts_closed'] = _masked_count(since_closed[:, None] <= np.array(ACCOUNT_MONTHS)[None, :], groups)
+        products = len(SEGMENTS) - len(ENQUIRY_PREFIXES)
+        families['ever_product'] = (families['accounts_ever'][1:1 + products] > 0).astype(np.int64)
+        families['active_product'] = (families['accounts_active'][1:1 + products] > 0).astype(np.int64)
+
+        variables = {}
+        for family, values in families.items():
+            variables.update(zip(VARIABLE_NAMES[family], values.ravel().tolist()))
+        variables['risk_score'] = float(np.fmax.reduce(snapshot['risk_score'])) if n else np.nan
+        if n:
+            opened = snapshot['date_opened']
+            variables['latest_product'] = float(symbols[np.argmax(opened)])
+            variables['first_product'] = float(symbols[np.argmin(opened)])
+        else:
+            variables['latest_product'] = variables['first_product'] = np.nan
+        return variables
+
+    def _enquiry_counts(self, enquiries, snapshot_date):
+        """(groups x ENQUIRY_MONTHS) counts of enquiries made on or before the snapshot date."""
+        counts = np.zeros((len(_GROUPS), len(ENQUIRY_MONTHS)), dtype=np.int64)
+        if enquiries is None or len(enquiries) == 0 or len(snapshot_date) == 0:
+            return counts
+        columns = self._columns(enquiries, ['inquiry_date', 'inquiry_type'])
+        inquiry_dates = _days(columns['inquiry_date'])
+        inquiry_type = pd.to_numeric(columns['inquiry_type'], errors='coerce').astype(np.float64)
+        age = _whole_months(inquiry_dates, np.full(len(inquiry_dates), snapshot_date[0]))
+        groups = _group_masks(inquiry_type) & (inquiry_dates <= snapshot_date[0])
+        return _masked_count(age[:, None] <= np.array(ENQUIRY_MONTHS)[None, :], groups)
+
+    def _match_accounts(self, x, y):
+        """
+        Row pairs of the x/y outer join, -1 on the side an account is missing from. Accounts are
+        matched on (last 5 characters of account_number, creditor_name, date_opened), then the
+        rows left over on (account_number suffix, date_opened), like the notebook's primary and
+        secondary joins. Duplicate keys pair up in row order instead of multiplying.
+        """
+        x_keys = [(str(a)[-5:], c, d) for a, c, d in zip(x['account_number'], x['creditor_name'], x['date_opened'].tolist())]
+        y_keys = [(str(a)[-5:], c, d) for a, c, d in zip(y['account_number'], y['creditor_name'], y['date_opened'].tolist())]
+        pairs, used_y = [], set()
+        unmatched_x = list(range(len(x_keys)))
+        for key_of in (lambda key: key, lambda key: (key[0], key[2])):
+            free = {}
+            for j, key in enumerate(y_keys):
+                if j not in used_y:
+                    free.setdefault(key_of(key), []).append(j)
+            still_unmatched = []
+            for i in unmatched_x:
+                candidates = free.get(key_of(x_keys[i]))
+                if candidates:
+                    j = candidates.pop(0)
+                    used_y.add(j)
+                    pairs.append((i, j))
+                else:
+                    still_unmatched.append(i)
+            unmatched_x = still_unmatched
+        pairs += [(i, -1) for i in unmatched_x]
+        pairs += [(-1, j) for j in range(len(y_keys)) if j not in used_y]
+        return np.array([i for i, _ in pairs], dtype=np.int64), np.array([j for _, j in pairs], dtype=np.int64)
+
+    @staticmethod
+    def _take(values, rows):
+        """values[rows] with nulls (NaN, NaT or NaN objects) where rows is -1."""
+        taken = values[np.clip(rows, 0, None)] if len(values) else np.empty(len(rows), dtype=values.dtype)
+        if values.dtype.kind in 'fi':
+            taken = taken.astype(np.float64)
+        missing = rows < 0
+        if not missing.any():
+            return taken
+        if values.dtype.kind == 'M':
+            return np.where(missing, np.datetime64('NaT', 'D'), taken)
+        if values.dtype.kind in 'fi':
+            return np.where(missing, np.nan, taken)
+        taken = taken.astype(object)
+        taken[missing] = np.nan
+        return taken
+
+    def _merge_snapshots(self, x, y):
+        """The merged x/y account frame create_features expects (final_result in the notebook)."""
+        x_rows, y_rows = self._match_accounts(x, y)
+        in_y = y_rows >= 0
+        columns = {
+            'customer_no': np.where(in_y, self._take(y['customer_no'], y_rows), self._take(x['customer_no'], x_rows)),
+            'creditor_name': np.where(in_y, self._take(y['creditor_name'], y_rows), self._take(x['creditor_name'], x_rows)),
+            'date_opened': np.where(in_y, self._take(y['date_opened'], y_rows), self._take(x['date_opened'], x_rows)),
+        }
+        columns['acc_no'] = np.array([str(a)[-5:] for a in np.where(
+            in_y, self._take(y['account_number'], y_rows), self._take(x['account_number'], x_rows))], dtype=object)
+        columns['lender_type'] = np.array([self.lenders.get(c, np.nan) for c in columns['creditor_name']], dtype=object)
+        columns['_merge'] = np.where(x_rows < 0, 'right_only', np.where(in_y, 'both', 'left_only')).astype(object)
+
+        for period, snapshot, rows in (('x', x, x_rows), ('y', y, y_rows)):
+            for name in ['pay_status_history', 'account_number', 'account_type_symbol', 'amount_past_due',
+                         'current_balance', 'high_balance', 'credit_limit', 'risk_score', 'date_closed',
+                         'date_reported', 'app_date', 'diff_sin_open', 'diff_rep_pull', 'string_length',
+                         'latest_payment_dpd_status', 'latest_payment_dpd_status2', 'latest_payment_dpd_status3']:
+                columns[f'{name}_{period}'] = self._take(snapshot[name], rows)
+            columns[f'creation_date_{period}'] = self._take(snapshot['snapshot_date'], rows)
+            columns[f'Activity_Flag_{period}'] = np.where(rows >= 0, self._take(snapshot['activity_flag'], rows), 0).astype(np.int64)
+            products = [self.product_types.get(int(s), (np.nan,) * 3) if s == s else (np.nan,) * 3
+                        for s in columns[f'account_type_symbol_{period}']]
+            for k, name in enumerate(['priority_3', 'loan_type', 'secured_unsecured']):
+                columns[f'{name}_{period}'] = np.array([product[k] for product in products], dtype=object)
+            dpd = snapshot['dpd'][np.clip(rows, 0, None)].astype(np.float64) if len(snapshot['dpd']) else \
+                np.empty((len(rows), 36))
+            dpd[(rows < 0) | (dpd == self.engineer._NO_HISTORY).all(axis=1)] = np.nan
+            for i in range(36):
+                columns[f'pay_hist_{i + 1}_{period}'] = dpd[:, i]
+        return pd.DataFrame(columns)
+
+    def analyze_customer(self, accounts_m1, accounts_m2, enquiries=None, narrative=True):
+        """
+        Scores one customer from the m1 (_x) and m2 (_y) report pulls and their enquiries
+        (inquiry_date and inquiry_type for the counts; subscriber_name and loan_type for the
+        report). Returns a dict with 'variables' (every staging-table variable as _x, _y and
+        _diff, like ..._m2_m1_diff_data_overall) and, when `narrative` is true, the merged
+        'features' frame plus the 'customer_info' and 'customer_credit_update' texts.
+
+        The texts are those the batch pipeline (create_features with
+        fill_totals_within_customer=True, then generate_training_data) gives this customer:
+        a customer scored alone has no next customer to take totals from. The variables take a
+        few ms; the narrative runs the full pandas feature and rule pipeline on the customer's
+        handful of rows and is bound by its per-column overhead (tens of ms, see
+        benchmarks.bench_realtime).
+        """
+        x = self._prepare_snapshot(accounts_m1)
+        y = self._prepare_snapshot(accounts_m2)
+        variables_x = self.snapshot_variables(x, enquiries)
+        variables_y = self.snapshot_variables(y, enquiries)
+        variables = {f'{name}_x': value for name, value in variables_x.items()}
+        variables.update((f'{name}_y', value) for name, value in variables_y.items())
+        numeric = [name for name in variables_x if name not in CODE_VARIABLES]
+        diff = np.array([variables_y[name] for name in numeric], dtype=np.float64) - \
+            np.array([variables_x[name] for name in numeric], dtype=np.float64)
+        variables.update(zip([f'{name}_diff' for name in numeric], diff.tolist()))
+        result = {'variables': variables}
+        if not narrative:
+            return result
+
+        features = self.engineer.create_features(self._merge_snapshots(x, y), fill_totals_within_customer=True)
+        df_enq = enquiries if enquiries is None or isinstance(enquiries, pd.DataFrame) else pd.DataFrame(enquiries)
+        training = self.analyzer.generate_training_data(features, df_enq, batched=True)
+        result['features'] = features
+        result['customer_info'] = training['customer_info'].iloc[0] if len(training) else ''
+        result['customer_credit_update'] = training['customer_credit_update'].iloc[0] if len(training) else ''
+        return result
@@ -0,0 +1,216 @@
+# response_cache.py
+# Cache of model responses keyed on what the model actually sees. Most customers' reports come
+# out the same from one monthly run to the next, or differ only in the customer number in the
+# header, so the key is a hash of the normalised customer_info report plus the system prompt,
+# user command and sampling parameters. Two tiers: an in-memory LRU, and optionally a directory
+# of small JSON files shared between runs, with a size cap (least recently used files go first)
+# and a time-to-live. Only greedy (temperature 0) responses are cached; sampled ones are not
+# reproducible, so those requests bypass the cache.
+#   cache = ResponseCache(directory='response_cache', namespace='ft-llama3-8b-credit-analyst')
+#   engine = BatchInference(backend, cache=cache)
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+
+# Bump when normalize_report or the key layout changes, so old entries stop matching.
+KEY_VERSION = 1
+_HEADER = re.compile(r'^--- Credit Profile Report for Customer: .* ---$', re.MULTILINE)
+_TRAILING_SPACE = re.compile(r'[ \t]+$', re.MULTILINE)
+_BLANK_LINES = re.compile(r'\n{3,}')
+
+
+def normalize_report(customer_info):
+    """The report with the customer number blanked out and whitespace differences removed."""
+    text = customer_info.replace('\r\n', '\n').strip()
+    text = _TRAILING_SPACE.sub('', text)
+    text = _HEADER.sub('--- Credit Profile Report ---', text)
+    return _BLANK_LINES.sub('\n\n', text)
+
+
+def is_cacheable(sampling):
+    """Greedy decoding only: with temperature > 0 the same prompt should not give the same answer."""
+    return not sampling.get('temperature')
+
+
+def cache_key(customer_info, system_prompt, user_command, sampling, namespace=''):
+    """
+    sha256 hex digest over the normalised report, the prompts and the sampling parameters.
+    `namespace` separates models (or adapters) sharing one cache directory.
+    """
+    payload = json.dumps([KEY_VERSION, namespace, normalize_report(customer_info), system_prompt, user_command,
+                          sorted(sampling.items())], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier response store. get(key) looks in memory, then on disk (promoting disk hits into
+    memory); put(key, value) writes both. Values are JSON-serialisable dicts. The memory tier
+    keeps the `max_entries` most recently used values; the disk tier, when `directory` is given,
+    keeps at most `max_bytes` of files, removing the least recently used first. Entries older
+    than `ttl_seconds` (None: never) are deleted and count as misses (and as expired). Counters
+    are in `stats`.
+    """
+
+    def __init__(self, max_entries=4096, directory=None, max_bytes=512 * 1024 ** 2, ttl_seconds=30 * 24 * 3600,
+                 namespace=''):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.namespace = namespace
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'expired': 0, 'bypassed': 0,
+                      'memory_evictions': 0, 'disk_evictions': 0}
+        self._memory = OrderedDict()  # key -> (created, value), most recently used last
+        self._disk = {}  # key -> (last used, size in bytes)
+        self._disk_bytes = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._scan()
+
+    def key(self, customer_info, system_prompt, user_command, sampling):
+        return cache_key(customer_info, system_prompt, user_command, sampling, self.namespace)
+
+    # --- Lookups ---
+
+    def get(self, key):
+        """The cached value, or None."""
+        entry = self._memory.get(key)
+        if entry is not None:
+            if self._expired(entry[0]):
+                del self._memory[key]
+                self._remove_file(key)
+                self.stats['expired'] += 1
+            else:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return entry[1]
+        if key in self._disk:
+            entry = self._read_file(key)
+            if entry is not None:
+                self.stats['disk_hits'] += 1
+                self._remember(key, entry)
+                return entry[1]
+        self.stats['misses'] += 1
+        return None
+
+    def put(self, key, value):
+        created = time.time()
+        self._remember(key, (created, value))
+        if self.directory is not None:
+            self._write_file(key, created, value)
+
+    def bypass(self, n=1):
+        """Counts requests that skipped the cache (sampled generation)."""
+        self.stats['bypassed'] += n
+
+    def hit_rate(self):
+        hits = self.stats['memory_hits'] + self.stats['disk_hits']
+        lookups = hits + self.stats['misses']
+        return hits / lookups if lookups else float('nan')
+
+    def clear(self):
+        """Empties both tiers (the counters are kept)."""
+        self._memory.clear()
+        for key in list(self._disk):
+            self._remove_file(key)
+
+    def __len__(self):
+        return len(self._disk) if self.directory is not None else len(self._memory)
+
+    # --- Memory tier ---
+
+    def _expired(self, created):
+        return self.ttl_seconds is not None and time.time() - created > self.ttl_seconds
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats['memory_evictions'] += 1
+
+    # --- Disk tier ---
+    # One file per entry, <directory>/<key[:2]>/<key>.json holding {"created", "value"}. The
+    # file's mtime is its last use: disk hits touch it. Other processes may share the
+    # directory; a file that disappeared under us is a miss, never an error.
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def _scan(self):
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.json'):
+                    stat = entry.stat()
+                    self._disk[entry.name[:-5]] = (stat.st_mtime, stat.st_size)
+                    self._disk_bytes += stat.st_size
+
+    def _read_file(self, key):
+        """(created, value) from disk, or None when the file is gone, unreadable or expired."""
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self._forget(key)
+            return None
+        if self._expired(entry['created']):
+            self._remove_file(key)
+            self.stats['expired'] += 1
+            return None
+        now = time.time()
+        try:
+            os.utime(self._path(key), (now, now))
+        except OSError:
+            pass
+        self._disk[key] = (now, self._disk[key][1])
+        return entry['created'], entry['value']
+
+    def _write_file(self, key, created, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({'created': created, 'value': value}, ensure_ascii=False).encode('utf-8')
+        partial = f'{path}.{os.getpid()}.tmp'
+        with open(partial, 'wb') as f:
+            f.write(data)
+        os.replace(partial, path)  # readers never see half a file
+        self._forget(key)
+        self._disk[key] = (created, len(data))
+        self._disk_bytes += len(data)
+        if self._disk_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """Removes least recently used files until the tier is back under 90% of max_bytes."""
+        target = 0.9 * self.max_bytes
+        for key, _ in sorted(self._disk.items(), key=lambda item: item[1][0]):
+            if self._disk_bytes <= target:
+                break
+            self._remove_file(key)
+            self.stats['disk_evictions'] += 1
+
+    def _forget(self, key):
+        entry = self._disk.pop(key, None)
+        if entry is not None:
+            self._disk_bytes -= entry[1]
+
+    def _remove_file(self, key):
+        if self.directory is None:
+            return
+        self._forget(key)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def summary(self):
+        s = self.stats
+        return (f"hit rate {self.hit_rate():.0%} ({s['memory_hits']} memory, {s['disk_hits']} disk, {s['misses']} misses of "
+                f"which {s['expired']} expired, {s['bypassed']} bypassed); evictions {s['memory_evictions']} memory, "
+                f"{s['disk_evictions']} disk; {len(self._memory)} in memory, {len(self._disk)} files "
+                f"({self._disk_bytes / 1024 ** 2:.1f} MB)")
@@ -0,0 +1,212 @@
+# synthetic_data.py
+# Seeded synthetic bureau data in the exact shapes the pipeline reads, so performance work can
+# be measured without production pulls:
+#   merged_accounts()  the merged x/y account frame fed to CreditFeatureEngineer.create_features
+#   enquiries()        the enquiry table fed to CustomerScoreAnalyzer.generate_training_data
+#   report_pulls()     two raw score_cibil_report pulls + enquiries, for realtime.RealtimeAnalyzer
+# Everything is vectorised, so a million account rows take seconds.
+import numpy as np
+import pandas as pd
+
+# (account_type_symbol, priority_3, loan_type, secured_unsecured, share of accounts)
+PRODUCT_TYPES = [(10, '01.0 CC', 'Credit Card', '2. Unsecured', 0.34), (5, '02.0 PL', 'Personal Loan', '2. Unsecured', 0.20),
+                 (2, '03.0 HL', 'Housing Loan', '1. Secured', 0.05), (1, '04.0 AL', 'Auto Loan', '1. Secured', 0.08),
+                 (13, '05.0 TW', 'Two-wheeler Loan', '1. Secured', 0.11), (6, '06.0 CD', 'Consumer Loan', '2. Unsecured', 0.22)]
+LENDERS = [('HDFC BANK', 'Private sector'), ('SBI', 'Public sector'), ('IDFC FIRST BANK', 'Private sector'),
+           ('BAJAJ FIN LTD', 'NBFC'), ('TCL', 'NBFC'), ('LNTFIN', 'NBFC'), ('SBMBKINDIA', 'Foreign bank'),
+           ('CANARA BANK', 'Public sector'), ('DMIFINANCE', 'Corporate bank')]
+CREATION_DATES = {'x': pd.Timestamp('2025-01-31'), 'y': pd.Timestamp('2025-02-28')}
+MERGE_SHARES = {'both': 0.85, 'left_only': 0.07, 'right_only': 0.08}
+
+# Monthly DPD states and how often a month lands in each; the codes are what pay_status_history
+# uses for them half of the time (the other half is the zero-padded number).
+DPD_STATES = [0, 5, 12, 30, 60, 90, 180]
+DPD_SHARES = [0.90, 0.02, 0.02, 0.03, 0.015, 0.01, 0.005]
+DPD_CODES = {0: b'STD', 60: b'SMA', 90: b'SUB', 180: b'DBT'}
+
+
+def product_table():
+    return pd.DataFrame([p[:4] for p in PRODUCT_TYPES], columns=['account_type_symbol', 'priority_3', 'loan_type', 'secured_unsecured'])
+
+
+def lender_table():
+    return pd.DataFrame(LENDERS, columns=['creditor_name', 'lender_type'])
+
+
+def accounts_per_customer(rng, n_rows):
+    """
+    Account counts per customer adding up to n_rows: a right-skewed (negative binomial) spread
+    with a median of 4-5 accounts and a tail past 30, like a bureau file.
+    """
+    counts = []
+    total = 0
+    while total < n_rows:
+        batch = 1 + rng.negative_binomial(2, 0.3, size=max((n_rows - total) // 4, 16))
+        counts.append(np.minimum(batch, 60))
+        total += int(counts[-1].sum())
+    counts = np.concatenate(counts)
+    ends = np.cumsum(counts)
+    last = int(np.searchsorted(ends, n_rows))
+    counts = counts[:last + 1].copy()
+    counts[-1] -= int(ends[last] - n_rows)
+    return counts
+
+
+def _history_strings(dpd, coded):
+    """
+    pay_status_history strings ('ddd,' or a status code per month, most recent first) for an
+    int (rows x 36) DPD matrix padded with -2 after the reported months; -1 prints as XXX and
+    months flagged in `coded` print their status code where one exists.
+    """
+    n = len(dpd)
+    tokens = np.zeros((n, 36, 4), dtype=np.uint8)
+    values = np.clip(dpd, 0, 999)
+    tokens[:, :, 0] = values // 100 + 48
+    tokens[:, :, 1] = values // 10 % 10 + 48
+    tokens[:, :, 2] = values % 10 + 48
+    tokens[:, :, 3] = ord(',')
+    for value, code in [(-1, b'XXX'), *DPD_CODES.items()]:
+        hit = (dpd == value) if value == -1 else (dpd == value) & coded
+        tokens[hit, :3] = np.frombuffer(code, dtype=np.uint8)
+    tokens[dpd == -2] = 0  # trailing NUL bytes end the fixed-width string
+    return tokens.reshape(n, 144).view('S144').ravel().astype(str).astype(object)
+
+
+def merged_accounts(n_rows, seed=0):
+    """
+    A merged x/y account frame of n_rows rows with the columns create_features and the
+    analyzer read: keys and lender, _merge, and per period the pay history (pay_hist_1..36 and
+    pay_status_history), latest DPD statuses, balances and limits, Activity_Flag, product
+    columns, risk score, account number and creation_date.
+    """
+    rng = np.random.default_rng(seed)
+    counts = accounts_per_customer(rng, n_rows)
+    n_customers = len(counts)
+    customer_ids = 3_500_000_000_000_000_000 + rng.choice(10 ** 15, size=n_customers, replace=False)
+    customer = np.repeat(np.arange(n_customers), counts)
+
+    product = rng.choice(len(PRODUCT_TYPES), size=n_rows, p=[p[4] for p in PRODUCT_TYPES])
+    symbols, priorities, loan_types, security = (np.array([p[k] for p in PRODUCT_TYPES], dtype=object) for k in range(4))
+    is_cc = symbols[product] == 10
+    lender = rng.integers(len(LENDERS), size=n_rows)
+    merge = rng.choice(list(MERGE_SHARES), size=n_rows, p=list(MERGE_SHARES.values()))
+    present = {'x': merge != 'right_only', 'y': merge != 'left_only'}
+
+    # New accounts (only in _y) were opened in the last few months, the rest up to 10 years ago.
+    age_months = np.where(merge == 'right_only', rng.integers(0, 4, n_rows), rng.integers(2, 120, n_rows))
+    date_opened = CREATION_DATES['y'] - pd.to_timedelta(age_months * 30 + rng.integers(0, 28, n_rows), unit='D')
+    account_number = np.char.add('AC', rng.integers(10 ** 9, 10 ** 10, n_rows).astype(str)).astype(object)
+
+    df = pd.DataFrame({
+        'customer_no': customer_ids[customer],
+        'creditor_name': np.array([name for name, _ in LENDERS], dtype=object)[lender],
+        'acc_no': np.array([a[-5:] for a in account_number], dtype=object),
+        'date_opened': date_opened,
+        'lender_type': np.array([kind for _, kind in LENDERS], dtype=object)[lender],
+        '_merge': merge.astype(object),
+        'diff_sin_open_y': age_months.astype(np.float64),
+    })
+
+    # Month-by-month DPD over 37 months (the y history plus the month before it), mostly
+    # current, with delinquent customers more likely to miss again.
+    customer_risk = rng.beta(0.6, 6.0, n_customers)[customer]
+    months = rng.choice(len(DPD_STATES), size=(n_rows, 37), p=DPD_SHARES)
+    delinquent = rng.random((n_rows, 37)) < customer_risk[:, None]
+    months = np.where(delinquent, np.maximum(months, rng.integers(1, len(DPD_STATES), (n_rows, 37))), months)
+    months_dpd = np.array(DPD_STATES)[months]
+    months_dpd[rng.random((n_rows, 37)) < 0.01] = -1  # XXX: month not reported
+    coded = rng.random((n_rows, 37)) < 0.5
+    # The x pull is one month older: the y history without its first month.
+    reported = {'y': np.minimum(age_months + 1, 36), 'x': np.minimum(age_months, 36)}
+    window = {'y': slice(0, 36), 'x': slice(1, 37)}
+    dpd = {period: np.where(np.arange(36)[None, :] >= reported[period][:, None], -2, months_dpd[:, window[period]])
+           for period in ['x', 'y']}
+
+    limit = rng.integers(10, 500, n_rows) * 1000.0
+    utilisation = rng.beta(1.2, 2.0, n_rows)
+    risk_score = rng.integers(550, 850, n_customers).astype(np.float64)
+    closed_y = rng.random(n_rows) < 0.25
+    closed = {'y': closed_y, 'x': closed_y & (rng.random(n_rows) < 0.9)}
+    for period in ['x', 'y']:
+        absent = ~present[period]
+        history = np.where(absent[:, None], -2, dpd[period])
+        balance = np.floor(limit * np.clip(utilisation + (0.05 * rng.standard_normal(n_rows) if period == 'y' else 0), 0, 1.2))
+        matrix = np.where(history == -2, -1, history).astype(np.float64)
+        matrix[absent] = np.nan
+        latest = np.where(absent[:, None], np.nan, np.maximum(history[:, :3], 0).astype(np.float64))
+        length = (history != -2).sum(axis=1)
+        period_columns = {
+            f'pay_status_history_{period}': np.where(absent, np.nan, _history_strings(history, coded[:, window[period]])),
+            f'latest_payment_dpd_status_{period}': latest[:, 0],
+            f'latest_payment_dpd_status2_{period}': np.where(length >= 2, latest[:, 1], np.nan),
+            f'latest_payment_dpd_status3_{period}': np.where(length >= 3, latest[:, 2], np.nan),
+            f'current_balance_{period}': np.where(absent | closed[period], np.where(absent, np.nan, 0.0), balance),
+            f'high_balance_{period}': np.where(absent | is_cc, np.nan, limit),
+            f'credit_limit_{period}': np.where(absent | ~is_cc, np.nan, limit),
+            f'Activity_Flag_{period}': np.where(absent | closed[period], 0, 1),
+            f'priority_3_{period}': np.where(absent, np.nan, priorities[product]),
+            f'loan_type_{period}': np.where(absent, np.nan, loan_types[product]),
+            f'risk_score_{period}': np.where(absent, np.nan, risk_score[customer] + (
+                np.round(12 * rng.standard_normal(n_customers))[customer] if period == 'y' else 0)),
+            f'account_number_{period}': np.where(absent, np.nan, account_number),
+            f'account_type_symbol_{period}': np.where(absent, np.nan, symbols[product].astype(np.float64)),
+            f'creation_date_{period}': CREATION_DATES[period].strftime('%Y-%m-%d'),
+            **{f'pay_hist_{i + 1}_{period}': matrix[:, i] for i in range(36)},
+        }
+        df = pd.concat([df, pd.DataFrame(period_columns, index=df.index)], axis=1)
+    df['secured_unsecured_y'] = np.where(present['y'], security[product], np.nan)
+    return df
+
+
+def enquiries(accounts, seed=0, per_customer=1.2):
+    """Recent enquiries for the customers in `accounts` (Poisson per customer), analyzer schema."""
+    rng = np.random.default_rng(seed + 1)
+    customers = pd.unique(accounts['customer_no'])
+    counts = rng.poisson(per_customer, len(customers))
+    n = int(counts.sum())
+    product = rng.choice(len(PRODUCT_TYPES), size=n, p=[p[4] for p in PRODUCT_TYPES])
+    days = rng.integers(0, 28, n)
+    return pd.DataFrame({
+        'customer_no': np.repeat(customers, counts),
+        'subscriber_name': np.array([name for name, _ in LENDERS], dtype=object)[rng.integers(len(LENDERS), size=n)],
+        'loan_type': np.array([p[2] for p in PRODUCT_TYPES], dtype=object)[product],
+        'inquiry_type': np.array([p[0] for p in PRODUCT_TYPES])[product],
+        'inquiry_date': (CREATION_DATES['y'] - pd.to_timedelta(days, unit='D')).strftime('%Y-%m-%d').to_numpy(dtype=object),
+    })
+
+
+def report_pulls(n_customers, seed=0):
+    """
+    Two consecutive raw report pulls (score_cibil_report rows, creation dates a month apart) and
+    an enquiry table: the m2 pull reports every m1 account one month later, plus new accounts.
+    """
+    rng = np.random.default_rng(seed)
+    tokens = {0: ['000', 'STD'], 30: ['030'], 60: ['060', 'SMA'], 90: ['090', 'SUB']}
+    m1, m2, enquiry_rows = [], [], []
+    for customer_no in range(n_customers):
+        risk_score = float(rng.integers(600, 850))
+        for _ in range(int(rng.integers(1, 12))):
+            symbol = PRODUCT_TYPES[rng.integers(len(PRODUCT_TYPES))][0]
+            limit = float(rng.integers(10, 500) * 1000)
+            n_months = int(rng.integers(1, 36))
+            history = [str(rng.choice(tokens[int(rng.choice([0, 0, 0, 0, 0, 0, 30, 60, 90]))])) for _ in range(n_months)]
+            row = {'customer_no': customer_no, 'account_number': f'AC{rng.integers(10 ** 8)}',
+                   'creditor_name': LENDERS[rng.integers(len(LENDERS))][0], 'account_type_symbol': symbol,
+                   'account_designator_symbol': 1, 'amount_past_due': float(rng.integers(0, 5000)),
+                   'high_balance': np.nan if symbol == 10 else limit, 'credit_limit': limit if symbol == 10 else np.nan,
+                   'date_opened': pd.Timestamp('2022-01-01') + pd.Timedelta(days=int(rng.integers(0, 1100))),
+                   'date_closed': pd.NaT}
+            balance = float(rng.integers(0, int(limit)))
+            if rng.random() < 0.92:
+                m1.append({**row, 'creation_date': pd.Timestamp('2025-01-15'), 'date_reported': pd.Timestamp('2024-12-31'),
+                           'current_balance': balance, 'risk_score': risk_score,
+                           'pay_status_history': ''.join(token + ',' for token in history)})
+            m2.append({**row, 'creation_date': pd.Timestamp('2025-02-15'), 'date_reported': pd.Timestamp('2025-01-31'),
+                       'current_balance': float(np.floor(balance * rng.random())), 'risk_score': risk_score + float(rng.integers(-30, 30)),
+                       'pay_status_history': ''.join(token + ',' for token in [str(rng.choice(tokens[0]))] + history)})
+        for _ in range(int(rng.poisson(1.0))):
+            symbol, _, loan_type, _, _ = PRODUCT_TYPES[rng.integers(len(PRODUCT_TYPES))]
+            enquiry_rows.append({'customer_no': customer_no, 'inquiry_type': symbol, 'loan_type': loan_type,
+                                 'subscriber_name': LENDERS[rng.integers(len(LENDERS))][0],
+                                 'inquiry_date': (pd.Timestamp('2024-03-01') + pd.Timedelta(days=int(rng.integers(0, 340)))).strftime('%Y-%m-%d')})
+    return pd.DataFrame(m1), pd.DataFrame(m2), pd.DataFrame(enquiry_rows)
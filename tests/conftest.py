@@ -0,0 +1,33 @@
+# conftest.py
+# The pipeline modules live flat in the repo folder (the numbered ones via module_loader), so
+# the tests import them from there. Fixtures are small seeded synthetic_data frames.
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic_data  # noqa: E402
+from module_loader import load_module  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def CreditFeatureEngineer():
+    return load_module('1.credit_feature_engineer.py').CreditFeatureEngineer
+
+
+@pytest.fixture(scope='session')
+def CustomerScoreAnalyzer():
+    return load_module('1.customer_analyzer.py').CustomerScoreAnalyzer
+
+
+@pytest.fixture
+def accounts():
+    """A merged x/y account frame of 300 rows (about 60 customers)."""
+    return synthetic_data.merged_accounts(300, seed=3)
+
+
+@pytest.fixture
+def enquiries(accounts):
+    return synthetic_data.enquiries(accounts, seed=3)
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from batch_eval import ROUGE_TYPES, BertScorer, batch_rouge, load_pairs
+
+PREDICTIONS = [{'customer_no': 3, 'response': 'c'}, {'customer_no': 1, 'response': 'a'}, {'customer_no': 2, 'response': 'b'}]
+REFERENCES = [{'customer_no': '1', 'customer_credit_update': 'A'}, {'customer_no': '2', 'customer_credit_update': 'B'},
+              {'customer_no': '3', 'customer_credit_update': 'C'}]
+
+
+def test_load_pairs_joins_in_prediction_order():
+    pairs = load_pairs(PREDICTIONS, REFERENCES)
+    assert pairs.values.tolist() == [['3', 'c', 'C'], ['1', 'a', 'A'], ['2', 'b', 'B']]
+
+
+@pytest.mark.parametrize('predictions, references', [
+    (PREDICTIONS + [{'customer_no': 1, 'response': 'a again'}], REFERENCES),
+    (PREDICTIONS, REFERENCES + [{'customer_no': '2', 'customer_credit_update': 'B again'}]),
+])
+def test_load_pairs_rejects_duplicate_customers(predictions, references):
+    with pytest.raises(ValueError, match='more than once'):
+        load_pairs(predictions, references)
+
+
+def test_load_pairs_rejects_unmatched_customers_unless_allowed():
+    predictions = PREDICTIONS[1:] + [{'customer_no': 4, 'response': 'd'}]
+    with pytest.raises(ValueError, match="1 customer_no only in the predictions, e.g. \\['4'\\]; 1 customer_no only in the references, e.g. \\['3'\\]"):
+        load_pairs(predictions, REFERENCES)
+    with pytest.warns(UserWarning, match='Scoring matched pairs only'):
+        pairs = load_pairs(predictions, REFERENCES, allow_unmatched=True)
+    assert pairs.values.tolist() == [['1', 'a', 'A'], ['2', 'b', 'B']]
+
+
+EDGE_CASES = [
+    ('', ''),
+    ('', 'Good:- On-time payments.'),
+    ('DPD 30+ on 2 accounts!!', 'dpd 30+ on two accounts'),
+    ('Utilisation rose to 85% (was 40%).', 'Utilisation fell to 40% (was 85%).'),
+    ('the the the cat', 'the cat the cat'),
+    ('Café loans — naïve résumé', 'cafe loans naive resume'),
+]
+
+
+@pytest.fixture
+def narratives(CreditFeatureEngineer, CustomerScoreAnalyzer, accounts, enquiries):
+    features = CreditFeatureEngineer().create_features(accounts)
+    return CustomerScoreAnalyzer().generate_training_data(features, enquiries, batched=True)['customer_credit_update'].tolist()
+
+
+def test_rouge_matches_rouge_score(narratives):
+    rouge_scorer = pytest.importorskip('rouge_score.rouge_scorer')
+    # Each narrative against its neighbour's: similar wording, different facts.
+    pairs = list(zip(narratives, narratives[1:] + narratives[:1])) + EDGE_CASES
+    predictions, references = zip(*pairs)
+    scorer = rouge_scorer.RougeScorer(ROUGE_TYPES, use_stemmer=False)
+    expected = pd.DataFrame([{name: score.fmeasure for name, score in scorer.score(reference, prediction).items()}
+                             for prediction, reference in pairs], columns=ROUGE_TYPES)
+    pd.testing.assert_frame_equal(batch_rouge(predictions, references, n_workers=2, chunk_size=16), expected,
+                                  check_exact=False, rtol=1e-12)
+
+
+class _TableEmbedder:
+    """Fixed embeddings per text, first and last rows standing in for the special tokens."""
+    name = 'table'
+
+    def __init__(self, table):
+        self.table = table
+
+    def embed(self, texts):
+        return [np.asarray(self.table[text], dtype=np.float32) for text in texts]
+
+
+def test_bert_scorer_matches_special_tokens_without_weighting_them():
+    cls, sep = [1.0, 0.0, 0.0], [0.0, 1.0, 0.0]
+    table = {
+        'candidate': [cls, [1.0, 0.0, 0.0], [0.0, 0.0, 1.0], sep],
+        'reference': [cls, [0.0, 0.0, 1.0], sep],
+        'empty': [cls, sep],
+    }
+    scores = BertScorer(_TableEmbedder(table)).score(['candidate', 'candidate'], ['reference', 'empty'])
+    # The candidate's first token only matches the reference's <s>; the reference's one token matches exactly.
+    np.testing.assert_allclose(scores.iloc[0], [1.0, 1.0, 1.0])
+    np.testing.assert_allclose(scores.iloc[1], [0.0, 0.0, 0.0])
+
+
+@pytest.fixture
+def tiny_roberta(tmp_path):
+    """A randomly initialised 3-layer RoBERTa with a byte-level vocabulary, saved to disk."""
+    pytest.importorskip('torch')
+    transformers = pytest.importorskip('transformers')
+    from transformers.convert_slow_tokenizer import bytes_to_unicode
+
+    import json
+    import torch
+
+    vocab = {token: i for i, token in enumerate(['<s>', '<pad>', '</s>', '<unk>', *bytes_to_unicode().values(), '<mask>'])}
+    (tmp_path / 'vocab.json').write_text(json.dumps(vocab))
+    (tmp_path / 'merges.txt').write_text('#version: 0.2\n')
+    tokenizer = transformers.RobertaTokenizer(str(tmp_path / 'vocab.json'), str(tmp_path / 'merges.txt'), model_max_length=126)
+    tokenizer.save_pretrained(tmp_path)
+    torch.manual_seed(0)
+    config = transformers.RobertaConfig(vocab_size=len(vocab), hidden_size=32, num_hidden_layers=3, num_attention_heads=2,
+                                        intermediate_size=64, max_position_embeddings=128, pad_token_id=1)
+    transformers.RobertaModel(config).save_pretrained(tmp_path)
+    return str(tmp_path)
+
+
+def test_bert_scorer_matches_bert_score(narratives, tiny_roberta):
+    bert_score = pytest.importorskip('bert_score')
+    from batch_eval import TransformersEmbedder
+
+    # Byte-level tokens: the long narratives are truncated at model_max_length, the short ones are not.
+    predictions = [narratives[0], '  ' + narratives[1] + '\n', 'Good:- On-time payments.', 'DPD 30+ on 2 accounts']
+    references = [narratives[1], narratives[2], 'Good:- on time payments', 'no DPD on any account']
+    scores = BertScorer(TransformersEmbedder(tiny_roberta, num_layers=2, batch_size=3, device='cpu')).score(predictions, references)
+    precision, recall, f1 = bert_score.score(predictions, references, model_type=tiny_roberta, num_layers=2, device='cpu')
+    expected = np.stack([precision.numpy(), recall.numpy(), f1.numpy()], axis=1)
+    np.testing.assert_allclose(scores.to_numpy(), expected, atol=1e-5)
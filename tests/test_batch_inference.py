@@ -0,0 +1,94 @@
+from batch_inference import BatchInference, MockBackend, TinyBackend, one_at_a_time
+from response_cache import ResponseCache
+
+
+class RecordingBackend(MockBackend):
+    """MockBackend without the sleeps that keeps every batch's prompts."""
+
+    def __init__(self):
+        super().__init__(seconds_per_call=0, seconds_per_prompt=0)
+        self.batches = []
+
+    def generate(self, prompts, max_new_tokens, temperature, top_p):
+        self.batches.append(list(prompts))
+        return super().generate(prompts, max_new_tokens, temperature, top_p)
+
+
+def _requests(n):
+    # Lengths go up and down, so sorting by length reorders every window.
+    return [{'customer_no': i, 'customer_info': ' '.join(['word'] * (1 + (i * 7) % 23)) + f' customer {i}'} for i in range(n)]
+
+
+def test_results_come_back_in_input_order():
+    backend = RecordingBackend()
+    requests = _requests(50)
+    results = BatchInference(backend, batch_size=4, window=16).run(requests)
+    assert [r['customer_no'] for r in results] == list(range(50))
+    engine = BatchInference(backend)
+    assert [r['response'] for r in results] == [backend.respond(engine.prompt(request)) for request in requests]
+
+
+def test_batches_are_sorted_within_a_window_and_never_cross_it():
+    backend = RecordingBackend()
+    engine = BatchInference(backend, batch_size=4, window=16)
+    engine.run(_requests(50))
+    window_of = {engine.prompt(request): request['customer_no'] // 16 for request in _requests(50)}
+    lengths = [len(prompt.split()) for batch in backend.batches for prompt in batch]
+    assert all(len(batch) <= 4 for batch in backend.batches)
+    assert all(len({window_of[prompt] for prompt in batch}) == 1 for batch in backend.batches)
+    # Shortest first within each window.
+    position = 0
+    for window in range(4):
+        size = min(16, 50 - 16 * window)
+        assert lengths[position:position + size] == sorted(lengths[position:position + size])
+        position += size
+    assert engine.stats['prompts'] == 50 and engine.stats['batches'] == len(backend.batches)
+
+
+def test_max_batch_tokens_caps_padded_batch_size():
+    backend = RecordingBackend()
+    BatchInference(backend, batch_size=16, max_batch_tokens=400).run(_requests(40))
+    for batch in backend.batches:
+        assert len(batch) == 1 or max(len(prompt.split()) for prompt in batch) * len(batch) <= 400
+
+
+def test_stream_yields_a_window_before_generating_the_next():
+    backend = RecordingBackend()
+    stream = BatchInference(backend, batch_size=4, window=8).stream(_requests(32))
+    first_window = [next(stream) for _ in range(8)]
+    assert [r['customer_no'] for r in first_window] == list(range(8))
+    assert len(backend.batches) == 2
+
+
+def test_batched_greedy_output_matches_one_at_a_time():
+    backend = TinyBackend(vocab_size=512, dim=16, min_new_tokens=3, eos_every=5)
+    requests = _requests(12)
+    expected = one_at_a_time(backend, requests, max_new_tokens=12)
+    results = BatchInference(backend, batch_size=5, max_new_tokens=12).run(requests)
+    assert [r['response'] for r in results] == [r['response'] for r in expected]
+
+
+def test_cache_hits_skip_generation_and_keep_order():
+    backend = RecordingBackend()
+    cache = ResponseCache()
+    first = BatchInference(backend, batch_size=4, cache=cache).run(_requests(20)[::2])
+    assert not any(r['cached'] for r in first)
+    calls = len(backend.batches)
+
+    engine = BatchInference(backend, batch_size=4, cache=cache)
+    results = engine.run(_requests(20))
+    assert [r['customer_no'] for r in results] == list(range(20))
+    assert [r['cached'] for r in results] == [i % 2 == 0 for i in range(20)]
+    assert sum(len(batch) for batch in backend.batches[calls:]) == 10
+    assert engine.stats['cached'] == 10 and cache.stats['memory_hits'] == 10
+    uncached = BatchInference(RecordingBackend(), batch_size=4).run(_requests(20))
+    assert [r['response'] for r in results] == [r['response'] for r in uncached]
+
+
+def test_sampled_requests_bypass_the_cache():
+    backend = RecordingBackend()
+    cache = ResponseCache()
+    for _ in range(2):
+        BatchInference(backend, cache=cache, temperature=0.7).run(_requests(6))
+    assert sum(len(batch) for batch in backend.batches) == 12
+    assert cache.stats['bypassed'] == 12 and len(cache) == 0
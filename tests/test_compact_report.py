@@ -0,0 +1,47 @@
+import pytest
+
+from batch_inference import TinyBackend
+from compact_report import DEFAULT_TOKEN_BUDGET, CompactReportRenderer
+
+
+@pytest.fixture(scope='module')
+def tokenizer():
+    return TinyBackend()
+
+
+@pytest.fixture
+def features(CreditFeatureEngineer, accounts):
+    return CreditFeatureEngineer().create_features(accounts)
+
+
+def test_renderer_defaults(tokenizer):
+    assert CompactReportRenderer().token_budget is None
+    assert CompactReportRenderer(tokenizer).token_budget == DEFAULT_TOKEN_BUDGET
+    with pytest.raises(ValueError):
+        CompactReportRenderer(token_budget=100)
+
+
+@pytest.mark.parametrize('token_budget', [200, 120])
+def test_reports_fit_the_token_budget(tokenizer, features, enquiries, token_budget):
+    renderer = CompactReportRenderer(tokenizer, token_budget=token_budget)
+    reports = renderer.render_all(features, enquiries)
+    assert max(tokenizer.count_tokens(list(reports.values()))) <= token_budget
+    assert renderer.stats['over_budget'] > 0
+    assert renderer.stats['unfit_reports'] == 0
+
+
+def test_enquiries_are_trimmed_oldest_first(tokenizer, features, enquiries):
+    entries = [('HDFC PL (2024-01-05)', '2024-01-05'), ('SBI CC x2 (2024-03-01)', '2024-03-01'), ('AXIS AL (2023-12-01)', '2023-12-01')]
+    assert CompactReportRenderer._enquiry_lines(entries, 1)[-1] == '-  HDFC PL (2024-01-05); SBI CC x2 (2024-03-01); 1 older not shown'
+    assert CompactReportRenderer._enquiry_lines(entries, 2)[-1] == '-  SBI CC x2 (2024-03-01); 2 older not shown'
+
+    renderer = CompactReportRenderer(tokenizer, token_budget=120)
+    renderer.render_all(features, enquiries)
+    assert renderer.stats['omitted_enquiries'] > 0
+
+
+def test_budget_below_the_header_is_recorded(tokenizer, features, enquiries):
+    renderer = CompactReportRenderer(tokenizer, token_budget=10)
+    reports = renderer.render_all(features, enquiries)
+    assert renderer.stats['unfit_reports'] == len(reports)
+    assert all(text.startswith('--- Credit Profile Report for Customer:') for text in reports.values())
@@ -0,0 +1,106 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+TOTALS = ['total_lim_disbursed_y', 'total_active_balance_y', 'total_cc_lim_disbursed_y', 'total_cc_active_balance_y',
+          'overall_utilisation_y', 'overall_cc_utilisation_y']
+
+
+def _by_customer(features, customer_no):
+    return features[features['customer_no'] == customer_no]
+
+
+def _close_first_customer(accounts):
+    # The first customer's accounts are all closed in _y; the next customer's are not.
+    first, second = accounts['customer_no'].unique()[:2]
+    accounts.loc[accounts['customer_no'] == first, 'Activity_Flag_y'] = 0
+    assert (accounts.loc[accounts['customer_no'] == second, 'Activity_Flag_y'] == 1).any()
+    return first, second
+
+
+def test_customer_without_active_accounts_takes_the_next_customers_totals(CreditFeatureEngineer, accounts):
+    # The original groupby('customer_no').ffill().bfill() behaviour, kept by default.
+    first, second = _close_first_customer(accounts)
+    features = CreditFeatureEngineer().create_features(accounts)
+    dormant, following = _by_customer(features, first), _by_customer(features, second)
+    for col in ['total_lim_disbursed_y', 'total_active_balance_y', 'overall_utilisation_y']:
+        assert dormant[col].nunique() == 1 and following[col].nunique() == 1, col
+        assert dormant[col].iloc[0] == following[col].iloc[0] > 0, col
+
+
+def test_totals_filled_within_customer_are_not_back_filled(CreditFeatureEngineer, accounts):
+    first, second = _close_first_customer(accounts)
+    features = CreditFeatureEngineer().create_features(accounts, fill_totals_within_customer=True)
+    dormant = _by_customer(features, first)
+    for col in TOTALS:
+        assert (dormant[col] == 0).all(), col
+    assert (_by_customer(features, second)['total_lim_disbursed_y'] > 0).all()
+
+
+def test_totals_filled_within_customer_do_not_depend_on_the_rest_of_the_batch(CreditFeatureEngineer, accounts):
+    engineer = CreditFeatureEngineer()
+    features = engineer.create_features(accounts, fill_totals_within_customer=True)
+    for customer_no in accounts['customer_no'].unique()[:10]:
+        alone = engineer.create_features(accounts[accounts['customer_no'] == customer_no], fill_totals_within_customer=True)
+        in_batch = _by_customer(features, customer_no).loc[alone.index]
+        for col in TOTALS:
+            np.testing.assert_array_equal(alone[col].to_numpy(), in_batch[col].to_numpy(), err_msg=col)
+
+
+def test_customer_totals_of_the_batch_carry_over_to_a_slice(CreditFeatureEngineer, accounts):
+    engineer = CreditFeatureEngineer()
+    first, _ = _close_first_customer(accounts)
+    expected = engineer.create_features(accounts)
+    alone = accounts['customer_no'] == first
+    features = engineer.create_features(accounts[alone], customer_totals=engineer.customer_totals(accounts)[alone])
+    for col in TOTALS:
+        np.testing.assert_array_equal(features[col].to_numpy(), _by_customer(expected, first).loc[features.index, col].to_numpy(), err_msg=col)
+
+
+def test_non_unique_index(CreditFeatureEngineer, accounts):
+    engineer = CreditFeatureEngineer()
+    expected = engineer.create_features(accounts)
+    duplicated = accounts.set_axis(accounts.index // 2)
+    for low_memory in [False, True]:
+        features = engineer.create_features(duplicated.copy(), low_memory=low_memory)
+        np.testing.assert_array_equal(features.index, expected.index // 2)
+        for col in ['customer_no', 'risk_score_x', 'total_active_accounts_y', 'total_active_cc_accounts_y', 'rn',
+                    'overall_utilisation_y', 'max_dpd_l36m_y']:
+            np.testing.assert_array_equal(features[col].to_numpy(dtype=float), expected[col].to_numpy(dtype=float), err_msg=col)
+
+
+def test_account_rank_of_a_slice_with_non_unique_index(CreditFeatureEngineer, accounts):
+    engineer = CreditFeatureEngineer()
+    duplicated = accounts.set_axis(np.zeros(len(accounts), dtype=int))
+    rank = engineer.account_open_rank(duplicated)
+    np.testing.assert_array_equal(rank.to_numpy(), engineer.account_open_rank(accounts).to_numpy())
+
+    half = np.arange(len(accounts)) % 2 == 0
+    features = engineer.create_features(duplicated[half], account_rank=rank[half])
+    expected = engineer.create_features(accounts[half], account_rank=engineer.account_open_rank(accounts)[half])
+    np.testing.assert_array_equal(features['rn'].to_numpy(), expected['rn'].to_numpy())
+
+
+def test_low_memory_matches_default_values_and_leaves_the_input_alone(CreditFeatureEngineer, accounts):
+    engineer = CreditFeatureEngineer()
+    before = accounts.copy()
+    expected = engineer.create_features(accounts)
+    features = engineer.create_features(accounts, low_memory=True)
+    pd.testing.assert_frame_equal(accounts, before)
+    np.testing.assert_array_equal(features.index, expected.index)
+    assert list(features.columns) == list(expected.columns)
+    for col in expected.columns:
+        if expected[col].dtype.kind in 'iufb':
+            np.testing.assert_array_equal(features[col].to_numpy(dtype=float), expected[col].to_numpy(dtype=float), err_msg=col)
+        else:
+            np.testing.assert_array_equal(features[col].astype(str).to_numpy(), expected[col].astype(str).to_numpy(), err_msg=col)
+
+
+def test_create_features_adds_its_columns_without_fragmenting_the_frame(CreditFeatureEngineer, accounts):
+    engineer = CreditFeatureEngineer()
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', pd.errors.PerformanceWarning)
+        warnings.simplefilter('error', DeprecationWarning)
+        for low_memory in [False, True]:
+            engineer.create_features(accounts, low_memory=low_memory)
@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+
+
+@pytest.mark.parametrize('with_enquiries', [True, False])
+def test_batched_matches_per_customer(CreditFeatureEngineer, CustomerScoreAnalyzer, accounts, enquiries, with_enquiries):
+    features = CreditFeatureEngineer().create_features(accounts)
+    df_enq = enquiries if with_enquiries else None
+    analyzer = CustomerScoreAnalyzer()
+    expected = analyzer.generate_training_data(features, df_enq)
+    assert analyzer._can_batch(features, df_enq)
+    pd.testing.assert_frame_equal(analyzer.generate_training_data(features, df_enq, batched=True), expected)
+
+
+def test_batched_falls_back_when_a_column_is_missing(CreditFeatureEngineer, CustomerScoreAnalyzer, accounts, enquiries):
+    features = CreditFeatureEngineer().create_features(accounts).drop(columns=['temp'])
+    analyzer = CustomerScoreAnalyzer()
+    assert not analyzer._can_batch(features, enquiries)
+    with pytest.raises(KeyError):
+        analyzer.generate_training_data(features, enquiries, batched=True)
+
+
+@pytest.mark.parametrize('batched', [True, False])
+def test_report_renderer_skips_the_full_report(CreditFeatureEngineer, CustomerScoreAnalyzer, accounts, enquiries, batched):
+    from compact_report import CompactReportRenderer
+    from profiling import Profiler
+
+    features = CreditFeatureEngineer().create_features(accounts)
+    analyzer = CustomerScoreAnalyzer()
+    renderer = CompactReportRenderer()
+    profiler = Profiler()
+    training_df = analyzer.generate_training_data(features, enquiries, batched=batched, profiler=profiler,
+                                                  report_renderer=renderer)
+    assert 'training_data.info_report' not in profiler.stats
+    assert 'training_data.compact_report' in profiler.stats
+    expected = training_df['customer_no'].map(renderer.render_all(features, enquiries))
+    pd.testing.assert_series_equal(training_df['customer_info'], expected, check_names=False)
+    full = analyzer.generate_training_data(features, enquiries, batched=batched)
+    pd.testing.assert_series_equal(training_df['customer_credit_update'], full['customer_credit_update'])
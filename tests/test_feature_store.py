@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+
+from feature_store import FeatureStore
+
+
+@pytest.fixture
+def engineer(CreditFeatureEngineer, monkeypatch):
+    """A CreditFeatureEngineer that records the rows each _period_features call computes, by periods."""
+    engineer = CreditFeatureEngineer()
+    engineer.computed = {}
+    original = engineer._period_features
+
+    def recording(final_result, periods):
+        engineer.computed[tuple(periods)] = final_result
+        return original(final_result, periods)
+
+    monkeypatch.setattr(engineer, '_period_features', recording)
+    return engineer
+
+
+def _recomputed_x(engineer, customer_no):
+    rows = engineer.computed[('x',)]
+    return rows.loc[(rows['customer_no'] == customer_no) & rows['account_number_x'].notna()]
+
+
+def test_cached_run_matches_the_uncached_one(engineer, accounts, tmp_path):
+    store = FeatureStore(str(tmp_path))
+    expected = engineer.create_features(accounts)
+    cold = engineer.create_features(accounts, feature_store=store)
+    warm = engineer.create_features(accounts, feature_store=store)
+    pd.testing.assert_frame_equal(cold, expected)
+    pd.testing.assert_frame_equal(warm, expected)
+    # Only the rows without an _x account are left to compute once the store holds every _x snapshot.
+    assert len(engineer.computed[('x',)]) == accounts['account_number_x'].isna().sum()
+
+
+def test_changed_customer_is_recomputed(engineer, accounts, tmp_path):
+    store = FeatureStore(str(tmp_path))
+    engineer.create_features(accounts, feature_store=store)
+
+    changed = accounts.copy()
+    row = changed.index[changed['account_number_x'].notna()][0]
+    customer_no = changed.loc[row, 'customer_no']
+    changed.loc[row, 'current_balance_x'] = pd.to_numeric(changed.loc[row, 'current_balance_x']) + 12345
+    features = engineer.create_features(changed, feature_store=store)
+
+    expected = engineer.create_features(changed)
+    pd.testing.assert_frame_equal(features, expected)
+    assert len(_recomputed_x(engineer, customer_no)) == (changed['account_number_x'].notna() & (changed['customer_no'] == customer_no)).sum()
+    others = changed.loc[changed['customer_no'] != customer_no, 'customer_no'].iloc[0]
+    assert _recomputed_x(engineer, others).empty
+
+
+def test_invalidate_drops_a_customers_snapshots(engineer, accounts, tmp_path):
+    store = FeatureStore(str(tmp_path))
+    engineer.create_features(accounts, feature_store=store)
+    customer_no = accounts.loc[accounts['account_number_x'].notna(), 'customer_no'].iloc[0]
+    keys = pd.DataFrame({'customer_no': [customer_no] * 2, 'creation_date': store.snapshots()})
+    assert len(store.load(keys)[0]) == 2
+
+    store.invalidate([customer_no], creation_date=store.snapshots()[1])
+    assert store.load(keys)[0]['creation_date'].tolist() == [store.snapshots()[0]]
+    store.invalidate([customer_no])
+    assert store.load(keys)[0].empty
+    assert len(store.load(keys.assign(customer_no=accounts['customer_no'].iloc[-1]))[0]) == 2
+
+    features = engineer.create_features(accounts, feature_store=store)
+    pd.testing.assert_frame_equal(features, engineer.create_features(accounts))
+    assert not _recomputed_x(engineer, customer_no).empty
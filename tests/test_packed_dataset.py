@@ -0,0 +1,94 @@
+import json
+
+import numpy as np
+import pytest
+
+from batch_inference import TinyBackend
+from packed_dataset import IGNORE_INDEX, PackedSFTDataset, export_packed_dataset, pack, tokenize_conversations
+
+SEQ_LEN = 256
+
+
+def _requests(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{'customer_no': f'C{i}', 'customer_info': ' '.join(['account'] * int(rng.integers(5, 60))) + f' report {i}',
+             'customer_credit_update': ' '.join(['Good'] * int(rng.integers(2, 30))) + f' narrative {i}'}
+            for i in range(n)]
+
+
+@pytest.fixture
+def exported(tmp_path):
+    requests = _requests(40) + [{'customer_no': 'long', 'customer_info': 'word ' * 400, 'customer_credit_update': 'x'}]
+    meta = export_packed_dataset(requests, str(tmp_path), TinyBackend(), seq_len=SEQ_LEN)
+    return requests, meta, PackedSFTDataset(str(tmp_path))
+
+
+def test_pack_fits_every_row_without_overlap():
+    lengths = np.random.default_rng(1).integers(1, 100, 300)
+    rows, starts = pack(lengths, 128)
+    for row in np.unique(rows):
+        spans = sorted((starts[i], starts[i] + lengths[i]) for i in np.flatnonzero(rows == row))
+        assert spans[-1][1] <= 128
+        assert all(end <= next_start for (_, end), (next_start, _) in zip(spans, spans[1:]))
+    assert rows.max() + 1 <= int(np.ceil(lengths.sum() / 128)) + 2
+    with pytest.raises(ValueError):
+        pack([129], 128)
+
+
+def test_round_trip_and_label_masking(exported):
+    requests, meta, dataset = exported
+    tokenizer = TinyBackend()
+    assert meta['skipped_too_long'] == ['long']
+    assert meta['conversations'] == 40 and len(dataset) == meta['sequences'] < 40
+
+    seen = set()
+    for i in range(len(dataset)):
+        item = dataset[i]
+        assert all(item[key].shape == (SEQ_LEN,) for key in ['input_ids', 'labels', 'position_ids', 'attention_mask'])
+        covered = np.zeros(SEQ_LEN, dtype=bool)
+        for document in dataset.row_documents(i):
+            start, length, prompt_length = int(document['start']), int(document['length']), int(document['prompt_length'])
+            [(ids, expected_prompt_length)] = tokenize_conversations([requests[document['source']]], tokenizer)
+            span = slice(start, start + length)
+            np.testing.assert_array_equal(item['input_ids'][span], ids)
+            assert prompt_length == expected_prompt_length
+            # Labels cover only the assistant turn (the narrative and its end-of-turn token).
+            np.testing.assert_array_equal(item['labels'][start:start + prompt_length], IGNORE_INDEX)
+            np.testing.assert_array_equal(item['labels'][start + prompt_length:start + length], ids[prompt_length:])
+            np.testing.assert_array_equal(item['position_ids'][span], np.arange(length))
+            covered[span] = True
+            seen.add(int(document['source']))
+        np.testing.assert_array_equal(item['attention_mask'], covered)
+        assert (item['labels'][~covered] == IGNORE_INDEX).all()
+    assert seen == set(range(40))
+    assert meta['tokens'] == sum(len(ids) for ids, _ in tokenize_conversations(requests[:40], tokenizer))
+
+
+def test_completion_tokens_decode_to_the_narrative(exported):
+    requests, _, dataset = exported
+    tokenizer = TinyBackend()
+    document = dataset.row_documents(0)[0]
+    labels = dataset[0]['labels']
+    label_ids = labels[labels != IGNORE_INDEX][:int(document['length'] - document['prompt_length'])]
+    narrative = requests[document['source']]['customer_credit_update']
+    assert list(label_ids[:len(tokenizer.encode(narrative))]) == tokenizer.encode(narrative)
+
+
+def test_document_mask_is_block_diagonal_causal(exported):
+    _, _, dataset = exported
+    documents = dataset.row_documents(0)
+    assert len(documents) > 1
+    mask = dataset.document_mask(0)
+    for document in documents:
+        start, end = int(document['start']), int(document['start'] + document['length'])
+        block = mask[start:end, start:end]
+        np.testing.assert_array_equal(block, np.tri(end - start, dtype=bool))
+        assert not mask[start:end, :start].any() and not mask[start:end, end:].any()
+    assert mask.sum() == sum(int(d['length']) * (int(d['length']) + 1) // 2 for d in documents)
+
+
+def test_meta_is_written(exported, tmp_path):
+    _, meta, _ = exported
+    with open(tmp_path / 'meta.json') as f:
+        assert json.load(f) == meta
+    assert 0 < meta['unpacked_padding_efficiency'] < meta['packing_efficiency'] <= 1
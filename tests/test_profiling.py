@@ -0,0 +1,15 @@
+import pytest
+
+from profiling import RULES, Profiler
+
+
+@pytest.mark.parametrize('batched', [False, True])
+def test_every_rule_lap_is_named_after_a_rule(CreditFeatureEngineer, CustomerScoreAnalyzer, accounts, enquiries, batched):
+    features = CreditFeatureEngineer().create_features(accounts)
+    profiler = Profiler()
+    training_df = CustomerScoreAnalyzer().generate_training_data(features, enquiries, profiler=profiler, batched=batched)
+
+    rule_laps = {name: entry['calls'] for name, entry in profiler.stats.items() if name.startswith('training_data.rule.')}
+    assert set(rule_laps) == {f'training_data.rule.{rule}' for rule, _ in RULES}
+    # Per customer in the per-customer path, once per call in the batched one.
+    assert set(rule_laps.values()) == {1 if batched else len(training_df)}
@@ -0,0 +1,67 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import synthetic_data
+from benchmarks import bench_realtime
+from realtime import RealtimeAnalyzer
+
+
+@pytest.fixture(scope='module')
+def report_pulls():
+    return synthetic_data.report_pulls(12, 0)
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    return RealtimeAnalyzer(synthetic_data.product_table(), synthetic_data.lender_table())
+
+
+def _customer_pulls(report_pulls, customer_no):
+    m1, m2, enquiries = report_pulls
+    return (m1[m1['customer_no'] == customer_no], m2[m2['customer_no'] == customer_no],
+            enquiries[enquiries['customer_no'] == customer_no])
+
+
+def test_analyze_customer_matches_the_batch_pipeline(CreditFeatureEngineer, CustomerScoreAnalyzer, analyzer, report_pulls):
+    customers = report_pulls[1]['customer_no'].unique()
+    results, merged = {}, []
+    for customer_no in customers:
+        accounts_m1, accounts_m2, enquiries = _customer_pulls(report_pulls, customer_no)
+        results[customer_no] = analyzer.analyze_customer(accounts_m1, accounts_m2, enquiries)
+        merged.append(analyzer._merge_snapshots(analyzer._prepare_snapshot(accounts_m1), analyzer._prepare_snapshot(accounts_m2)))
+
+    # One batch run over every customer's merged rows, as the offline pipeline scores them.
+    features = CreditFeatureEngineer().create_features(pd.concat(merged, ignore_index=True), fill_totals_within_customer=True)
+    training_df = CustomerScoreAnalyzer().generate_training_data(features, report_pulls[2]).set_index('customer_no')
+    for customer_no, result in results.items():
+        assert result['customer_info'] == training_df.loc[customer_no, 'customer_info']
+        assert result['customer_credit_update'] == training_df.loc[customer_no, 'customer_credit_update']
+        # rn ranks account opening across the whole batch, so only it may differ (and dtypes, where
+        # concatenating the customers mixes all-null and dated columns).
+        expected = features[features['customer_no'] == customer_no].drop(columns='rn').reset_index(drop=True)
+        pd.testing.assert_frame_equal(result['features'].drop(columns='rn').reset_index(drop=True), expected, check_dtype=False)
+
+
+def test_analyze_customer_latency_smoke(analyzer, report_pulls):
+    customer_no = report_pulls[1]['customer_no'].iloc[0]
+    args = _customer_pulls(report_pulls, customer_no)
+    analyzer.analyze_customer(*args)  # warm-up
+    for narrative in [False, True]:
+        times = []
+        for _ in range(5):
+            start = time.perf_counter()
+            result = analyzer.analyze_customer(*args, narrative=narrative)
+            times.append(time.perf_counter() - start)
+        assert ('customer_credit_update' in result) == narrative
+        # A loose bound: catches a path that falls back to work proportional to the batch, not noise.
+        assert np.median(times) < 1.0
+
+
+def test_bench_realtime_reports_both_targets(tmp_path, capsys):
+    bench_realtime(str(tmp_path), n_customers=5)
+    lines = [line for line in capsys.readouterr().out.splitlines() if 'target p50' in line]
+    assert len(lines) == 2
+    assert all(line.rstrip().endswith(('met', 'missed')) for line in lines)
@@ -0,0 +1,94 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import response_cache
+from response_cache import ResponseCache, cache_key, normalize_report
+
+REPORT = '--- Credit Profile Report for Customer: 101 ---\n\n## Summary\n-  score 700'
+SAMPLING = {'temperature': 0, 'max_new_tokens': 250}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A settable time.time() for response_cache."""
+    clock = SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(response_cache, 'time', SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+def _files(directory):
+    return sorted(name[:-5] for _, _, names in os.walk(directory) for name in names if name.endswith('.json'))
+
+
+def test_normalize_report_ignores_customer_number_and_whitespace():
+    other = '--- Credit Profile Report for Customer: 202 ---  \r\n\r\n\r\n## Summary\r\n-  score 700\n'
+    assert normalize_report(other) == normalize_report(REPORT) == '--- Credit Profile Report ---\n\n## Summary\n-  score 700'
+    assert normalize_report(REPORT.replace('700', '701')) != normalize_report(REPORT)
+
+
+def test_cache_key_is_stable():
+    # Pinned: a change here invalidates every shared cache directory, so it must come with a KEY_VERSION bump.
+    assert cache_key(REPORT, 'system', 'command', SAMPLING) == 'e582ae65975f3e71afba779dd915bb911a75eb6396d33fa15eea8977811585c0'
+    assert cache_key(REPORT.replace('101', '202'), 'system', 'command', dict(reversed(list(SAMPLING.items())))) == \
+        cache_key(REPORT, 'system', 'command', SAMPLING)
+    variants = [cache_key(REPORT, 'other system', 'command', SAMPLING), cache_key(REPORT, 'system', 'other command', SAMPLING),
+                cache_key(REPORT, 'system', 'command', {**SAMPLING, 'max_new_tokens': 100}),
+                cache_key(REPORT, 'system', 'command', SAMPLING, namespace='other-model')]
+    assert len(set(variants) | {cache_key(REPORT, 'system', 'command', SAMPLING)}) == 5
+
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    cache = ResponseCache(directory=str(tmp_path), ttl_seconds=60)
+    cache.put('a' * 64, {'response': 'first'})
+    clock.now += 59
+    assert cache.get('a' * 64) == {'response': 'first'}
+    clock.now += 2
+    assert cache.get('a' * 64) is None
+    assert cache.stats['expired'] == 1 and cache.stats['misses'] == 1
+    assert _files(tmp_path) == [] and len(cache) == 0
+
+    # Expired on disk too, when read by a later run.
+    cache.put('b' * 64, {'response': 'second'})
+    clock.now += 61
+    later = ResponseCache(directory=str(tmp_path), ttl_seconds=60)
+    assert later.get('b' * 64) is None
+    assert later.stats['expired'] == 1 and _files(tmp_path) == []
+
+
+def test_memory_tier_evicts_the_least_recently_used(clock):
+    cache = ResponseCache(max_entries=2)
+    cache.put('a', {'response': 'a'})
+    cache.put('b', {'response': 'b'})
+    assert cache.get('a') == {'response': 'a'}
+    cache.put('c', {'response': 'c'})
+    assert cache.get('b') is None
+    assert cache.get('a') == {'response': 'a'} and cache.get('c') == {'response': 'c'}
+    assert cache.stats['memory_evictions'] == 1 and len(cache) == 2
+
+
+def test_disk_tier_evicts_the_least_recently_used_files(tmp_path, clock):
+    value = {'response': 'x' * 100}
+    size = len(b'{"created": 1000000.0, "value": {"response": "' + b'x' * 100 + b'"}}')
+    cache = ResponseCache(max_entries=1, directory=str(tmp_path), max_bytes=4 * size)
+    keys = [f'{i:02d}' + 'k' * 62 for i in range(4)]
+    for key in keys:
+        cache.put(key, value)
+        clock.now += 1
+    assert cache.get(keys[0]) == value  # a disk hit: keys[0] is now the most recently used file
+    clock.now += 1
+    cache.put('04' + 'k' * 62, value)  # over max_bytes: removed down to 90% of it
+
+    assert cache.stats['disk_evictions'] == 2
+    assert _files(tmp_path) == sorted([keys[0], keys[3], '04' + 'k' * 62])
+    assert cache.get(keys[1]) is None and cache.get(keys[2]) is None
+
+
+def test_a_new_instance_reads_the_disk_tier(tmp_path):
+    ResponseCache(directory=str(tmp_path)).put('a' * 64, {'response': 'stored'})
+    cache = ResponseCache(directory=str(tmp_path))
+    assert len(cache) == 1
+    assert cache.get('a' * 64) == {'response': 'stored'}
+    assert cache.get('a' * 64) == {'response': 'stored'}
+    assert cache.stats['disk_hits'] == 1 and cache.stats['memory_hits'] == 1 and cache.stats['misses'] == 0
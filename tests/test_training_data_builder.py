@@ -0,0 +1,123 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from training_data_builder import ShardedTrainingDataBuilder, _run_bounded, load_training_data, shard_of
+
+
+@pytest.mark.parametrize('within_customer', [False, True])
+def test_sharded_build_matches_single_process(CreditFeatureEngineer, CustomerScoreAnalyzer, accounts, enquiries, tmp_path, within_customer):
+    ShardedTrainingDataBuilder(str(tmp_path), n_shards=4, n_workers=2, fill_totals_within_customer=within_customer).build(accounts, enquiries)
+    built = load_training_data(str(tmp_path)).sort_values('customer_no').reset_index(drop=True)
+
+    features = CreditFeatureEngineer().create_features(accounts, fill_totals_within_customer=within_customer)
+    expected = CustomerScoreAnalyzer().generate_training_data(features, enquiries)
+    expected['customer_no'] = expected['customer_no'].astype(str)
+    expected = expected.sort_values('customer_no').reset_index(drop=True)
+    pd.testing.assert_frame_equal(built[['customer_no', 'customer_info', 'customer_credit_update']], expected)
+
+
+def test_rerun_with_fewer_customers_drops_stale_shards(accounts, enquiries, tmp_path):
+    builder = ShardedTrainingDataBuilder(str(tmp_path), n_shards=8, n_workers=1)
+    builder.build(accounts, enquiries)
+    few = accounts[accounts['customer_no'].isin(accounts['customer_no'].unique()[:3])]
+    files = builder.build(few, enquiries)
+
+    assert len(load_training_data(str(tmp_path))) == 3
+    shards = set(shard_of(few['customer_no'], 8).tolist())
+    assert len(files) == len(shards)
+    assert sorted(os.listdir(tmp_path / '_checkpoints')) == [f'part-{shard:05d}.json' for shard in sorted(shards)]
+    assert sorted(name for name in os.listdir(tmp_path) if name.startswith('part-')) == \
+        [f'part-{shard:05d}.jsonl' for shard in sorted(shards)]
+
+
+def test_rank_change_from_another_shard_rebuilds_the_shard(CreditFeatureEngineer, accounts, enquiries, tmp_path):
+    builder = ShardedTrainingDataBuilder(str(tmp_path), n_shards=4, n_workers=1)
+    builder.build(accounts, enquiries)
+    shards = shard_of(accounts['customer_no'], 4)
+    assert list(builder._tasks(accounts, enquiries, True, shards)) == []
+
+    # The oldest account of its loan type, moved into shard 0: every later account of that type
+    # in the other shards moves down one place in 'rn', while their own rows stay the same.
+    changed = accounts.copy()
+    row = changed.index[shards == 0][0]
+    changed.loc[row, 'date_opened'] = pd.Timestamp('1990-01-01')
+    engineer = CreditFeatureEngineer()
+    moved = engineer.account_open_rank(accounts).sort_index() != engineer.account_open_rank(changed).sort_index()
+    expected = set(shards[moved.to_numpy()].tolist())
+    assert expected - {0}
+
+    rebuilt = {task['shard'] for task in builder._tasks(changed, enquiries, True, shards)}
+    assert rebuilt == expected
+
+
+def test_build_with_non_unique_index(accounts, enquiries, tmp_path):
+    ShardedTrainingDataBuilder(str(tmp_path / 'unique'), n_shards=2, n_workers=1).build(accounts, enquiries)
+    ShardedTrainingDataBuilder(str(tmp_path / 'duplicated'), n_shards=2, n_workers=1).build(accounts.set_axis(accounts.index // 3), enquiries)
+    pd.testing.assert_frame_equal(load_training_data(str(tmp_path / 'duplicated')), load_training_data(str(tmp_path / 'unique')))
+
+
+def test_changed_system_prompt_rebuilds_every_shard(accounts, enquiries, tmp_path):
+    ShardedTrainingDataBuilder(str(tmp_path), n_shards=4, n_workers=1, system_prompt='Old prompt.').build(accounts, enquiries)
+    builder = ShardedTrainingDataBuilder(str(tmp_path), n_shards=4, n_workers=1, system_prompt='New prompt.')
+    shards = shard_of(accounts['customer_no'], 4)
+    assert len(list(builder._tasks(accounts, enquiries, True, shards))) == len(set(shards.tolist()))
+
+    builder.build(accounts, enquiries)
+    prompts = {messages[0]['content'] for messages in load_training_data(str(tmp_path))['messages']}
+    assert prompts == {'New prompt.'}
+
+
+def test_shard_of_ignores_the_customer_no_dtype():
+    customers = [101, 202, 303, 404, 505]
+    expected = shard_of(pd.Series(customers), 4)
+    for same in [pd.Series(customers, dtype='float64'), pd.Series(customers, dtype=object),
+                 pd.Series([float(c) for c in customers], dtype=object), pd.Series([str(c) for c in customers])]:
+        assert shard_of(same, 4).tolist() == expected.tolist()
+
+
+def test_float_enquiry_customer_no_stays_with_its_accounts(CreditFeatureEngineer, CustomerScoreAnalyzer, accounts, enquiries, tmp_path):
+    # Small ids, so they are exact as floats; the enquiries come in as float64 (as after a null).
+    ids = {customer_no: 1000 + i for i, customer_no in enumerate(accounts['customer_no'].unique())}
+    accounts['customer_no'] = accounts['customer_no'].map(ids).astype('int64')
+    enquiries['customer_no'] = enquiries['customer_no'].map(ids).astype('float64')
+    ShardedTrainingDataBuilder(str(tmp_path), n_shards=4, n_workers=1).build(accounts, enquiries)
+    built = load_training_data(str(tmp_path)).sort_values('customer_no').reset_index(drop=True)
+
+    expected = CustomerScoreAnalyzer().generate_training_data(CreditFeatureEngineer().create_features(accounts), enquiries)
+    expected['customer_no'] = expected['customer_no'].astype(str)
+    expected = expected.sort_values('customer_no').reset_index(drop=True)
+    pd.testing.assert_frame_equal(built[['customer_no', 'customer_info', 'customer_credit_update']], expected)
+
+
+def test_run_bounded_draws_tasks_as_workers_free_up():
+    release = threading.Event()
+    drawn, finished, in_memory = [], [], []
+
+    def tasks():
+        for i in range(10):
+            drawn.append(i)
+            in_memory.append(len(drawn) - len(finished))
+            yield i
+
+    def work(i):
+        release.wait()
+        finished.append(i)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        threading.Timer(0.2, release.set).start()
+        _run_bounded(pool, work, tasks(), 3)
+    assert sorted(finished) == list(range(10))
+    assert max(in_memory) <= 3
+
+
+def test_run_bounded_reraises_worker_errors():
+    def work(i):
+        if i == 4:
+            raise RuntimeError('shard 4 failed')
+
+    with ThreadPoolExecutor(max_workers=2) as pool, pytest.raises(RuntimeError, match='shard 4'):
+        _run_bounded(pool, work, iter(range(10)), 3)
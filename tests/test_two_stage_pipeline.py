@@ -0,0 +1,55 @@
+import pytest
+
+from batch_inference import MockBackend
+from two_stage_pipeline import STAGES, TwoStageScheduler, run_sequential
+
+
+def _requests(n):
+    return [{'customer_no': f'C{i}', 'customer_info': f'customer {i}'} for i in range(n)]
+
+
+def _backends():
+    # Stage 2 is slower, so its queue backs up.
+    return MockBackend(seconds_per_call=0.002, seconds_per_prompt=0.0002), MockBackend(seconds_per_call=0.004, seconds_per_prompt=0.0005)
+
+
+def test_results_match_sequential_and_keep_input_order():
+    extractor, rewriter = _backends()
+    scheduler = TwoStageScheduler(extractor, rewriter, batch_size=4, queue_size=8)
+    results = scheduler.run_sync(_requests(30))
+    assert [r['customer_no'] for r in results] == [f'C{i}' for i in range(30)]
+    assert results == run_sequential(*_backends(), _requests(30), batch_size=4)
+    # Stage 2 rewrites stage 1's output, not the report.
+    assert all(r['rewrite'] == rewriter.respond(scheduler._prompt('rewrite', r['extract'])) for r in results)
+
+
+def test_metrics():
+    extractor, rewriter = _backends()
+    scheduler = TwoStageScheduler(extractor, rewriter, batch_size=4, rewrite_batch_size=3, queue_size=6)
+    scheduler.run_sync(_requests(25))
+    metrics = scheduler.metrics
+    assert metrics['extract']['batches'] == extractor.calls and metrics['rewrite']['batches'] == rewriter.calls
+    assert extractor.calls >= 7 and rewriter.calls >= 9
+    for stage in STAGES:
+        m = metrics[stage]
+        assert len(m['service']) == len(m['wait']) == 25
+        assert len(m['queue_depth']) == m['batches']
+        assert 1 <= max(m['queue_depth']) <= 6
+        assert min(m['wait']) >= 0 and 0 < m['busy'] <= metrics['seconds']
+    assert '25 customers' in scheduler.summary()
+
+
+def test_empty_input():
+    scheduler = TwoStageScheduler(*_backends())
+    assert scheduler.run_sync([]) == []
+    assert scheduler.metrics['extract']['batches'] == 0
+
+
+def test_a_failing_stage_raises():
+    class Failing(MockBackend):
+        def generate(self, prompts, max_new_tokens, temperature, top_p):
+            raise RuntimeError('CUDA out of memory')
+
+    extractor, _ = _backends()
+    with pytest.raises(RuntimeError, match='out of memory'):
+        TwoStageScheduler(extractor, Failing(0, 0), batch_size=4, queue_size=2).run_sync(_requests(40))
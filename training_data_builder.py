@@ -0,0 +1,219 @@
+# training_data_builder.py
+# Builds the fine-tuning dataset in parallel: customers are split into shards by a hash of
+# customer_no, each shard runs CreditFeatureEngineer + CustomerScoreAnalyzer in its own process,
+# and every shard is written to its own JSONL/Parquet file as soon as it is done. A checkpoint
+# per finished shard lets an interrupted run pick up where it stopped.
+import hashlib
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from module_loader import load_module
+from prompts import SYSTEM_PROMPT, to_chat_messages
+
+
+def _shard_key(customer_no):
+    """
+    customer_no as text, with whole floats written as integers, so a customer hashes the same
+    whether the column is int64, float64 or object (as the analyzer matches 123 to 123.0).
+    """
+    key = pd.Series(customer_no)
+    if key.dtype.kind == 'f' and np.isfinite(key).all() and (key % 1 == 0).all():
+        key = key.astype(np.int64)
+    elif key.dtype == object:
+        key = key.map(lambda value: int(value) if isinstance(value, float) and value.is_integer() else value)
+    return key.astype(str)
+
+
+def shard_of(customer_no, n_shards):
+    """Stable shard number for each customer_no (the same in every process and every run)."""
+    hashes = pd.util.hash_pandas_object(_shard_key(customer_no), index=False).to_numpy()
+    return (hashes % np.uint64(n_shards)).astype(np.int64)
+
+
+def _fingerprint(system_prompt, *frames):
+    """
+    Content hash of the shard inputs and the system prompt written into its records, stored in
+    the checkpoint to detect changed source rows or a changed prompt.
+    """
+    digest = hashlib.sha256(system_prompt.encode('utf-8'))
+    for frame in frames:
+        if frame is not None:
+            digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _to_records(training_df, system_prompt):
+    """Chat-template-ready rows: the two text columns plus the system/user/assistant turns."""
+    return [
+        {
+            'customer_no': str(customer_no),
+            'customer_info': info,
+            'customer_credit_update': update,
+            'messages': to_chat_messages(info, update, system_prompt=system_prompt),
+        }
+        for customer_no, info, update in zip(training_df['customer_no'], training_df['customer_info'], training_df['customer_credit_update'])
+    ]
+
+
+def _write_shard(records, path, output_format):
+    """Writes one shard to a temporary file and renames it, so a crash never leaves half a file."""
+    tmp_path = path + '.tmp'
+    if output_format == 'jsonl':
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    else:
+        pd.DataFrame(records, columns=['customer_no', 'customer_info', 'customer_credit_update', 'messages']).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def _run_bounded(pool, fn, tasks, max_pending):
+    """
+    Submits fn(task) for each task of the iterator to `pool`, drawing the next task only while
+    fewer than `max_pending` are queued or running, and re-raises the first worker error.
+    """
+    pending = set()
+    for task in tasks:
+        pending.add(pool.submit(fn, task))
+        if len(pending) >= max_pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result()
+    for future in wait(pending)[0]:
+        future.result()
+
+
+def _build_shard(task):
+    """Process-pool worker: features -> narratives -> shard file -> checkpoint."""
+    CreditFeatureEngineer = load_module('1.credit_feature_engineer.py').CreditFeatureEngineer
+    CustomerScoreAnalyzer = load_module('1.customer_analyzer.py').CustomerScoreAnalyzer
+
+    features = CreditFeatureEngineer().create_features(task['accounts'], account_rank=task['account_rank'],
+                                                       customer_totals=task['customer_totals'])
+    training_df = CustomerScoreAnalyzer().generate_training_data(features, task['enquiries'], batched=True)
+    _write_shard(_to_records(training_df, task['system_prompt']), task['path'], task['output_format'])
+
+    checkpoint = {
+        'shard': task['shard'], 'n_shards': task['n_shards'], 'path': os.path.basename(task['path']),
+        'customers': len(training_df), 'fingerprint': task['fingerprint'],
+    }
+    with open(task['checkpoint'], 'w') as f:
+        json.dump(checkpoint, f)
+    return checkpoint
+
+
+class ShardedTrainingDataBuilder:
+    """
+    Splits a batch of accounts (and enquiries) into customer shards and builds the training
+    data for each shard in a process pool, streaming every shard straight to disk.
+    `fill_totals_within_customer` is passed on to create_features.
+    """
+
+    def __init__(self, output_dir, n_shards=16, n_workers=None, output_format='jsonl', system_prompt=SYSTEM_PROMPT,
+                 fill_totals_within_customer=False):
+        if output_format not in ('jsonl', 'parquet'):
+            raise ValueError("output_format must be 'jsonl' or 'parquet'.")
+        self.output_dir = output_dir
+        self.n_shards = n_shards
+        self.n_workers = n_workers
+        self.output_format = output_format
+        self.system_prompt = system_prompt
+        self.fill_totals_within_customer = fill_totals_within_customer
+
+    def _shard_paths(self, shard):
+        """Output file and checkpoint file for one shard."""
+        extension = 'jsonl' if self.output_format == 'jsonl' else 'parquet'
+        path = os.path.join(self.output_dir, f'part-{shard:05d}.{extension}')
+        checkpoint = os.path.join(self.output_dir, '_checkpoints', f'part-{shard:05d}.json')
+        return path, checkpoint
+
+    def _is_done(self, checkpoint, path, fingerprint):
+        """A shard is skipped only if its file exists and was built from identical input rows."""
+        if not (os.path.exists(checkpoint) and os.path.exists(path)):
+            return False
+        with open(checkpoint) as f:
+            return json.load(f).get('fingerprint') == fingerprint
+
+    def _tasks(self, df, df_enq, resume, account_shards):
+        """Yields one work item per shard that still has to be built."""
+        # 'rn' ranks accounts across the whole batch, and a customer with no active accounts takes
+        # the next customer's totals, so both are computed before splitting.
+        engineer = load_module('1.credit_feature_engineer.py').CreditFeatureEngineer()
+        account_rank = engineer.account_open_rank(df)
+        customer_totals = engineer.customer_totals(df, self.fill_totals_within_customer)
+        enquiry_shards = None
+        if df_enq is not None and 'customer_no' in df_enq.columns:
+            enquiry_shards = shard_of(df_enq['customer_no'], self.n_shards)
+
+        for shard in range(self.n_shards):
+            in_shard = account_shards == shard
+            accounts = df[in_shard]
+            if accounts.empty:
+                continue
+            enquiries = df_enq
+            if enquiry_shards is not None:
+                enquiries = df_enq[enquiry_shards == shard]
+            # The ranks and totals depend on the other shards' accounts too, so they are part of the input.
+            shard_rank = account_rank[in_shard]
+            shard_totals = customer_totals[in_shard]
+            path, checkpoint = self._shard_paths(shard)
+            fingerprint = _fingerprint(self.system_prompt, accounts, enquiries, shard_rank, shard_totals)
+            if resume and self._is_done(checkpoint, path, fingerprint):
+                continue
+            yield {
+                'shard': shard, 'n_shards': self.n_shards, 'accounts': accounts, 'enquiries': enquiries,
+                'account_rank': shard_rank, 'customer_totals': shard_totals, 'path': path, 'checkpoint': checkpoint,
+                'fingerprint': fingerprint, 'output_format': self.output_format, 'system_prompt': self.system_prompt,
+            }
+
+    def _remove_shard(self, shard):
+        """Deletes a shard's file and checkpoint, if they exist."""
+        for path in self._shard_paths(shard):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def build(self, df, df_enq=None, resume=True):
+        """
+        Builds every shard that is missing or out of date and writes manifest.json. Shards
+        left in output_dir by an earlier run that have no customers in `df` are deleted.
+        Returns the list of shard files, in shard order.
+        """
+        if 'customer_no' not in df.columns:
+            raise ValueError("The input DataFrame must contain a 'customer_no' column.")
+        os.makedirs(os.path.join(self.output_dir, '_checkpoints'), exist_ok=True)
+
+        account_shards = shard_of(df['customer_no'], self.n_shards)
+        current = set(np.unique(account_shards).tolist())
+        # Shards are sliced as workers free up (two per worker queued), not all up front.
+        n_workers = self.n_workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            _run_bounded(pool, _build_shard, self._tasks(df, df_enq, resume, account_shards), 2 * n_workers)
+
+        shards = []
+        for shard in range(self.n_shards):
+            if shard not in current:
+                self._remove_shard(shard)
+                continue
+            with open(self._shard_paths(shard)[1]) as f:
+                shards.append(json.load(f))
+        with open(os.path.join(self.output_dir, 'manifest.json'), 'w') as f:
+            json.dump({'n_shards': self.n_shards, 'format': self.output_format, 'shards': shards}, f, indent=2)
+        return [os.path.join(self.output_dir, shard['path']) for shard in shards]
+
+
+def load_training_data(output_dir):
+    """Reads every shard listed in manifest.json back into one DataFrame."""
+    with open(os.path.join(output_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+    frames = []
+    for shard in manifest['shards']:
+        path = os.path.join(output_dir, shard['path'])
+        if manifest['format'] == 'jsonl':
+            frames.append(pd.read_json(path, lines=True, dtype={'customer_no': str}))
+        else:
+            frames.append(pd.read_parquet(path))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['customer_no', 'customer_info', 'customer_credit_update', 'messages'])
@@ -0,0 +1,159 @@
+# two_stage_pipeline.py
+# The two-step narrative pipeline from Notes.md, pipelined: the fine-tuned model extracts the
+# Good:-/Bad:- facts (stage 1) and the base model rewrites them into second-person prose
+# (stage 2). Each stage has its own worker, backend and thread, and a bounded queue in front of
+# it, so stage 2 rewrites the first customers' facts while stage 1 is still extracting the rest,
+# and a slow stage 2 holds stage 1 back instead of letting facts pile up in memory.
+#   scheduler = TwoStageScheduler(extractor, rewriter)
+#   results = scheduler.run_sync(training_df)      # or: await scheduler.run(training_df)
+#   print(scheduler.summary())
+# Backends are the batch_inference ones (MockBackend for CPU tests of the scheduling).
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from batch_inference import DEFAULT_MAX_NEW_TOKENS, read_requests
+from prompts import fact_extraction_messages, rewrite_messages
+
+STAGES = ['extract', 'rewrite']
+_DONE = object()  # end-of-input marker passed down the queues
+
+
+class TwoStageScheduler:
+    """
+    Runs fact extraction and rewriting as two concurrent asyncio workers. A worker takes up to
+    `batch_size` items from its queue, waiting at most `max_wait` seconds for a batch to fill
+    once the first item is there, and runs the batch on its backend in the stage's own thread.
+    Queues hold at most `queue_size` items. Per-stage queue depth (sampled whenever a batch is
+    taken), queue wait and service latency are kept in `metrics`.
+    """
+
+    def __init__(self, extractor, rewriter, batch_size=16, rewrite_batch_size=None, queue_size=64, max_wait=0.02,
+                 extract_sampling=None, rewrite_sampling=None):
+        self.backends = {'extract': extractor, 'rewrite': rewriter}
+        self.batch_sizes = {'extract': batch_size, 'rewrite': rewrite_batch_size or batch_size}
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        greedy = {'max_new_tokens': DEFAULT_MAX_NEW_TOKENS, 'temperature': 0.0, 'top_p': 1.0}
+        self.sampling = {'extract': {**greedy, **(extract_sampling or {})}, 'rewrite': {**greedy, **(rewrite_sampling or {})}}
+        self.metrics = None
+
+    def _prompt(self, stage, text):
+        messages = fact_extraction_messages(text) if stage == 'extract' else rewrite_messages(text)
+        return self.backends[stage].apply_chat_template(messages)
+
+    async def _next_batch(self, stage, queue):
+        """Up to batch_size items, or None once the input is exhausted."""
+        loop = asyncio.get_running_loop()
+        item = await queue.get()
+        if item is _DONE:
+            return None
+        self.metrics[stage]['queue_depth'].append(queue.qsize() + 1)
+        batch = [item]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.batch_sizes[stage]:
+            try:
+                item = queue.get_nowait() if queue.qsize() else await asyncio.wait_for(queue.get(), deadline - loop.time())
+            except (asyncio.TimeoutError, ValueError):
+                break
+            if item is _DONE:
+                queue.put_nowait(_DONE)  # seen again on the next call, after this batch
+                break
+            batch.append(item)
+        return batch
+
+    async def _worker(self, stage, inbox, outbox, executor, results):
+        loop = asyncio.get_running_loop()
+        metrics = self.metrics[stage]
+        while True:
+            batch = await self._next_batch(stage, inbox)
+            if batch is None:
+                if outbox is not None:
+                    await outbox.put(_DONE)
+                return
+            started = time.perf_counter()
+            prompts = [self._prompt(stage, item['text']) for item in batch]
+            outputs = await loop.run_in_executor(executor, lambda: self.backends[stage].generate(prompts, **self.sampling[stage]))
+            finished = time.perf_counter()
+            metrics['batches'] += 1
+            metrics['busy'] += finished - started
+            for item, (text, n_tokens) in zip(batch, outputs):
+                metrics['wait'].append(started - item['queued'])
+                metrics['service'].append(finished - started)
+                results[item['index']][stage] = text
+                results[item['index']][f'{stage}_tokens'] = n_tokens
+                if outbox is not None:
+                    await outbox.put({'index': item['index'], 'text': text, 'queued': time.perf_counter()})
+
+    async def _feed(self, requests, queue):
+        for index, request in enumerate(requests):
+            await queue.put({'index': index, 'text': request['customer_info'], 'queued': time.perf_counter()})
+        await queue.put(_DONE)
+
+    async def run(self, requests):
+        """
+        One result per request, in input order: customer_no, the extracted facts ('extract'),
+        the rewritten narrative ('rewrite') and both stages' generated token counts.
+        """
+        requests = read_requests(requests)
+        self.metrics = {stage: {'batches': 0, 'busy': 0.0, 'queue_depth': [], 'wait': [], 'service': []} for stage in STAGES}
+        results = [{'customer_no': request.get('customer_no', index)} for index, request in enumerate(requests)]
+        queues = {stage: asyncio.Queue(maxsize=self.queue_size) for stage in STAGES}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(1) as extract_thread, ThreadPoolExecutor(1) as rewrite_thread:
+            tasks = [asyncio.ensure_future(coroutine) for coroutine in [
+                self._feed(requests, queues['extract']),
+                self._worker('extract', queues['extract'], queues['rewrite'], extract_thread, results),
+                self._worker('rewrite', queues['rewrite'], None, rewrite_thread, results)]]
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in pending:  # only left when a stage failed
+                task.cancel()
+            for task in done:
+                task.result()
+        self.metrics['seconds'] = time.perf_counter() - start
+        return results
+
+    def run_sync(self, requests):
+        """run() from synchronous code (outside a running event loop)."""
+        return asyncio.run(self.run(requests))
+
+    def summary(self):
+        """Per-stage table: batches, queue depth, queue wait and service latency, busy share of the run."""
+        if self.metrics is None:
+            return 'not run yet'
+        seconds = self.metrics['seconds']
+        lines = [f"{len(self.metrics['extract']['service'])} customers in {seconds:.2f}s",
+                 f"{'stage':>8} {'batches':>8} {'depth mean':>11} {'depth max':>10} {'wait p50':>9} {'wait p95':>9} "
+                 f"{'svc p50':>8} {'svc p95':>8} {'busy':>6}"]
+        for stage in STAGES:
+            m = self.metrics[stage]
+            if not m['service']:
+                continue
+            wait, service = np.array(m['wait']), np.array(m['service'])
+            lines.append(f"{stage:>8} {m['batches']:>8} {np.mean(m['queue_depth']):>11.1f} {max(m['queue_depth']):>10} "
+                         f"{np.percentile(wait, 50):>9.3f} {np.percentile(wait, 95):>9.3f} "
+                         f"{np.percentile(service, 50):>8.3f} {np.percentile(service, 95):>8.3f} {m['busy'] / seconds:>6.0%}")
+        return '\n'.join(lines)
+
+
+def run_sequential(extractor, rewriter, requests, batch_size=16, extract_sampling=None, rewrite_sampling=None):
+    """
+    The notebook order, batched: stage 1 for every request, then stage 2 for every request.
+    Same results as TwoStageScheduler.run; kept for comparison.
+    """
+    requests = read_requests(requests)
+    greedy = {'max_new_tokens': DEFAULT_MAX_NEW_TOKENS, 'temperature': 0.0, 'top_p': 1.0}
+    results = [{'customer_no': request.get('customer_no', index)} for index, request in enumerate(requests)]
+    texts = [request['customer_info'] for request in requests]
+    for stage, backend, messages, sampling in [('extract', extractor, fact_extraction_messages, extract_sampling),
+                                               ('rewrite', rewriter, rewrite_messages, rewrite_sampling)]:
+        prompts = [backend.apply_chat_template(messages(text)) for text in texts]
+        for offset in range(0, len(prompts), batch_size):
+            outputs = backend.generate(prompts[offset:offset + batch_size], **{**greedy, **(sampling or {})})
+            for index, (text, n_tokens) in enumerate(outputs, start=offset):
+                results[index][stage] = text
+                results[index][f'{stage}_tokens'] = n_tokens
+        texts = [result[stage] for result in results]
+    return results